@@ -0,0 +1,66 @@
+"""
+appInit
+==============
+
+Author: Stanley Parmar
+
+Description: Explicit start-up of the backend. Importing the backend modules has no side effects; the config,
+             the log files, the response codes and the pools are set up on first use, or here at start-up.
+
+See the examples directory to learn about the usage.
+
+"""
+import re
+
+from backend.common.commonUtility import set_config_name, init_logging, logger
+from backend.common.logHandlers import set_request_id, get_request_id
+from backend.jsonResponse import ResponseCode
+
+# Header carrying the correlation ID in and out; an incoming ID is only reused when it looks like one
+REQUEST_ID_HEADER = "X-Request-ID"
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,128}$")
+
+
+def init_app(config_name=None, connect=False, ensure_mongo_indexes=False, flask_app=None):
+    """
+    Set the backend up for the given config name (used instead of sys.argv when given).
+    With connect=True the Postgres connection pool is opened now instead of on the first query.
+    With ensure_mongo_indexes=True the missing indexes of the _mongodb config "indexes" are created.
+    With flask_app every request of that Flask app gets a request ID for the logs (see register_request_id).
+    """
+    if config_name is not None:
+        set_config_name(config_name)
+
+    init_logging()
+    ResponseCode._load_codes()
+
+    if connect:
+        from backend.dbConnectionPool import get_pool
+        get_pool()
+
+    if ensure_mongo_indexes:
+        from backend.common.mongoTableEntityOperation import ensure_indexes
+        ensure_indexes()
+
+    if flask_app is not None:
+        register_request_id(flask_app)
+
+    logger.info("app initialized")
+
+
+def register_request_id(flask_app):
+    """
+    Give every request of the Flask app a request ID: the X-Request-ID header when the client sent a valid one,
+    a new one otherwise. The ID is in every log line of the request and is sent back in the same header.
+    """
+    from flask import request
+
+    @flask_app.before_request
+    def assign_request_id():
+        request_id = request.headers.get(REQUEST_ID_HEADER)
+        set_request_id(request_id if request_id and REQUEST_ID_PATTERN.match(request_id) else None)
+
+    @flask_app.after_request
+    def return_request_id(response):
+        response.headers[REQUEST_ID_HEADER] = get_request_id()
+        return response
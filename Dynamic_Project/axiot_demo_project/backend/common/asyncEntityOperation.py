@@ -0,0 +1,484 @@
+"""
+asyncEntityOperation.py
+==============
+Author: Stanley Parmar
+Description: Asyncio version of the entityOperation data access functions on the asyncpg pool of
+dbAsyncConnectionPool. The functions keep the names, arguments and responses of entityOperation but are
+coroutines, so one process can wait on many slow queries at once.
+
+asyncpg sends parameters with the column types, so payload values must already have the right Python type
+(e.g. int for integer columns) instead of relying on the string casts psycopg2 does.
+"""
+
+
+import json
+import traceback
+
+import asyncpg
+from backend.dbAsyncConnectionPool import get_connection, release_connection
+from backend.common.commonUtility import open_read_file, logger, debug_print, hash_password
+from backend.common.countCache import invalidate_count_cache
+from backend.common.schemaCache import get_cached_schema_columns, set_cached_schema_columns
+from backend.jsonResponse import ResponseCode
+
+AND = " AND "
+
+
+def quote_ident(name):
+    """Quote an identifier, the asyncpg counterpart of sql.Identifier."""
+    return '"{}"'.format(str(name).replace('"', '""'))
+
+
+def add_parameter(parameters, value):
+    """Append the value and return its $n placeholder."""
+    parameters.append(value)
+    return "${}".format(len(parameters))
+
+
+def to_parameter_value(value):
+    """asyncpg expects json/jsonb values as text."""
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    return value
+
+
+def records_without_passwords(records):
+    """Convert asyncpg records to dicts excluding password columns."""
+    return [{col: value for col, value in record.items() if not col.endswith("password")} for record in records]
+
+
+def handle_database_exception(e):
+    if isinstance(e, asyncpg.PostgresError):
+        # Log the error details
+        logger.error("PostgreSQL Error: pgcode=%s, pgerror=%s, details=%s"
+                     % (e.sqlstate, str(e), getattr(e, 'detail', None)))
+
+        # Handle specific pgcodes
+        if e.sqlstate == '23505':  # UniqueViolation
+            return ResponseCode.create_response("DUPLICATE_KEY")
+        elif e.sqlstate == '23503':  # ForeignKeyViolation
+            return ResponseCode.create_response("FOREIGN_KEY_VIOLATION")
+        elif e.sqlstate == '23502':  # NotNullViolation
+            return ResponseCode.create_response("NOT_NULL_VIOLATION")
+
+    # Log unhandled exceptions
+    logger.warning("Unhandled exception: %s", str(e))
+    return ResponseCode.create_response("DATABASE_ERROR")
+
+
+"""
+Function Name: get_schema_columns
+Inputs: table_name (str), conn (optional), with_default (bool)
+Output: columns (list): Columns of the table, without the ones having default values unless with_default.
+
+Description:
+Shares the process-wide schema cache with entityOperation.get_schema_columns.
+"""
+
+
+async def get_schema_columns(table_name, conn=None, with_default=False):
+    schema_name = 'public'  # Adjust as necessary
+
+    # Serve from the cache before touching the pool
+    cached_columns = get_cached_schema_columns(schema_name, table_name, with_default)
+    if cached_columns is not None:
+        return cached_columns
+
+    is_new_conn = conn is None
+    try:
+        if is_new_conn:
+            conn = await get_connection()
+
+        columns = await conn.fetch("""
+            SELECT column_name, column_default
+            FROM information_schema.columns
+            WHERE table_schema = $1 AND table_name = $2;
+        """, schema_name, table_name)
+
+        # Filter out columns with default values
+        columns_without_defaults = [col['column_name'] for col in columns
+                                    if with_default or col['column_default'] is None]
+
+        # Only cache tables that exist, so a table created later is picked up straight away
+        if columns:
+            set_cached_schema_columns(schema_name, table_name, with_default, columns_without_defaults)
+
+        return columns_without_defaults
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+
+    finally:
+        if conn is not None and is_new_conn:
+            await release_connection(conn)
+
+
+"""
+Function Name: create_record
+Inputs:
+- data (str): JSON string containing the data for the record to be created.
+- table_name (str): The name of the table where the record will be inserted.
+
+Output: SAVE_SUCCESSFULLY with the inserted record, or the record itself when is_json.
+
+Description:
+Creates a new record in the specified table. Fields ending with 'password' are hashed before insertion.
+"""
+
+
+async def create_record(data, table_name, is_json=None):
+    record_data = json.loads(data)
+    conn = None
+
+    try:
+        conn = await get_connection()
+        columns = await get_schema_columns(table_name, conn)
+
+        # Ensure any field ending with 'password' is hashed
+        for key in record_data:
+            if key.endswith('password'):
+                if record_data[key] is not None:
+                    record_data[key] = hash_password(record_data[key])
+
+        parameters = []
+        placeholders = [add_parameter(parameters, to_parameter_value(record_data[column])) for column in columns]
+        insert_query = "INSERT INTO public.{} ({}) VALUES ({}) RETURNING *".format(
+            quote_ident(table_name), ", ".join(map(quote_ident, columns)), ", ".join(placeholders))
+
+        inserted_row = await conn.fetchrow(insert_query, *parameters)
+        # The statement ran outside a transaction block, so it is committed already
+        invalidate_count_cache(table_name)
+        filtered_row = {col: value for col, value in inserted_row.items() if 'password' not in col.lower()}
+
+        if is_json:
+            return filtered_row
+        else:
+            return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data={"result": filtered_row})
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to create record: {}".format(e))
+        raise e
+    finally:
+        if conn is not None:
+            await release_connection(conn)
+
+
+"""
+Function Name: update_record
+Inputs:
+- record_id (str): The ID of the record to be updated.
+- update_fields (str/tuple): The field(s) by which you want to update.
+- data (str): JSON string containing the updated data for the record.
+- table_name (str): The name of the table where the record exists.
+
+Output: UPDATE_SUCCESSFULLY, or the updated data when is_json.
+
+Description:
+Updates an existing record in the specified table. Fields ending with 'password' are hashed before updating.
+The existence check and the update run in one transaction.
+"""
+
+
+async def update_record(record_id, update_fields, data, table_name, is_json=None):
+    conn = None
+    record_data = json.loads(data)
+    try:
+        conn = await get_connection()
+
+        # Check if update_fields is a tuple, if not set it to record_id
+        if not isinstance(update_fields, tuple):
+            update_fields = (update_fields,)
+            key_value = (record_id,)
+        else:
+            key_value = record_id
+
+        async with conn.transaction():
+            where_parameters = []
+            where_clause = AND.join("{} = {}".format(quote_ident(field), add_parameter(where_parameters, value))
+                                    for field, value in zip(update_fields, key_value))
+
+            # Check if the record exists
+            record_exists = await conn.fetchval(
+                "SELECT 1 FROM public.{} WHERE {}".format(quote_ident(table_name), where_clause), *where_parameters)
+
+            if not record_exists:
+                debug_print("Record ID does not exist.")
+                raise ValueError("Record ID {} does not exist.".format(record_id))
+
+            columns = await get_schema_columns(table_name, conn)
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            parameters = []
+            set_clause = ", ".join("{} = {}".format(quote_ident(column),
+                                                    add_parameter(parameters, to_parameter_value(record_data[column])))
+                                   for column in columns if column in record_data)
+            where_clause = AND.join("{} = {}".format(quote_ident(field), add_parameter(parameters, value))
+                                    for field, value in zip(update_fields, key_value))
+
+            await conn.execute("UPDATE public.{} SET {} WHERE {}".format(quote_ident(table_name), set_clause,
+                                                                         where_clause), *parameters)
+
+        # Forget the cached search counts of the table once the update is committed
+        invalidate_count_cache(table_name)
+        debug_print("Record updated successfully.")
+        if is_json:
+            return record_data
+        else:
+            return ResponseCode.create_response("UPDATE_SUCCESSFULLY")
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to update record: {}".format(str(e)))
+        raise e
+
+    finally:
+        if conn is not None:
+            await release_connection(conn)
+
+
+"""
+Function Name: delete_record
+Inputs:
+- record_id (str): The ID of the record to be deleted.
+- delete_by (str/tuple): The field(s) you want to delete by.
+- table_name (str): The name of the table where the record exists.
+
+Output: DELETE_SUCCESSFULLY, or NO_DATA_FOUND when nothing matched.
+"""
+
+
+async def delete_record(record_id, delete_by, table_name):
+    conn = None
+    try:
+        conn = await get_connection()
+
+        # Check if delete_by is a tuple, if not set it to record_id
+        if not isinstance(delete_by, tuple):
+            delete_by = (delete_by,)
+            record_id = (record_id,)
+
+        parameters = []
+        where_clause = AND.join("{} = {}".format(quote_ident(field), add_parameter(parameters, value))
+                                for field, value in zip(delete_by, record_id))
+
+        # The status is "DELETE <count>"
+        status = await conn.execute("DELETE FROM public.{} WHERE {}".format(quote_ident(table_name), where_clause),
+                                    *parameters)
+
+        if status.split()[-1] == "0":
+            logger.info("No record found")
+            return ResponseCode.create_response("NO_DATA_FOUND")
+
+        # The statement ran outside a transaction block, so it is committed already
+        invalidate_count_cache(table_name)
+        debug_print("Record deleted successfully.")
+        return ResponseCode.create_response("DELETE_SUCCESSFULLY")
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to delete record: {}".format(str(e)))
+        raise e
+
+    finally:
+        if conn is not None:
+            await release_connection(conn)
+
+
+"""
+Function Name: fetch_record
+Inputs:
+- table_name (str): The name of the table where the records exist.
+- criteria (dict): A dictionary containing the column-value pairs for the criteria (optional).
+
+Output: list: The records fetched from the table, or NO_DATA_FOUND.
+"""
+
+
+async def fetch_record(table_name, criteria=None):
+    conn = None
+
+    try:
+        conn = await get_connection()
+
+        parameters = []
+        query = "SELECT * FROM public.{}".format(quote_ident(table_name))
+        if criteria:
+            query += " WHERE " + AND.join("{} = {}".format(quote_ident(key), add_parameter(parameters, value))
+                                          for key, value in criteria.items())
+
+        records = await conn.fetch(query, *parameters)
+        if not records:
+            logger.info("No record found")
+            return ResponseCode.create_response("NO_DATA_FOUND")
+
+        return records_without_passwords(records)
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to fetch records: {}".format(str(e)))
+        raise e
+    finally:
+        if conn is not None:
+            await release_connection(conn)
+
+
+"""
+    Fetches records from the specified table where any column matches the search value
+    or where specific column-value pairs match, with the offset pagination, ordering and counts of
+    entityOperation.fetch_record_search.
+
+    Args:
+        table_name (str): The name of the table to search.
+        search_value (str): The value to search for across all columns.
+        column_filters (dict): A dictionary of column-value pairs to filter by.
+        column_in_filters (dict): A dictionary of column-list pairs to filter by.
+
+    Returns:
+        The SUCCESSFUL response with the page of records, or NO_DATA_FOUND.
+"""
+
+
+async def fetch_record_search(table_name, search_value=None, column_filters=None, column_in_filters=None,
+                              operand=None, parent_call=None, range_filter=None, order_filter=None, result_card=None,
+                              payload_data=None, module_id=None):
+    conn = None
+    limit = None
+    start = None
+    order_by = None
+    order_direction = None
+    range_start = None
+    range_end = None
+    total_length = None
+    resource_list = open_read_file('resources', '', 'general')
+    row_id_column = quote_ident(resource_list['row_id_column'])
+    operand_value = operand if operand else AND
+    try:
+        conn = await get_connection()
+        if not search_value and not column_filters and not column_in_filters:
+            records_list = records_without_passwords(
+                await conn.fetch("SELECT * FROM {}".format(quote_ident(table_name))))
+
+            if records_list:
+                return ResponseCode.create_response("SUCCESSFUL",
+                                                    {"result": records_list, "record_length": len(records_list)})
+            else:
+                return ResponseCode.create_response("NO_DATA_FOUND")
+
+        if range_filter and order_filter:
+            # Unpack range_filter for start and end
+            start = range_filter.get(resource_list['start_param'])
+            limit = range_filter.get(resource_list['record_size_param'])
+            # Unpack order_filter for ordering
+            range_start = range_filter.get(resource_list['range_start_param'])
+            range_end = range_filter.get(resource_list['range_end_param'])
+            total_length = range_filter.get(resource_list['total_length_param'])
+            order_by = order_filter.get(resource_list['order_by_param'], None)
+            order_direction = order_filter.get(resource_list['order_direction_param'], "ASC").upper()
+
+        # Get the columns of the table
+        columns = await get_schema_columns(table_name, conn)
+
+        # Prepare the query to search across all columns or specific column-value pairs
+        combined_conditions = []
+        parameters = []
+
+        if search_value:
+            search_parameter = add_parameter(parameters, "%" + search_value + "%")
+            combined_conditions.append("({})".format(operand_value.join(
+                "{}::text ILIKE {}".format(quote_ident(col), search_parameter) for col in columns)))
+
+        if column_filters:
+            combined_conditions.extend("{} = {}".format(quote_ident(col), add_parameter(parameters, value))
+                                       for col, value in column_filters.items())
+
+        if column_in_filters:
+            # 13/01/25 Modified to get the names instead of query id when returning the result
+            use_select_query = payload_data and not payload_data.get('create_search_cards')
+            combined_conditions.extend(
+                "{} = ANY({})".format('d."product_id"' if use_select_query and col == 'product_id' else quote_ident(col),
+                                      add_parameter(parameters, list(value)))
+                for col, value in column_in_filters.items())
+
+        where_clause = operand_value.join(combined_conditions)
+        count_query = "SELECT count(*) FROM {} d WHERE ({})".format(quote_ident(table_name), where_clause)
+        rowid_range_query = "SELECT MIN({0}), MAX({0}) FROM {1} d WHERE ({2})".format(
+            row_id_column, quote_ident(table_name), where_clause)
+
+        # Prepare the final query
+        search_device_query = resource_list['search_device_query']
+        if payload_data and not payload_data.get('create_search_cards'):
+            query = search_device_query.get(module_id + "_select") + " AND ({})".format(where_clause)
+        else:
+            query = "SELECT * FROM {} WHERE ({})".format(quote_ident(table_name), where_clause)
+
+        if parent_call:
+            query += " AND {} != False".format(quote_ident(parent_call))
+            count_query += " AND {} != False".format(quote_ident(parent_call))
+
+        rowid_range = await conn.fetchrow(rowid_range_query, *parameters)
+        min_rowid, max_rowid = rowid_range[0], rowid_range[1]
+
+        # The count query only takes the filter parameters, not the range ones added below
+        count_parameters = list(parameters)
+
+        if range_start is not None and range_end is not None:
+            query += " AND {} <= {}".format(row_id_column, add_parameter(
+                parameters, range_end if order_direction == "ASC" else range_start))
+
+        if payload_data and not payload_data.get('create_search_cards'):
+            query += search_device_query.get(module_id + "_group_by")
+
+        # Apply ordering if provided
+        if order_by:
+            query += " ORDER BY {} {}".format(quote_ident(order_by), "DESC" if order_direction == "DESC" else "ASC")
+
+        # Execute count query
+        if total_length is not None:
+            record_count = total_length
+        else:
+            record_count = await conn.fetchval(count_query, *count_parameters)
+
+        # Apply limit and offset if provided
+        if limit is not None:
+            query += " LIMIT {} OFFSET {}".format(add_parameter(parameters, limit), add_parameter(parameters, start))
+
+        records_list = records_without_passwords(await conn.fetch(query, *parameters))
+
+        if order_direction == 'DESC':
+            start_range, end_range = max_rowid, min_rowid
+        else:
+            start_range, end_range = min_rowid, max_rowid
+
+        if records_list:
+            return ResponseCode.create_response("SUCCESSFUL", {
+                "record_length": len(records_list), "total_length": record_count,
+                "range_start": start_range,
+                "range_end": end_range, "result": records_list, "result_card": result_card
+            })
+        else:
+            return ResponseCode.create_response("NO_DATA_FOUND")
+    except asyncpg.PostgresError as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("An error occurred: {}".format(str(e)))
+        raise e
+
+    finally:
+        if conn is not None:
+            await release_connection(conn)
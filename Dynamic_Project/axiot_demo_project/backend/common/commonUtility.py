@@ -10,15 +10,23 @@ See the examples directory to learn about the usage.
 # commonUtility.py
 
 # Import the default Libraries
+import base64
+import hashlib
+import hmac
 import logging
 import os
 import json
+import secrets
 import sys
+import threading
+import time
 import multiprocessing
 # Import the custom Libraries
 from datetime import datetime, timedelta
-import traceback
 import pytz
+from backend.common.logHandlers import (LevelRouterHandler, DatedRotatingFileHandler, DeferredHandler,
+                                        JsonFormatter, RequestIdFilter, start_queue_logging)
+from backend.common.lazyInit import LazyInitializer
 
 
 """
@@ -44,7 +52,117 @@ def extract_content_from_json(json_content, module_id):
 
     except Exception as e:
         debug_print('Error getting extract_content_from_json: \n {}'.format(str(e)))
-        # traceback.print_exc()  # This will print the full traceback, including the line number
+
+
+"""
+Config registry
+Every *_config.json file is parsed once and kept as a snapshot; each read gets its own copy of it (plain
+dicts and lists), so a caller changing its config cannot change what the others read. A file is re-read
+when its mtime changes, checked at most every CONFIG_MTIME_CHECK_INTERVAL seconds, or when reload_config
+is called.
+"""
+
+# Seconds between two mtime checks of the same config file
+CONFIG_MTIME_CHECK_INTERVAL = 2.0
+
+# config_path -> {"snapshot", "mtime", "checked_at", "loads", "hits", "last_load_ms", "total_load_ms"}
+_config_registry = {}
+_config_registry_lock = threading.Lock()
+
+
+"""
+Function Name: copy_config
+Inputs: value: Parsed JSON value.
+Output: A deep copy of the value (dicts and lists copied, the other JSON values are immutable).
+"""
+
+
+def copy_config(value):
+    if isinstance(value, dict):
+        return {key: copy_config(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [copy_config(item) for item in value]
+    return value
+
+
+"""
+Function Name: load_config_file
+Inputs: config_path (str): Full path of the JSON config file.
+Output: A copy of the snapshot of the file, see get_config_snapshot.
+"""
+
+
+def load_config_file(config_path):
+    # The copy is made outside the lock, the snapshot itself is never changed
+    return copy_config(get_config_snapshot(config_path))
+
+
+"""
+Function Name: get_config_snapshot
+Inputs: config_path (str): Full path of the JSON config file.
+Output: The snapshot of the file, shared with every caller, never change it.
+
+Description:
+Serves the file from the registry, parsing it only on first use, after its mtime changed or after reload_config.
+"""
+
+
+def get_config_snapshot(config_path):
+    now = time.monotonic()
+    with _config_registry_lock:
+        entry = _config_registry.get(config_path)
+        if entry is not None and entry["snapshot"] is not None:
+            if now - entry["checked_at"] < CONFIG_MTIME_CHECK_INTERVAL:
+                entry["hits"] += 1
+                return entry["snapshot"]
+
+            entry["checked_at"] = now
+            if os.path.getmtime(config_path) == entry["mtime"]:
+                entry["hits"] += 1
+                return entry["snapshot"]
+
+        load_start = time.perf_counter()
+        mtime = os.path.getmtime(config_path)
+        with open(config_path, 'r') as config_file:
+            snapshot = json.load(config_file)
+        load_ms = (time.perf_counter() - load_start) * 1000
+
+        if entry is None:
+            entry = _config_registry[config_path] = {"loads": 0, "hits": 0, "total_load_ms": 0.0}
+        entry.update(snapshot=snapshot, mtime=mtime, checked_at=now, last_load_ms=round(load_ms, 3))
+        entry["loads"] += 1
+        entry["total_load_ms"] = round(entry["total_load_ms"] + load_ms, 3)
+        return snapshot
+
+
+"""
+Function Name: reload_config
+Inputs: config_path (str, optional): Full path of one config file, every file when not given.
+Output: None
+
+Description:
+Drops the snapshot(s) so the next read parses the file again.
+"""
+
+
+def reload_config(config_path=None):
+    with _config_registry_lock:
+        for path, entry in _config_registry.items():
+            if config_path is None or path == config_path:
+                entry["snapshot"] = None
+
+
+"""
+Function Name: get_config_registry_stats
+Inputs: None
+Output: stats (dict): Per config file, the number of loads and cache hits and the load timings in ms.
+"""
+
+
+def get_config_registry_stats():
+    with _config_registry_lock:
+        return {path: {key: value for key, value in entry.items() if key != "snapshot"}
+                for path, entry in _config_registry.items()}
 
 
 """
@@ -66,11 +184,8 @@ def open_read_file(file_location, local_env, filename):
         # Construct the full path to the config file
         config_path = os.path.join(backend_dir, file_location, filename + '_config.json')
 
-        # print("config_path: {} : {} : {} ".format(backend_dir, file_location, filename + '_config.json'))
-
-        # Load configuration from the file_location and file
-        with open(config_path) as config_file:
-            config = json.load(config_file)
+        # Load configuration from the file_location and file (parsed once, see load_config_file)
+        config = load_config_file(config_path)
 
         # Get the configuration for the current environment
         if local_env:
@@ -82,12 +197,10 @@ def open_read_file(file_location, local_env, filename):
         if not config_list_json:
             raise ValueError("No configuration found for environment:%s", local_env)
 
-        # print(config_list_json)
         return config_list_json
 
     except Exception as e:
-        traceback.print_exc()  # This will print the full traceback, including the line number
-        logger.error("Error readfile function in commonUtility  : {}".format(str(e)))
+        logger.error("Error readfile function in commonUtility  : {}".format(str(e)), exc_info=True)
 
 
 """
@@ -113,23 +226,17 @@ def open_read_file_box(filename):
 
         filename = file_path + filename + '_config.json'
 
-        # Open the file in read mode and parse the JSON content
-        with open(filename, 'r') as file:
-            config_list_json = json.load(file)
-
-        # Print the parsed JSON data
-        # debug_print(config_list_json)
+        # Parse the JSON content (once, see load_config_file)
+        config_list_json = load_config_file(filename)
 
         # Failing if the file is having any issues
         if not config_list_json:
             raise ValueError("No configuration found for environment")
 
-        # print(config_list_json)
         return config_list_json
 
     except Exception as e:
-        traceback.print_exc()  # This will print the full traceback, including the line number
-        logger.error("Error readfile function in commonUtility  : {}".format(str(e)))
+        logger.error("Error readfile function in commonUtility  : {}".format(str(e)), exc_info=True)
         debug_print("Error readfile function in commonUtility  : {}".format(str(e)))
 
 
@@ -158,9 +265,8 @@ def get_topic(filename):
 
         topic_path = file_path + filename + '_topic_config.json'
 
-        # Load topic from the file
-        with open(topic_path) as topic_file:
-            topic_data = json.load(topic_file)
+        # Load topic from the file (parsed once, see load_config_file)
+        topic_data = load_config_file(topic_path)
 
         # Get the topic
         topic = topic_data.get('topic')
@@ -171,7 +277,7 @@ def get_topic(filename):
         return topic
 
     except Exception as e:
-        traceback.print_exc()  # This will print the full traceback, including the line number
+        logger.error("Error in get_topic function in commonUtility: {}".format(str(e)), exc_info=True)
         debug_print("Error in get_topic function in commonUtility: {}".format(str(e)))
 
 
@@ -186,13 +292,50 @@ def get_topic(filename):
 def debug_print(message):
     config = open_read_file('resources', '', 'general')
     if config.get("debug", False):
-        # print(message)
         try:
             print(message)
         except UnicodeEncodeError:
             print(message.encode(sys.stdout.encoding, errors='replace').decode(sys.stdout.encoding))
 
 
+# PBKDF2-SHA256 rounds of hash_password, stored in the hash so it can be raised without breaking old hashes
+PASSWORD_HASH_ITERATIONS = 390000
+PASSWORD_HASH_ALGORITHM = "pbkdf2_sha256"
+
+
+"""
+    Function Name: hash_password
+    Inputs: password (str)
+    Output: hashed password (str) as pbkdf2_sha256$<iterations>$<salt>$<hash>
+    Description: Hashes the value of the *password fields before they are written to the database
+"""
+
+
+def hash_password(password, iterations=PASSWORD_HASH_ITERATIONS):
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', str(password).encode('utf-8'), salt.encode('utf-8'), iterations)
+    return "{}${}${}${}".format(PASSWORD_HASH_ALGORITHM, iterations, salt,
+                                base64.b64encode(digest).decode('ascii'))
+
+
+"""
+    Function Name: verify_password
+    Inputs: password (str), hashed_password (str): Value stored by hash_password
+    Output: True when the password matches
+"""
+
+
+def verify_password(password, hashed_password):
+    try:
+        algorithm, iterations, salt, expected = hashed_password.split('$', 3)
+    except (AttributeError, ValueError):
+        return False
+    if algorithm != PASSWORD_HASH_ALGORITHM:
+        return False
+    digest = hashlib.pbkdf2_hmac('sha256', str(password).encode('utf-8'), salt.encode('utf-8'), int(iterations))
+    return hmac.compare_digest(base64.b64encode(digest).decode('ascii'), expected)
+
+
 """
     Function Name: find_first_matching_key
     Inputs: none
@@ -286,6 +429,8 @@ Description: Get and validate the command-line arguments.
 
 
 def get_sys_args():
+    if _app_config_name is not None:
+        return _app_config_name
     if len(sys.argv) != 2:
         debug_print("Usage: python your_script.py <env> <config_name>")
         sys.exit(1)
@@ -293,28 +438,30 @@ def get_sys_args():
     return config_name
 
 
-# Retrieve system arguments and configuration
-config_list = open_read_file('resources', '', 'general')
-path = config_list['log_path']
+# Config name given to init_app, used instead of sys.argv when set
+_app_config_name = None
 
-# Get the current date in yyyy-mm-dd format
-current_date = datetime.now().strftime('%Y-%m-%d')
 
-# Define the log file paths for each level, including the date in the file names
-log_file_paths = {
-    'debug': os.path.join(path, 'debug_%s.log' % current_date),
-    'info': os.path.join(path, 'info_%s.log' % current_date),
-    'warning': os.path.join(path, 'warning_%s.log' % current_date),
-    'error': os.path.join(path, 'error_%s.log' % current_date),
-    'critical': os.path.join(path, 'critical_%s.log' % current_date),
-}
+"""
+Function Name: set_config_name
+Inputs: config_name (str): Name of the box config (the <config_name>_postgres / _response files).
+Output: None
+"""
+
+
+def set_config_name(config_name):
+    global _app_config_name
+    _app_config_name = config_name
 
-# Create the logs directory if it doesn't exist
-os.makedirs(os.path.dirname(list(log_file_paths.values())[0]), exist_ok=True)
 
-# Configure logging
+# Configure logging; the files are opened (and the log directory created) by the first record, see init_logging
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)  # Set the lowest threshold
+logger.addFilter(RequestIdFilter())  # Stamp every record with the request ID of the calling context
+
+config_list = None
+log_mode = None
+log_queue_handler = None
 
 """
 Function Name: create_handler
@@ -332,19 +479,97 @@ and formats the log messages.
 
 
 def create_handler(level_name, local_path):
-    local_handler = logging.FileHandler(local_path)
+    # Rolls over to level_YYYY-MM-DD.log at midnight and, when configured, on size (see logHandlers.py)
+    local_handler = DatedRotatingFileHandler(
+        os.path.dirname(local_path), level_name,
+        max_bytes=int(config_list.get('log_rotate_max_bytes', 0)),
+        compress=bool(config_list.get('log_compress', False)),
+        max_retained_bytes=int(config_list.get('log_max_retained_bytes', 0))
+    )
     local_level = getattr(logging, level_name.upper())
+    # Only the records of this level reach it, LevelRouterHandler routes each record by its levelno
     local_handler.setLevel(local_level)
-    local_handler.addFilter(lambda record: record.levelno == local_level)
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # 'log_format' "json" writes one JSON object per line (see logHandlers.JsonFormatter)
+    if config_list.get('log_format', 'text') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     local_handler.setFormatter(formatter)
     return local_handler
 
 
-# Create and add handlers for each log level
-for level, path in log_file_paths.items():
-    handler = create_handler(level, path)
-    logger.addHandler(handler)
+"""
+Function Name: setup_logging
+Inputs: None
+Output: handler: The handler the logger's records go to.
+
+Description:
+Reads the general config, creates the log directory and the handler of each log level. In "queue" mode request
+threads only enqueue and a single thread writes the files (see logHandlers.py). Runs once, through init_logging.
+"""
+
+
+def setup_logging():
+    global config_list, log_mode, log_queue_handler
+    # Retrieve system arguments and configuration
+    config_list = open_read_file('resources', '', 'general')
+    path = config_list['log_path']
+
+    # Get the current date in yyyy-mm-dd format
+    current_date = datetime.now().strftime('%Y-%m-%d')
+
+    # Define the log file paths for each level, including the date in the file names
+    log_file_paths = {
+        'debug': os.path.join(path, 'debug_%s.log' % current_date),
+        'info': os.path.join(path, 'info_%s.log' % current_date),
+        'warning': os.path.join(path, 'warning_%s.log' % current_date),
+        'error': os.path.join(path, 'error_%s.log' % current_date),
+        'critical': os.path.join(path, 'critical_%s.log' % current_date),
+    }
+
+    # Create the logs directory if it doesn't exist
+    os.makedirs(os.path.dirname(list(log_file_paths.values())[0]), exist_ok=True)
+
+    # Create the handler of each log level, one router hands every record to the handler of its level
+    level_handlers = {}
+    for level, level_path in log_file_paths.items():
+        level_handlers[getattr(logging, level.upper())] = create_handler(level, level_path)
+    log_writer = LevelRouterHandler(level_handlers)
+
+    log_mode = config_list.get('log_mode', 'sync')
+    if log_mode == 'queue':
+        log_queue_handler, _ = start_queue_logging(
+            None, log_writer,
+            queue_size=int(config_list.get('log_queue_size', 10000)),
+            block_timeout=float(config_list.get('log_queue_block_ms', 0)) / 1000
+        )
+        return log_queue_handler
+    return log_writer
+
+
+_log_setup = LazyInitializer(setup_logging)
+logger.addHandler(DeferredHandler(_log_setup.get))
+
+
+def init_logging():
+    """Set the log files up now instead of on the first record."""
+    return _log_setup.get()
+
+
+"""
+Function Name: get_log_queue_stats
+Inputs: None
+Output: stats (dict): Logging mode, and for "queue" mode the records enqueued, dropped and waiting.
+"""
+
+
+def get_log_queue_stats():
+    init_logging()
+    stats = {"mode": log_mode}
+    if log_queue_handler is not None:
+        stats.update(enqueued=log_queue_handler.enqueued, dropped=log_queue_handler.dropped,
+                     waiting=log_queue_handler.queue.qsize(), max_size=log_queue_handler.queue.maxsize)
+    return stats
 
 
 """
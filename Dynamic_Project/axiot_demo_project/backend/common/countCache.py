@@ -0,0 +1,172 @@
+"""
+countCache.py
+==============
+Author: Stanley Parmar
+Description: Process-wide TTL cache for the total counts of the paginated search, keyed by table and filter set.
+             The cache is an LRU bounded by 'count_cache_size' of the general config.
+"""
+
+# countCache.py
+
+# Import the default Libraries
+import json
+import threading
+import time
+from collections import OrderedDict
+
+# Import the custom Libraries
+from backend.common.commonUtility import open_read_file
+
+# Defaults when the general config does not define 'count_cache_ttl' (seconds) / 'count_cache_size' (entries)
+DEFAULT_COUNT_CACHE_TTL = 60
+DEFAULT_COUNT_CACHE_SIZE = 1024
+
+# (table_name, normalized filters) -> (expires_at, count), least recently used first
+_count_cache = OrderedDict()
+_count_cache_lock = threading.Lock()
+_count_cache_config = None
+_count_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "invalidations": 0,
+    "evictions": 0,
+    "expirations": 0,
+}
+
+
+"""
+Function Name: get_count_cache_config
+Inputs: None
+Output: config (dict): ttl and maximum size of the cache, read once from the general config.
+"""
+
+
+def get_count_cache_config():
+    global _count_cache_config
+    if _count_cache_config is None:
+        config = open_read_file('resources', '', 'general') or {}
+        _count_cache_config = {
+            "ttl": float(config.get('count_cache_ttl', DEFAULT_COUNT_CACHE_TTL)),
+            "size": int(config.get('count_cache_size', DEFAULT_COUNT_CACHE_SIZE)),
+        }
+    return _count_cache_config
+
+
+"""
+Function Name: get_count_cache_ttl
+Inputs: None
+Output: ttl (float): Number of seconds a cached count stays valid.
+"""
+
+
+def get_count_cache_ttl():
+    return get_count_cache_config()["ttl"]
+
+
+"""
+Function Name: normalize_count_filters
+Inputs: Any keyword filters of the search (search value, column filters, operand, ...).
+Output: str: Stable representation of the filter set.
+
+Description:
+Sorts dict keys and list values so the same filters given in a different order share one cache entry.
+"""
+
+
+def normalize_count_filters(**filters):
+    normalized = {}
+    for name, value in filters.items():
+        if isinstance(value, dict):
+            value = {key: sorted(map(str, item)) if isinstance(item, (list, tuple)) else item
+                     for key, item in value.items()}
+        normalized[name] = value
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+"""
+Function Name: get_cached_count
+Inputs: table_name, filter_key (from normalize_count_filters)
+Output: count (int) or None when the entry is missing or expired.
+"""
+
+
+def get_cached_count(table_name, filter_key):
+    key = (table_name, filter_key)
+    now = time.monotonic()
+    with _count_cache_lock:
+        entry = _count_cache.get(key)
+        if entry is None or entry[0] <= now:
+            _count_cache.pop(key, None)
+            _count_cache_stats["misses"] += 1
+            return None
+
+        _count_cache.move_to_end(key)
+        _count_cache_stats["hits"] += 1
+        return entry[1]
+
+
+"""
+Function Name: set_cached_count
+Inputs: table_name, filter_key, count
+Output: None
+
+Description:
+Drops the expired entries, then the least recently used ones while the cache is over its size.
+"""
+
+
+def set_cached_count(table_name, filter_key, count):
+    config = get_count_cache_config()
+    if config["ttl"] <= 0 or config["size"] <= 0:
+        return
+
+    now = time.monotonic()
+    with _count_cache_lock:
+        expired = [key for key, (expires_at, _) in _count_cache.items() if expires_at <= now]
+        for key in expired:
+            del _count_cache[key]
+        _count_cache_stats["expirations"] += len(expired)
+
+        key = (table_name, filter_key)
+        _count_cache[key] = (now + config["ttl"], count)
+        _count_cache.move_to_end(key)
+        while len(_count_cache) > config["size"]:
+            _count_cache.popitem(last=False)
+            _count_cache_stats["evictions"] += 1
+
+
+"""
+Function Name: invalidate_count_cache
+Inputs: table_name (optional)
+Output: removed (int): Number of entries dropped.
+
+Description:
+Drops the cached counts of one table, or every count when no table is given.
+"""
+
+
+def invalidate_count_cache(table_name=None):
+    with _count_cache_lock:
+        keys = [key for key in _count_cache if table_name is None or key[0] == table_name]
+        for key in keys:
+            del _count_cache[key]
+
+        _count_cache_stats["invalidations"] += 1
+    return len(keys)
+
+
+"""
+Function Name: get_count_cache_stats
+Inputs: None
+Output: stats (dict): hits, misses, invalidations, evictions, expirations, size, max_size and ttl of the cache.
+"""
+
+
+def get_count_cache_stats():
+    with _count_cache_lock:
+        stats = dict(_count_cache_stats)
+        stats["size"] = len(_count_cache)
+    config = get_count_cache_config()
+    stats["max_size"] = config["size"]
+    stats["ttl"] = config["ttl"]
+    return stats
@@ -0,0 +1,253 @@
+"""
+dbCallLog.py
+==============
+Author: Stanley Parmar
+Description: One structured log line per database call: table, operation, rows, elapsed ms and the time spent
+waiting for a pooled connection.
+
+Enabled with 'log_db_calls' in the general config, or by 'log_format' "json". The line goes through the
+common logger, so with the JSON format it carries the request ID and a "db_call" object.
+
+"rows" counts the primary statement of the call only: statements run under helper_statement (catalog lookups,
+counts, existence checks, the pool's ping) are timed with the call but add no rows. A streamed call is logged
+when its stream ends, is closed or is dropped unread, with the rows actually sent.
+"""
+
+# dbCallLog.py
+
+# Import the default Libraries
+import contextlib
+import contextvars
+import functools
+import inspect
+import time
+
+import psycopg2.extensions
+
+# Import the custom Libraries
+from backend.common.commonUtility import open_read_file, logger
+
+# The db call being timed in the current context, filled in by the pool and the cursor
+current_db_call = contextvars.ContextVar("current_db_call", default=None)
+# False while helper statements run, see helper_statement
+count_statement_rows = contextvars.ContextVar("count_statement_rows", default=True)
+_db_call_logging = None
+
+
+"""
+Function Name: is_db_call_logging_enabled
+Inputs: None
+Output: bool, read once from the general config.
+"""
+
+
+def is_db_call_logging_enabled():
+    global _db_call_logging
+    if _db_call_logging is None:
+        config = open_read_file('resources', '', 'general') or {}
+        _db_call_logging = bool(config.get('log_db_calls', config.get('log_format', 'text') == 'json'))
+    return _db_call_logging
+
+
+"""
+Function Name: record_pool_wait
+Inputs: wait_ms (float): Time the connection checkout took.
+Output: None
+
+Description:
+Called by the connection pool; adds the wait to the db call running in this context, if any.
+"""
+
+
+def record_pool_wait(wait_ms):
+    call = current_db_call.get()
+    if call is not None:
+        call["pool_wait_ms"] += wait_ms
+
+
+"""
+Function Name: record_rows
+Inputs: rowcount (int): Rows returned or affected by one statement.
+Output: None
+"""
+
+
+def record_rows(rowcount):
+    call = current_db_call.get()
+    if call is not None and rowcount is not None and rowcount > 0 and count_statement_rows.get():
+        call["rows"] += rowcount
+
+
+"""
+Function Name: helper_statement
+Inputs: None
+Output: Context manager; the statements run inside do not add to the rows of the current db call.
+"""
+
+
+@contextlib.contextmanager
+def helper_statement():
+    token = count_statement_rows.set(False)
+    try:
+        yield
+    finally:
+        count_statement_rows.reset(token)
+
+
+"""
+Function Name: stream_db_call
+Inputs: records (iterator): The records a decorated call streams to the client.
+Output: StreamedRecords over the same records; the current db call is logged once they are exhausted or closed.
+
+Description:
+Call it on the iterator handed to the streamed response. The rows are the records sent, the elapsed time runs
+until the stream ends, and the line is logged in the context of the request that started the stream.
+"""
+
+
+def stream_db_call(records):
+    call = current_db_call.get()
+    if call is None:
+        return records
+    call["streamed"] = True
+    return StreamedRecords(call, records, contextvars.copy_context())
+
+
+"""
+    Class Name: StreamedRecords
+    Functions: __next__
+        Inputs: None
+        Output: The next record-- Counts it in the rows of the db call, logs the call when the records end or fail
+    Functions: close
+        Inputs: None
+        Output: None-- Closes the records and logs the call, once
+    Functions: __del__
+        Inputs: None
+        Output: None-- Closes a stream that was never read to the end nor closed
+
+Description:
+A generator's finally only runs once the generator was started, so a response that was never iterated would
+never log its call. The iterator logs from close instead, which the server calls also for abandoned or unstarted
+responses (see ResponseCode.create_stream_response), and from __del__ when the response is dropped unsent.
+"""
+
+
+class StreamedRecords:
+    def __init__(self, call, records, context):
+        self.call = call
+        self.records = iter(records)
+        self.context = context
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            record = next(self.records)
+        except BaseException:
+            # Exhausted or failed, the stream ends here
+            self.close()
+            raise
+        self.call["rows"] += 1
+        return record
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            close = getattr(self.records, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.context.run(write_db_call_log, self.call)
+
+    def __del__(self):
+        if not getattr(self, "closed", True):
+            self.close()
+
+
+"""
+    Class Name: TimedCursor
+    Functions: execute, executemany, copy_expert
+        Inputs: Same as the psycopg2 cursor
+        Output: Same as the psycopg2 cursor-- Adds the rowcount of the statement to the current db call
+"""
+
+
+class TimedCursor(psycopg2.extensions.cursor):
+    def execute(self, query, vars=None):
+        result = super().execute(query, vars)
+        record_rows(self.rowcount)
+        return result
+
+    def executemany(self, query, vars_list):
+        result = super().executemany(query, vars_list)
+        record_rows(self.rowcount)
+        return result
+
+    def copy_expert(self, sql, file, size=8192):
+        result = super().copy_expert(sql, file, size)
+        record_rows(self.rowcount)
+        return result
+
+
+"""
+Function Name: write_db_call_log
+Inputs: call (dict): The db call, as filled in while it ran.
+Output: None
+"""
+
+
+def write_db_call_log(call):
+    call["elapsed_ms"] = round((time.perf_counter() - call.pop("started_at")) * 1000, 3)
+    call["pool_wait_ms"] = round(call["pool_wait_ms"], 3)
+    logger.info("db_call table=%s operation=%s rows=%s elapsed_ms=%s pool_wait_ms=%s",
+                call["table"], call["operation"], call["rows"], call["elapsed_ms"],
+                call["pool_wait_ms"], extra={"db_call": call})
+
+
+"""
+Function Name: log_db_call
+Inputs: operation (str): Name of the operation, e.g. "insert", "select", "search".
+Output: Decorator for the entityOperation functions taking a table_name argument.
+
+Description:
+Times the call and logs it once it returns, also when it raised. Does nothing when the logging is disabled.
+"""
+
+
+def log_db_call(operation):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_db_call_logging_enabled():
+                return func(*args, **kwargs)
+
+            try:
+                table_name = signature.bind_partial(*args, **kwargs).arguments.get('table_name')
+            except TypeError:
+                table_name = None
+
+            call = {"table": table_name, "operation": operation, "rows": 0, "elapsed_ms": 0.0,
+                    "pool_wait_ms": 0.0, "streamed": False, "started_at": time.perf_counter()}
+            token = current_db_call.set(call)
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                # No stream reaches the client then, log the call now
+                call["streamed"] = False
+                raise
+            finally:
+                current_db_call.reset(token)
+                # A streamed call is logged by stream_db_call when the stream ends
+                if not call["streamed"]:
+                    write_db_call_log(call)
+            return result
+
+        return wrapper
+
+    return decorator
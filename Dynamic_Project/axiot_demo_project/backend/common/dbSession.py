@@ -0,0 +1,192 @@
+"""
+dbSession.py
+==============
+Author: Stanley Parmar
+Description: Connection / transaction helper of entityOperation and tableEntityOperation.
+
+    with db_session() as cursor:
+        cursor.execute(...)
+
+checks a connection out of the pool, commits when the block ends normally, rolls back when it raises, and
+always closes the cursor and releases the connection. When the caller passes its own cursor (cur=...), the
+block runs on it and the caller keeps the transaction. Work that must only happen once the data is committed
+(e.g. cache invalidation) is registered with on_commit and runs after the outermost session commits.
+
+The counters of get_db_session_stats show sessions that are still open or were held for too long.
+"""
+
+# dbSession.py
+
+# Import the default Libraries
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+
+# Import the custom Libraries
+from backend.dbConnectionPool import get_connection, release_connection
+from backend.common.commonUtility import open_read_file, logger
+
+# Default when the general config does not define 'db_session_warn_seconds'
+DEFAULT_SESSION_WARN_SECONDS = 30.0
+
+_session_lock = threading.Lock()
+_session_warn_seconds = None
+# id of the open session -> (thread name, start time)
+_open_sessions = {}
+_session_stats = {
+    "opened": 0,
+    "closed": 0,
+    "commits": 0,
+    "rollbacks": 0,
+    "errors": 0,
+    "long_held": 0,
+}
+
+
+"""
+Function Name: get_session_warn_seconds
+Inputs: None
+Output: float: Sessions held longer than this are logged and counted as long_held.
+"""
+
+
+def get_session_warn_seconds():
+    global _session_warn_seconds
+    if _session_warn_seconds is None:
+        config = open_read_file('resources', '', 'general') or {}
+        _session_warn_seconds = float(config.get('db_session_warn_seconds', DEFAULT_SESSION_WARN_SECONDS))
+    return _session_warn_seconds
+
+
+"""
+Function Name: on_commit
+Inputs:
+- cursor: Cursor of the running session (the one db_session yielded, also when it was passed in as cur).
+- callback: Called without arguments once the transaction commits; dropped when it rolls back.
+Output: None
+
+Description:
+A cursor that does not come from db_session has no transaction to wait for, the callback runs straight away.
+"""
+
+
+def on_commit(cursor, callback):
+    callbacks = getattr(cursor.connection, 'after_commit', None)
+    if callbacks is None:
+        run_after_commit(callback)
+    else:
+        callbacks.append(callback)
+
+
+def run_after_commit(callback):
+    # The data is committed already, a failing callback must not turn the session into an error
+    try:
+        callback()
+    except Exception as e:
+        logger.error("db_session after-commit callback failed: {}".format(e))
+
+
+"""
+Function Name: db_session
+Inputs:
+- readonly (bool): Run the block in a READ ONLY transaction, rolled back at the end instead of committed.
+- cur: Cursor of the caller; the block runs on it and the caller commits or rolls back.
+- name (str): Open a named (server-side) cursor, for streaming large results.
+- autocommit (bool): Run every statement in its own transaction, for statements that cannot run inside one
+  (CREATE / DROP INDEX CONCURRENTLY).
+
+Output: Context manager yielding the cursor.
+"""
+
+
+@contextmanager
+def db_session(readonly=False, cur=None, name=None, autocommit=False):
+    if cur is not None:
+        yield cur
+        return
+
+    conn = get_connection()
+    cursor = None
+    failed = False
+    after_commit = []
+    session_key = object()
+    start = time.monotonic()
+    with _session_lock:
+        _session_stats["opened"] += 1
+        _open_sessions[id(session_key)] = (threading.current_thread().name, start)
+
+    try:
+        conn.after_commit = []
+        if autocommit:
+            conn.autocommit = True
+        if readonly:
+            conn.readonly = True
+        cursor = conn.cursor(name=name) if name else conn.cursor()
+        yield cursor
+        if readonly:
+            conn.rollback()
+        else:
+            conn.commit()
+            after_commit = conn.after_commit
+    except BaseException:
+        # Also GeneratorExit, when a streaming generator is closed before the end
+        failed = True
+        try:
+            conn.rollback()
+        except psycopg2.Error:
+            # Broken connection, the pool replaces it on the next checkout
+            pass
+        raise
+    finally:
+        conn.after_commit = None
+        try:
+            if cursor is not None and not cursor.closed:
+                cursor.close()
+        except psycopg2.Error:
+            pass
+        try:
+            if readonly:
+                conn.readonly = None
+            if autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            pass
+        release_connection(conn)
+
+        held_seconds = time.monotonic() - start
+        long_held = held_seconds > get_session_warn_seconds()
+        with _session_lock:
+            _open_sessions.pop(id(session_key), None)
+            _session_stats["closed"] += 1
+            _session_stats["commits" if not (failed or readonly) else "rollbacks"] += 1
+            if failed:
+                _session_stats["errors"] += 1
+            if long_held:
+                _session_stats["long_held"] += 1
+        if long_held:
+            logger.warning("db_session held a connection for %.1f seconds", held_seconds)
+
+    # Only reached when the block committed
+    for callback in after_commit:
+        run_after_commit(callback)
+
+
+"""
+Function Name: get_db_session_stats
+Inputs: None
+Output: stats (dict): Sessions opened, closed and still open, commits, rollbacks, errors, sessions held longer
+        than db_session_warn_seconds and the age of the oldest open session.
+"""
+
+
+def get_db_session_stats():
+    now = time.monotonic()
+    with _session_lock:
+        stats = dict(_session_stats)
+        stats["open"] = len(_open_sessions)
+        stats["oldest_open_seconds"] = round(max((now - start for _, start in _open_sessions.values()),
+                                                 default=0.0), 3)
+        stats["open_by_thread"] = sorted({thread_name for thread_name, _ in _open_sessions.values()})
+    return stats
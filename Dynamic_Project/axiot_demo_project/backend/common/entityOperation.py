@@ -6,16 +6,39 @@ Description: Module to handle database operations including creating, updating,
 """
 
 
+import base64
+import hashlib
+import hmac
+import io
 import json
+import secrets
+import time
+import uuid
+from itertools import islice
 import psycopg2
 from psycopg2 import sql
-from backend.dbConnectionPool import get_connection, release_connection
-from backend.common.commonUtility import open_read_file, logger, debug_print
-from backend.jsonResponse import ResponseCode
+from psycopg2.extras import execute_values
+from backend.common.commonUtility import open_read_file, logger, debug_print, hash_password
+from backend.jsonResponse import ResponseCode, STREAM_FORMATS
 from backend.common.convertingJsontoListCommonOperations import convert_into_in_compatible_string_no_quotes
+from backend.common.schemaCache import get_cached_schema_columns, set_cached_schema_columns
+from backend.common.countCache import (get_cached_count, set_cached_count, normalize_count_filters,
+                                       invalidate_count_cache)
+from backend.common.searchBackend import build_search_condition
+from backend.common.statementCache import execute_statement
+from backend.common.dbCallLog import log_db_call, helper_statement, stream_db_call
+from backend.common.dbSession import db_session, on_commit
 import traceback
 
 AND = " AND "
+DEFAULT_STREAM_ITERSIZE = 2000
+DEFAULT_KEYSET_PAGE_SIZE = 100
+DEFAULT_APPROXIMATE_COUNT_THRESHOLD = 10000
+UPSERT_INSERTED_FLAG = "_upsert_inserted"
+# Only these are ever put into ORDER BY, order_filter and continuation tokens come from the client
+ORDER_DIRECTIONS = ("ASC", "DESC")
+
+_continuation_token_secret = None
 
 
 def handle_database_exception(e):
@@ -45,6 +68,8 @@ Output: column_without_defaults (list): A list of columns for the given table th
 
 Description:
 Loads the schema for the specified table from a JSON configuration file.
+Results are served from the process-wide schema cache (see schemaCache.py) until the TTL runs out
+or tableEntityOperation invalidates the table.
 """
 
 
@@ -52,36 +77,40 @@ def get_schema_columns(table_name, cur=None, with_default=False):
     """
     Loads the schema for the specified table from the Database instance.
     """
-    con = None
-    is_new_cur = False
+    # Define the schema and table name
+    schema_name = 'public'  # Adjust as necessary
+
+    # Serve from the cache before touching the pool
+    cached_columns = get_cached_schema_columns(schema_name, table_name, with_default)
+    if cached_columns is not None:
+        return cached_columns
+
     try:
-        if not cur:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Define the schema and table name
-        schema_name = 'public'  # Adjust as necessary
-
-        # Query to fetch column metadata
-        query = """
-        SELECT column_name, column_default
-        FROM information_schema.columns
-        WHERE table_schema = %s AND table_name = %s;
-        """
+        with db_session(readonly=True, cur=cur) as cur:
+            # Query to fetch column metadata
+            query = """
+            SELECT column_name, column_default
+            FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s;
+            """
 
-        # Execute the query
-        cur.execute(query, (schema_name, table_name))
+            # Execute the query
+            with helper_statement():
+                cur.execute(query, (schema_name, table_name))
+
+            # Fetch all results
+            columns = cur.fetchall()
 
-        # Fetch all results
-        columns = cur.fetchall()
+            # Filter out columns with default values
+            columns_without_defaults = [col[0] for col in columns if with_default or col[1] is None]
 
-        # Filter out columns with default values
-        columns_without_defaults = [col[0] for col in columns if with_default or col[1] is None]
+            # Only cache tables that exist, so a table created later is picked up straight away
+            if columns:
+                set_cached_schema_columns(schema_name, table_name, with_default, columns_without_defaults)
 
-        # debug_print("Columns without default values: {}".format(columns_without_defaults))
+            # debug_print("Columns without default values: {}".format(columns_without_defaults))
 
-        return columns_without_defaults
+            return columns_without_defaults
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
@@ -90,16 +119,11 @@ def get_schema_columns(table_name, cur=None, with_default=False):
         traceback.print_exc()  # This will print the full traceback, including the line number
         raise e
 
-    finally:
-        if cur and is_new_cur:
-            cur.close()
-        if con and is_new_cur:
-            release_connection(con)
-
 
 """
 Function Name: get_primary_key_columns
 Inputs: table_name (str): The name of the table for which the schema is being retrieved.
+        cur (optional): Cursor of the caller's open session, so no second connection is checked out.
 
 Output: column_without_defaults (list): A list of columns for the given table that does not have default values.
 
@@ -108,129 +132,110 @@ Loads the schema for the specified table from a JSON configuration file.
 """
 
 
-def get_primary_key_columns(table_name=None):
-    conn = None
-    cursor = None
-
+def get_primary_key_columns(table_name=None, cur=None):
     # Define the schema and table name
     schema_name = 'public'  # Adjust as necessary
     constraint_type = 'PRIMARY KEY'
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        # Query to fetch primary key column metadata
-        if table_name:
-            query = """
-            SELECT kcu.column_name
-            FROM information_schema.table_constraints tc
-            JOIN information_schema.key_column_usage kcu
-              ON tc.constraint_name = kcu.constraint_name
-              AND tc.table_schema = kcu.table_schema
-            WHERE tc.constraint_type = %s
-              AND tc.table_schema = %s
-              AND tc.table_name = %s;
-            """
+        with db_session(readonly=True, cur=cur) as cursor:
+            # Query to fetch primary key column metadata
+            if table_name:
+                query = """
+                SELECT kcu.column_name
+                FROM information_schema.table_constraints tc
+                JOIN information_schema.key_column_usage kcu
+                  ON tc.constraint_name = kcu.constraint_name
+                  AND tc.table_schema = kcu.table_schema
+                WHERE tc.constraint_type = %s
+                  AND tc.table_schema = %s
+                  AND tc.table_name = %s;
+                """
 
-            # Execute the query
-            cursor.execute(query, (constraint_type, schema_name, table_name))
-            # Fetch all results
-            primary_key_columns = cursor.fetchall()
+                # Execute the query
+                with helper_statement():
+                    cursor.execute(query, (constraint_type, schema_name, table_name))
+                # Fetch all results
+                primary_key_columns = cursor.fetchall()
 
-            # Extract column names from the results
-            primary_key_column_names = [col[0] for col in primary_key_columns]
+                # Extract column names from the results
+                primary_key_column_names = [col[0] for col in primary_key_columns]
 
-            # debug_print("Primary key columns: {}".format(primary_key_column_names))
+                # debug_print("Primary key columns: {}".format(primary_key_column_names))
 
-            return primary_key_column_names
-        else:
-            query = """
-            SELECT
-                t.table_name,
-                c.column_name
-            FROM
-                information_schema.table_constraints tc
-                JOIN information_schema.constraint_column_usage ccu
-                    ON tc.constraint_name = ccu.constraint_name
-                JOIN information_schema.columns c
-                    ON c.table_schema = ccu.table_schema
-                    AND c.table_name = ccu.table_name
-                    AND c.column_name = ccu.column_name
-                JOIN information_schema.tables t
-                    ON t.table_schema = c.table_schema
-                    AND t.table_name = c.table_name
-            WHERE
-                tc.constraint_type = %s and 
-                tc.table_schema = %s
-            ORDER BY
-                t.table_schema,
-                t.table_name,
-                c.ordinal_position;
-                """
-            cursor.execute(query, (constraint_type, schema_name))
-            # Fetch all results
-            primary_key_columns = cursor.fetchall()
-            result = [
-                {
-                    "module_name": row[0],
-                    "value": row[1]
-                }
-                for row in primary_key_columns
-            ]
-            return result
+                return primary_key_column_names
+            else:
+                query = """
+                SELECT
+                    t.table_name,
+                    c.column_name
+                FROM
+                    information_schema.table_constraints tc
+                    JOIN information_schema.constraint_column_usage ccu
+                        ON tc.constraint_name = ccu.constraint_name
+                    JOIN information_schema.columns c
+                        ON c.table_schema = ccu.table_schema
+                        AND c.table_name = ccu.table_name
+                        AND c.column_name = ccu.column_name
+                    JOIN information_schema.tables t
+                        ON t.table_schema = c.table_schema
+                        AND t.table_name = c.table_name
+                WHERE
+                    tc.constraint_type = %s and 
+                    tc.table_schema = %s
+                ORDER BY
+                    t.table_schema,
+                    t.table_name,
+                    c.ordinal_position;
+                    """
+                with helper_statement():
+                    cursor.execute(query, (constraint_type, schema_name))
+                # Fetch all results
+                primary_key_columns = cursor.fetchall()
+                result = [
+                    {
+                        "module_name": row[0],
+                        "value": row[1]
+                    }
+                    for row in primary_key_columns
+                ]
+                return result
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to create record: {}".format(str(e)))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 def check_product_exists(product_table, product_data):
     config = open_read_file('resources', '', 'general')
     product_active_status = config['product_active_status']
-    conn = None
-    cursor = None
-
     try:
         product_id = get_primary_key_columns(product_table)[0]
-        conn = get_connection()
-        cursor = conn.cursor()
-        check_product_query = sql.SQL("""
-            SELECT 1 FROM {product_table} WHERE {product_id} = %s AND {product_active_status} = TRUE
-        """).format(
-            product_table=sql.Identifier(product_table),
-            product_id=sql.Identifier(product_id),
-            product_active_status=sql.Identifier(product_active_status)
-        )
-        cursor.execute(check_product_query, (product_data[product_id],))
-        product_exists = cursor.fetchone()
-
-        if not product_exists:
-            return False
-        else:
-            return True
+        with db_session(readonly=True) as cursor:
+            check_product_query = sql.SQL("""
+                SELECT 1 FROM {product_table} WHERE {product_id} = %s AND {product_active_status} = TRUE
+            """).format(
+                product_table=sql.Identifier(product_table),
+                product_id=sql.Identifier(product_id),
+                product_active_status=sql.Identifier(product_active_status)
+            )
+            with helper_statement():
+                cursor.execute(check_product_query, (product_data[product_id],))
+            product_exists = cursor.fetchone()
+
+            if not product_exists:
+                return False
+            else:
+                return True
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to fetch records: {}".format(str(e)))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 """
@@ -364,102 +369,149 @@ def check_string_for_data_match(input_string, validation_string):
 """
 Function Name: duplicate_records
 Inputs:
-Output: 
+- table_name (str): The table whose rows are cloned.
+- filters (dict): Column-value pairs selecting the rows to clone.
+- product_id: product_id of the cloned rows.
+- user_id: user_id of the cloned rows (optional, the source user_id is kept when not given).
+- set_based (bool): Clone with a single INSERT ... SELECT (default), False uses the row by row copy.
+
+Output: SAVE_SUCCESSFULLY with the number of rows copied in record_length.
 
 Description:
 duplicate records of the data
+The clone runs on the server as one INSERT INTO t (product_id, user_id, cols...) SELECT %s, %s, cols...
+FROM t WHERE ... statement, with the column list from the cached schema metadata. When the columns
+cannot be read it falls back to duplicate_records_row_by_row.
 """
 
 
-def duplicate_records(table_name, filters, product_id, user_id=None):
-    conn = None
-    cursor = None
+@log_db_call("duplicate")
+def duplicate_records(table_name, filters, product_id, user_id=None, set_based=True):
+    if not set_based:
+        return duplicate_records_row_by_row(table_name, filters, product_id, user_id)
 
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        # Prepare the WHERE clause dynamically from the JSON filters
-        filter_conditions = []
-        filter_values = []
-
-        for column, value in filters.items():
-            filter_conditions.append("{} = %s".format(column))
-            filter_values.append(value)
-
-        # Construct the SELECT query
-        where_clause = " AND ".join(filter_conditions)
-        select_query = " SELECT * FROM {} WHERE {}".format(table_name, where_clause)
-
-        # Execute the SELECT query
-        cursor.execute(select_query, filter_values)
-        rows = cursor.fetchall()
-
-        if rows:
-            # Step 2: Prepare the INSERT query, including the manual 'id' value
-            columns = [desc[0] for desc in cursor.description]  # Get column names
-            columns.remove('product_id')  # Remove 'product_id' from the column list since it's manually set
-            # debug_print("user_id: {}".format(user_id))
-            if user_id:
-                columns.remove('user_id')  # Remove 'user_id' from the column list since it's manually set
-
-                # debug_print("columns: {}".format(columns))
-                # debug_print("len(columns): {}".format(len(columns)))
-                # Prepare the insert query dynamically (including 'id')
-                insert_query = (sql.SQL("INSERT INTO {table} (product_id, user_id, {fields}) VALUES (%s, %s, {values})").
-                format(
-                    table=sql.Identifier(table_name),
-                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-                    values=sql.SQL(', ').join([sql.Placeholder()] * (len(columns)))
-                ))
-                # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
-            else:
-                insert_query = (sql.SQL("INSERT INTO {table} (product_id,  {fields}) VALUES (%s,  {values})").
-                format(
-                    table=sql.Identifier(table_name),
-                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-                    values=sql.SQL(', ').join([sql.Placeholder()] * (len(columns)))
-                ))
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Every column is copied, like SELECT * in the row by row copy, except the ones set manually
+            columns = get_schema_columns(table_name, cursor, with_default=True)
+            if not isinstance(columns, list) or 'product_id' not in columns:
+                debug_print("duplicate_records: no schema metadata for {}, copying row by row".format(table_name))
+                return duplicate_records_row_by_row(table_name, filters, product_id, user_id, cursor)
+
+            manual_columns = ['product_id', 'user_id'] if user_id else ['product_id']
+            copy_columns = [column for column in columns if column not in manual_columns]
+            manual_values = [product_id, user_id] if user_id else [product_id]
+
+            insert_query = sql.SQL(
+                "INSERT INTO {table} ({manual_fields}, {fields}) SELECT {manual_values}, {fields} FROM {table} "
+                "WHERE {where_clause}"
+            ).format(
+                table=sql.Identifier(table_name),
+                manual_fields=sql.SQL(', ').join(map(sql.Identifier, manual_columns)),
+                manual_values=sql.SQL(', ').join([sql.Placeholder()] * len(manual_values)),
+                fields=sql.SQL(', ').join(map(sql.Identifier, copy_columns)),
+                where_clause=sql.SQL(AND).join(
+                    sql.SQL("{} = %s").format(sql.Identifier(column)) for column in filters.keys())
+            )
 
-            # Step 3: Insert each row as a duplicate, with the manual 'id' value
-            for row in rows:
-                values_to_insert = ""
-                values_to_insert = (product_id,)  # Add manual 'product_id' at the start of the row values
+            # debug_print(cursor.mogrify(insert_query, manual_values + list(filters.values())).decode('utf-8'))
+            cursor.execute(insert_query, manual_values + list(filters.values()))
+            copied_count = cursor.rowcount
+
+            debug_print("duplicate_records: copied {} rows of {}".format(copied_count, table_name))
+            return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data={"record_length": copied_count})
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to duplicate records: {}".format(e))
+        raise e
+
+
+"""
+Function Name: duplicate_records_row_by_row
+Inputs: See duplicate_records, plus cur (optional): cursor of the caller's open session.
+Output: SAVE_SUCCESSFULLY with the number of rows copied in record_length.
+
+Description:
+Fallback clone of duplicate_records: fetches the matching rows and re-inserts them one by one.
+"""
+
+
+def duplicate_records_row_by_row(table_name, filters, product_id, user_id=None, cur=None):
+    try:
+        with db_session(cur=cur) as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Prepare the WHERE clause dynamically from the JSON filters
+            filter_conditions = []
+            filter_values = []
+
+            for column, value in filters.items():
+                filter_conditions.append("{} = %s".format(column))
+                filter_values.append(value)
+
+            # Construct the SELECT query
+            where_clause = " AND ".join(filter_conditions)
+            select_query = " SELECT * FROM {} WHERE {}".format(table_name, where_clause)
+
+            # Execute the SELECT query
+            cursor.execute(select_query, filter_values)
+            rows = cursor.fetchall()
+
+            if rows:
+                # Step 2: Prepare the INSERT query, including the manual 'id' value
+                columns = [desc[0] for desc in cursor.description]  # Get column names
+                columns.remove('product_id')  # Remove 'product_id' from the column list since it's manually set
+                # debug_print("user_id: {}".format(user_id))
                 if user_id:
-                    values_to_insert = values_to_insert + (user_id,) + row[2:]
+                    columns.remove('user_id')  # Remove 'user_id' from the column list since it's manually set
+
+                    # debug_print("columns: {}".format(columns))
+                    # debug_print("len(columns): {}".format(len(columns)))
+                    # Prepare the insert query dynamically (including 'id')
+                    insert_query = (sql.SQL("INSERT INTO {table} (product_id, user_id, {fields}) VALUES (%s, %s, {values})").
+                    format(
+                        table=sql.Identifier(table_name),
+                        fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                        values=sql.SQL(', ').join([sql.Placeholder()] * (len(columns)))
+                    ))
+                    # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
                 else:
-                    values_to_insert = values_to_insert + row[1:]
-                # debug_print(product_id)
-                # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
-                # debug_print("values_to_insert======= {}".format(values_to_insert))
-                # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
-                # added the below to handle if json columns are present on the DB while cloning
-                values_to_insert = [json.dumps(v) if isinstance(v, dict) else v for v in values_to_insert]
-                cursor.execute(insert_query, values_to_insert)
-
-            # Commit the transaction to persist changes
-            conn.commit()
-
-        # Commit the transaction
-        conn.commit()
-
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
-        return ResponseCode.create_response("SAVE_SUCCESSFULLY")
+                    insert_query = (sql.SQL("INSERT INTO {table} (product_id,  {fields}) VALUES (%s,  {values})").
+                    format(
+                        table=sql.Identifier(table_name),
+                        fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                        values=sql.SQL(', ').join([sql.Placeholder()] * (len(columns)))
+                    ))
+
+                # Step 3: Insert each row as a duplicate, with the manual 'id' value
+                for row in rows:
+                    values_to_insert = ""
+                    values_to_insert = (product_id,)  # Add manual 'product_id' at the start of the row values
+                    if user_id:
+                        values_to_insert = values_to_insert + (user_id,) + row[2:]
+                    else:
+                        values_to_insert = values_to_insert + row[1:]
+                    # debug_print(product_id)
+                    # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
+                    # debug_print("values_to_insert======= {}".format(values_to_insert))
+                    # debug_print(cursor.mogrify(insert_query).decode('utf-8'))
+                    # added the below to handle if json columns are present on the DB while cloning
+                    values_to_insert = [json.dumps(v) if isinstance(v, dict) else v for v in values_to_insert]
+                    cursor.execute(insert_query, values_to_insert)
+
+            return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data={"record_length": len(rows)})
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to create record: {}".format(e))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 """
@@ -475,62 +527,53 @@ Creates a new record in the specified table. Fields ending with 'password' are h
 """
 
 
+@log_db_call("insert")
 def create_record(data, table_name,is_json=None):
     record_data = json.loads(data)
-    conn = None
-    cursor = None
-
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        columns = get_schema_columns(table_name, cursor)
-        # debug_print("columns: {}".format(columns))
-
-        # Ensure any field ending with 'password' is hashed
-        for key in record_data:
-            if key.endswith('password'):
-                if record_data[key] is not None:
-                    record_data[key] = hash_password(record_data[key])
-
-        insert_query = sql.SQL(
-            "INSERT INTO public.{table} ({fields}) VALUES ({values}) RETURNING *"
-        ).format(
-            table=sql.Identifier(table_name),
-            fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-            values=sql.SQL(', ').join(sql.Placeholder(column) for column in columns)
-        )
-        # debug_print(cursor.mogrify(insert_query, record_data).decode('utf-8'))
-        cursor.execute(insert_query, record_data)
-        inserted_row = cursor.fetchone()
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
-        # Filter out columns ending with "password"
-        filtered_columns = [col for col in column_names if 'password' not in col.lower()]
-        filtered_row = {col: value for col, value in zip(column_names, inserted_row) if col in filtered_columns}
-        response_data = {
-            "result": filtered_row
-        }
-        conn.commit()
-        if is_json:
-            return filtered_row
-        else:
-            return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data=response_data)
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            columns = get_schema_columns(table_name, cursor)
+            # debug_print("columns: {}".format(columns))
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            def build_insert_query():
+                return sql.SQL(
+                    "INSERT INTO public.{table} ({fields}) VALUES ({values}) RETURNING *"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                    values=sql.SQL(', ').join(sql.Placeholder(column) for column in columns)
+                )
+
+            # debug_print(cursor.mogrify(build_insert_query(), record_data).decode('utf-8'))
+            execute_statement(cursor, table_name, "insert_returning", tuple(columns), build_insert_query, record_data)
+            inserted_row = cursor.fetchone()
+            # Fetch column names
+            column_names = [desc[0] for desc in cursor.description]
+            # Filter out columns ending with "password"
+            filtered_columns = [col for col in column_names if 'password' not in col.lower()]
+            filtered_row = {col: value for col, value in zip(column_names, inserted_row) if col in filtered_columns}
+            response_data = {
+                "result": filtered_row
+            }
+            if is_json:
+                return filtered_row
+            else:
+                return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data=response_data)
     except psycopg2.Error as e:
-        print("------------------------------->",e)
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        print("------------------------------->",e)
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to create record: {}".format(e))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 """
@@ -547,48 +590,188 @@ Fields ending with 'password' are hashed before insertion.
 """
 
 
+@log_db_call("insert")
 def create_record_primary_key(data, table_name):
     record_data = json.loads(data)
-    conn = None
-    cursor = None
-
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        columns = get_primary_key_columns(table_name)
-        # debug_print("columns: {}".format(columns))
-
-        # Ensure any field ending with 'password' is hashed
-        for key in record_data:
-            if key.endswith('password'):
-                record_data[key] = hash_password(record_data[key])
-
-        insert_query = sql.SQL(
-            "INSERT INTO public.{table} ({fields}) VALUES ({values})"
-        ).format(
-            table=sql.Identifier(table_name),
-            fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
-            values=sql.SQL(', ').join(sql.Placeholder(column) for column in columns)
-        )
-        # debug_print(cursor.mogrify(insert_query, record_data).decode('utf-8'))
-        cursor.execute(insert_query, record_data)
-        conn.commit()
-        debug_print("Record created successfully.")
-        return ResponseCode.create_response("SAVE_SUCCESSFULLY")
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            columns = get_primary_key_columns(table_name, cursor)
+            # debug_print("columns: {}".format(columns))
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            insert_query = sql.SQL(
+                "INSERT INTO public.{table} ({fields}) VALUES ({values})"
+            ).format(
+                table=sql.Identifier(table_name),
+                fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                values=sql.SQL(', ').join(sql.Placeholder(column) for column in columns)
+            )
+            # debug_print(cursor.mogrify(insert_query, record_data).decode('utf-8'))
+            cursor.execute(insert_query, record_data)
+            debug_print("Record created successfully.")
+            return ResponseCode.create_response("SAVE_SUCCESSFULLY")
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to create record: {}".format(e))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
+
+
+"""
+Function Name: format_copy_value
+Inputs:
+- value: A single column value of a record.
+
+Output: str: The value encoded for the PostgreSQL COPY text format.
+
+Description:
+NULLs become \\N, dicts and lists are serialized as JSON and the COPY special characters are escaped.
+"""
+
+
+def format_copy_value(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    elif isinstance(value, bool):
+        value = "t" if value else "f"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+
+"""
+Function Name: iter_chunks
+Inputs:
+- iterable: Any iterable of records.
+- chunk_size (int): Maximum number of records per chunk.
+
+Output: generator of lists with at most chunk_size records each.
+"""
+
+
+def iter_chunks(iterable, chunk_size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+"""
+Function Name: create_records_bulk
+Inputs:
+- table_name (str): The name of the table where the records will be inserted.
+- records (iterable): Iterable of dicts, one per record. It is consumed chunk by chunk, so a generator works.
+- mode (str): "copy" streams every chunk through COPY FROM STDIN, "values" uses batched execute_values.
+- chunk_size (int): Number of records sent per round trip.
+- is_json (bool): Return the plain result dict instead of a Flask response.
+
+Output: The inserted rows ("values" mode only, password columns removed), the inserted count
+and the timing of every chunk.
+
+Description:
+Bulk version of create_record. Columns come from get_schema_columns, missing keys are inserted as NULL
+and fields ending with 'password' are hashed before insertion. All chunks run in one transaction.
+COPY cannot return rows, so "copy" mode only reports counts and timings.
+"""
+
+
+@log_db_call("bulk_insert")
+def create_records_bulk(table_name, records, mode="copy", chunk_size=1000, is_json=None):
+    if mode not in ("copy", "values"):
+        raise ValueError("Unsupported bulk insert mode: {}".format(mode))
+
+    try:
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            columns = get_schema_columns(table_name, cursor)
+
+            if mode == "copy":
+                copy_query = sql.SQL("COPY public.{table} ({fields}) FROM STDIN").format(
+                    table=sql.Identifier(table_name),
+                    fields=sql.SQL(', ').join(map(sql.Identifier, columns))
+                ).as_string(cursor)
+            else:
+                insert_query = sql.SQL(
+                    "INSERT INTO public.{table} ({fields}) VALUES %s RETURNING *"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    fields=sql.SQL(', ').join(map(sql.Identifier, columns))
+                ).as_string(cursor)
+
+            inserted_rows = []
+            chunk_timings = []
+            inserted_count = 0
+
+            for chunk_index, chunk in enumerate(iter_chunks(records, chunk_size)):
+                chunk_start = time.perf_counter()
+
+                rows = []
+                for record_data in chunk:
+                    # Ensure any field ending with 'password' is hashed
+                    for key in record_data:
+                        if key.endswith('password') and record_data[key] is not None:
+                            record_data[key] = hash_password(record_data[key])
+                    rows.append([record_data.get(column) for column in columns])
+
+                if mode == "copy":
+                    buffer = io.StringIO()
+                    for row in rows:
+                        buffer.write("\t".join(format_copy_value(value) for value in row))
+                        buffer.write("\n")
+                    buffer.seek(0)
+                    cursor.copy_expert(copy_query, buffer)
+                    chunk_count = cursor.rowcount if cursor.rowcount >= 0 else len(rows)
+                else:
+                    # added the below to handle if json columns are present on the DB
+                    rows = [[json.dumps(v) if isinstance(v, (dict, list)) else v for v in row] for row in rows]
+                    returned_rows = execute_values(cursor, insert_query, rows, page_size=chunk_size, fetch=True)
+                    column_names = [desc[0] for desc in cursor.description]
+                    # Filter out columns ending with "password"
+                    filtered_columns = [col for col in column_names if 'password' not in col.lower()]
+                    inserted_rows.extend(
+                        {col: value for col, value in zip(column_names, row) if col in filtered_columns}
+                        for row in returned_rows
+                    )
+                    chunk_count = len(returned_rows)
+
+                inserted_count += chunk_count
+                chunk_timings.append({
+                    "chunk": chunk_index,
+                    "rows": chunk_count,
+                    "elapsed_ms": round((time.perf_counter() - chunk_start) * 1000, 3)
+                })
+                debug_print("create_records_bulk {} chunk {}: {}".format(table_name, chunk_index,
+                                                                         chunk_timings[-1]))
+
+            response_data = {
+                "result": inserted_rows,
+                "record_length": inserted_count,
+                "chunk_timings": chunk_timings
+            }
+            if is_json:
+                return response_data
+            else:
+                return ResponseCode.create_response("SAVE_SUCCESSFULLY", extra_data=response_data)
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to create bulk records: {}".format(e))
+        raise e
 
 
 """
@@ -606,85 +789,80 @@ Updates an existing record in the specified table. Fields ending with 'password'
 """
 
 
+@log_db_call("update")
 def update_record(record_id, update_fields, data, table_name, is_json=None):
-    conn = None
-    cursor = None
     record_data = json.loads(data)
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Check if update_fields is a tuple, if not set it to record_id
+            if not isinstance(update_fields, tuple):
+                update_fields = (update_fields,)
+                key_value = (record_id,)
+            else:
+                key_value = record_id
+
+            # Construct the where clause
+            def build_where_clause():
+                where_clauses = [sql.SQL("{update_by} = %s").format(update_by=sql.Identifier(update_by)) for update_by in
+                                 update_fields]
+                return sql.SQL(AND).join(where_clauses)
+
+            # Check if the record exists
+            def build_check_record_query():
+                return sql.SQL(
+                    "SELECT 1 FROM public.{table} WHERE {where_clause}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    where_clause=build_where_clause()
+                )
 
-        # Check if update_fields is a tuple, if not set it to record_id
-        if not isinstance(update_fields, tuple):
-            update_fields = (update_fields,)
-            key_value = (record_id,)
-        else:
-            key_value = record_id
-
-        # Construct the where clause
-        where_clauses = [sql.SQL("{update_by} = %s").format(update_by=sql.Identifier(update_by)) for update_by in
-                         update_fields]
-        where_clause = sql.SQL(AND).join(where_clauses)
-
-        # Check if the record exists
-        check_record_query = sql.SQL(
-            "SELECT 1 FROM public.{table} WHERE {where_clause}"
-        ).format(
-            table=sql.Identifier(table_name),
-            where_clause=where_clause
-        )
-
-        cursor.execute(check_record_query, key_value)
-        record_exists = cursor.fetchone()
-
-        if not record_exists:
-            debug_print("Record ID does not exist.")
-            raise ValueError("Record ID {} does not exist.".format(record_id))
-
-        columns = get_schema_columns(table_name, cursor)
-        set_clauses = [sql.SQL("{column} = %s").format(column=sql.Identifier(column)) for column in columns if
-                       column in record_data]
-        set_clause = sql.SQL(", ").join(set_clauses)
-
-        # Ensure any field ending with 'password' is hashed
-        for key in record_data:
-            if key.endswith('password'):
-                record_data[key] = hash_password(record_data[key])
-
-        update_query = sql.SQL(
-            "UPDATE public.{table} SET {set_clause} WHERE {where_clause}"
-        ).format(
-            table=sql.Identifier(table_name),
-            set_clause=set_clause,
-            where_clause=where_clause
-        )
-
-        # Create a list of parameters for the query
-        params = [record_data[column] for column in columns if column in record_data] + list(key_value)
-
-        cursor.execute(update_query, params)
-        conn.commit()
-        debug_print("Record updated successfully.")
-        if is_json:
-            return record_data
-        else:
-            return ResponseCode.create_response("UPDATE_SUCCESSFULLY")
+            with helper_statement():
+                execute_statement(cursor, table_name, "exists", tuple(update_fields), build_check_record_query, key_value)
+            record_exists = cursor.fetchone()
+
+            if not record_exists:
+                debug_print("Record ID does not exist.")
+                raise ValueError("Record ID {} does not exist.".format(record_id))
+
+            columns = get_schema_columns(table_name, cursor)
+            set_columns = [column for column in columns if column in record_data]
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            def build_update_query():
+                set_clauses = [sql.SQL("{column} = %s").format(column=sql.Identifier(column)) for column in set_columns]
+                return sql.SQL(
+                    "UPDATE public.{table} SET {set_clause} WHERE {where_clause}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    set_clause=sql.SQL(", ").join(set_clauses),
+                    where_clause=build_where_clause()
+                )
+
+            # Create a list of parameters for the query
+            params = [record_data[column] for column in set_columns] + list(key_value)
+
+            execute_statement(cursor, table_name, "update", (tuple(set_columns), tuple(update_fields)),
+                              build_update_query, params)
+            debug_print("Record updated successfully.")
+            if is_json:
+                return record_data
+            else:
+                return ResponseCode.create_response("UPDATE_SUCCESSFULLY")
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to update record: {}".format(str(e)))
         raise e
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
-
 
 """
 Function Name: update_record_one
@@ -701,48 +879,39 @@ Updates an existing record in the specified table. Fields ending with 'password'
 """
 
 
+@log_db_call("update")
 def update_record_one(where_column, where_column_value, update_column, update_column_value, table_name):
-    conn = None
-    cursor = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        # Define the update query
-        update_query = (sql.SQL(" UPDATE {table} SET {update_column}= %s"
-                                " WHERE {where_column}= %s")
-        .format(
-            table=sql.Identifier(table_name),
-            update_column=sql.Identifier(update_column),
-            where_column=sql.Identifier(where_column),
-        ))
-        # Use mogrify to create a formatted query string
-        formatted_query = cursor.mogrify(update_query,
-                                         (str(update_column_value), str(where_column_value))
-                                         ).decode('utf-8')
-
-        # debug_print("Formatted Update Query: {} ".format(formatted_query))
-
-        cursor.execute(update_query, (str(update_column_value), str(where_column_value)))
-        conn.commit()
-
-        debug_print("Record updated successfully.")
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Define the update query
+            update_query = (sql.SQL(" UPDATE {table} SET {update_column}= %s"
+                                    " WHERE {where_column}= %s")
+            .format(
+                table=sql.Identifier(table_name),
+                update_column=sql.Identifier(update_column),
+                where_column=sql.Identifier(where_column),
+            ))
+            # Use mogrify to create a formatted query string
+            formatted_query = cursor.mogrify(update_query,
+                                             (str(update_column_value), str(where_column_value))
+                                             ).decode('utf-8')
+
+            # debug_print("Formatted Update Query: {} ".format(formatted_query))
+
+            cursor.execute(update_query, (str(update_column_value), str(where_column_value)))
+
+            debug_print("Record updated successfully.")
     except psycopg2.Error as e:
         debug_print('Error psycopg2 getting update_record_one: : \n {}'.format(str(e)))
         logger.warning("Error psycopg2 getting update_record_one: {}".format(str(e)))
         traceback.print_exc()
         return e
     except Exception as e:
-        if conn:
-            conn.rollback()
         debug_print('Error Exception getting update_record_one: : \n {}'.format(str(e)))
         raise e
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
-
 
 """
 Function Name: delete_record
@@ -758,67 +927,292 @@ Deletes an existing record from the specified table.
 """
 
 
+@log_db_call("delete")
 def delete_record(record_id, delete_by, table_name):
-    conn = None
-    cursor = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # debug_print(
-        #     "Record deleted successfully.record_id, delete_by, table_name : {} {} {}".format(record_id, delete_by,
-        #                                                                                      table_name))
-        # Check if delete_by is a tuple, if not set it to record_id
-        if not isinstance(delete_by, tuple):
-            delete_by = (delete_by,)
-            record_id = (record_id,)
-
-        # Construct the where clause
-        where_clauses = [sql.SQL("{delete_field} = %s").format(delete_field=sql.Identifier(field)) for field in
-                         delete_by]
-        where_clause = sql.SQL(AND).join(where_clauses)
-        # Check if the record exists
-        check_record_query = sql.SQL(
-            "SELECT 1 FROM public.{table} WHERE {where_clause}"
-        ).format(
-            table=sql.Identifier(table_name),
-            where_clause=where_clause
-        )
-        # debug_print("check_record_query: {}".format(check_record_query))
-        cursor.execute(check_record_query, record_id)
-        record_exists = cursor.fetchone()
-
-        if not record_exists:
-            logger.info("No record found")
-            return ResponseCode.create_response("NO_DATA_FOUND")
-
-        delete_query = sql.SQL(
-            "DELETE FROM public.{table} WHERE {where_clause}"
-        ).format(
-            table=sql.Identifier(table_name),
-            where_clause=where_clause
-        )
-        # debug_print("delete_query: {}".format(delete_query))
-
-        cursor.execute(delete_query, record_id)
-        conn.commit()
-        debug_print("Record deleted successfully.")
-        return ResponseCode.create_response("DELETE_SUCCESSFULLY")
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # debug_print(
+            #     "Record deleted successfully.record_id, delete_by, table_name : {} {} {}".format(record_id, delete_by,
+            #                                                                                      table_name))
+            # Check if delete_by is a tuple, if not set it to record_id
+            if not isinstance(delete_by, tuple):
+                delete_by = (delete_by,)
+                record_id = (record_id,)
+
+            # Construct the where clause
+            def build_where_clause():
+                where_clauses = [sql.SQL("{delete_field} = %s").format(delete_field=sql.Identifier(field)) for field in
+                                 delete_by]
+                return sql.SQL(AND).join(where_clauses)
+
+            # Check if the record exists
+            def build_check_record_query():
+                return sql.SQL(
+                    "SELECT 1 FROM public.{table} WHERE {where_clause}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    where_clause=build_where_clause()
+                )
+
+            with helper_statement():
+                execute_statement(cursor, table_name, "exists", tuple(delete_by), build_check_record_query, record_id)
+            record_exists = cursor.fetchone()
+
+            if not record_exists:
+                logger.info("No record found")
+                return ResponseCode.create_response("NO_DATA_FOUND")
+
+            def build_delete_query():
+                return sql.SQL(
+                    "DELETE FROM public.{table} WHERE {where_clause}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    where_clause=build_where_clause()
+                )
+
+            execute_statement(cursor, table_name, "delete", tuple(delete_by), build_delete_query, record_id)
+            debug_print("Record deleted successfully.")
+            return ResponseCode.create_response("DELETE_SUCCESSFULLY")
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to delete record: {}".format(str(e)))
         raise e
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
+
+"""
+Function Name: update_record_returning
+Inputs:
+- record_id (str/tuple): The ID of the record to be updated.
+- update_fields (str/tuple): The field(s) by which you want to update.
+- data (str): JSON string containing the updated data for the record.
+- table_name (str): The name of the table where the record exists.
+
+Output: The updated record(s) without password columns, or NO_DATA_FOUND.
+
+Description:
+Single round trip version of update_record. Runs UPDATE ... RETURNING * and reports "not found" from the
+affected row count instead of probing with SELECT 1 first. Fields ending with 'password' are hashed.
+"""
+
+
+@log_db_call("update")
+def update_record_returning(record_id, update_fields, data, table_name, is_json=None):
+    record_data = json.loads(data)
+    try:
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Check if update_fields is a tuple, if not set it to record_id
+            if not isinstance(update_fields, tuple):
+                update_fields = (update_fields,)
+                key_value = (record_id,)
+            else:
+                key_value = record_id
+
+            columns = get_schema_columns(table_name, cursor)
+            set_columns = [column for column in columns if column in record_data]
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            def build_update_query():
+                return sql.SQL(
+                    "UPDATE public.{table} SET {set_clause} WHERE {where_clause} RETURNING *"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    set_clause=sql.SQL(", ").join(
+                        sql.SQL("{column} = %s").format(column=sql.Identifier(column)) for column in set_columns),
+                    where_clause=sql.SQL(AND).join(
+                        sql.SQL("{update_by} = %s").format(update_by=sql.Identifier(update_by))
+                        for update_by in update_fields)
+                )
+
+            # Create a list of parameters for the query
+            params = [record_data[column] for column in set_columns] + list(key_value)
+
+            execute_statement(cursor, table_name, "update_returning", (tuple(set_columns), tuple(update_fields)),
+                              build_update_query, params)
+            updated_rows = cursor.fetchall()
+
+            if not updated_rows:
+                logger.info("No record found")
+                return None if is_json else ResponseCode.create_response("NO_DATA_FOUND")
+
+            # Filter out columns ending with "password"
+            column_names = [desc[0] for desc in cursor.description]
+            records_list = [
+                {col: row[i] for i, col in enumerate(column_names) if 'password' not in col.lower()}
+                for row in updated_rows
+            ]
+            debug_print("Record updated successfully.")
+            if is_json:
+                return records_list
+            else:
+                return ResponseCode.create_response("UPDATE_SUCCESSFULLY",
+                                                    extra_data={"result": records_list,
+                                                                "record_length": len(records_list)})
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to update record: {}".format(str(e)))
+        raise e
+
+
+"""
+Function Name: delete_record_returning
+Inputs:
+- record_id (str/tuple): The ID of the record to be deleted.
+- delete_by (str/tuple): The field(s) you want to delete by.
+- table_name (str): The name of the table where the record exists.
+
+Output: DELETE_SUCCESSFULLY with the deleted record(s) without password columns, or NO_DATA_FOUND.
+
+Description:
+Single round trip version of delete_record. Runs DELETE ... RETURNING * and reports "not found" from the
+affected row count instead of probing with SELECT 1 first.
+"""
+
+
+@log_db_call("delete")
+def delete_record_returning(record_id, delete_by, table_name):
+    try:
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Check if delete_by is a tuple, if not set it to record_id
+            if not isinstance(delete_by, tuple):
+                delete_by = (delete_by,)
+                record_id = (record_id,)
+
+            def build_delete_query():
+                return sql.SQL(
+                    "DELETE FROM public.{table} WHERE {where_clause} RETURNING *"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    where_clause=sql.SQL(AND).join(
+                        sql.SQL("{delete_field} = %s").format(delete_field=sql.Identifier(field)) for field in delete_by)
+                )
+
+            execute_statement(cursor, table_name, "delete_returning", tuple(delete_by), build_delete_query, record_id)
+            deleted_rows = cursor.fetchall()
+
+            if not deleted_rows:
+                logger.info("No record found")
+                return ResponseCode.create_response("NO_DATA_FOUND")
+
+            # Filter out columns ending with "password"
+            column_names = [desc[0] for desc in cursor.description]
+            records_list = [
+                {col: row[i] for i, col in enumerate(column_names) if 'password' not in col.lower()}
+                for row in deleted_rows
+            ]
+            debug_print("Record deleted successfully.")
+            return ResponseCode.create_response("DELETE_SUCCESSFULLY",
+                                                extra_data={"result": records_list, "record_length": len(records_list)})
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to delete record: {}".format(str(e)))
+        raise e
+
+
+"""
+Function Name: upsert_record
+Inputs:
+- data (str): JSON string containing the record. It must contain every primary key column.
+- table_name (str): The name of the table where the record will be inserted or updated.
+
+Output: The saved record without password columns, SAVE_SUCCESSFULLY when it was inserted and
+UPDATE_SUCCESSFULLY when it already existed.
+
+Description:
+Inserts the record or updates the existing one in a single INSERT ... ON CONFLICT statement, using the
+primary key from get_primary_key_columns as the conflict target. Only the fields present in the payload
+are written. Fields ending with 'password' are hashed before saving.
+"""
+
+
+@log_db_call("upsert")
+def upsert_record(data, table_name, is_json=None):
+    record_data = json.loads(data)
+    try:
+        primary_key_columns = get_primary_key_columns(table_name)
+        if not isinstance(primary_key_columns, list) or not primary_key_columns:
+            raise ValueError("Table {} has no primary key to upsert on.".format(table_name))
+
+        missing_keys = [column for column in primary_key_columns if column not in record_data]
+        if missing_keys:
+            raise ValueError("Primary key column(s) {} missing from the payload.".format(", ".join(missing_keys)))
+
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            columns = [column for column in get_schema_columns(table_name, cursor, with_default=True)
+                       if column in record_data]
+            update_columns = [column for column in columns if column not in primary_key_columns]
+
+            # Ensure any field ending with 'password' is hashed
+            for key in record_data:
+                if key.endswith('password'):
+                    if record_data[key] is not None:
+                        record_data[key] = hash_password(record_data[key])
+
+            def build_upsert_query():
+                if update_columns:
+                    conflict_action = sql.SQL("DO UPDATE SET {}").format(sql.SQL(", ").join(
+                        sql.SQL("{column} = EXCLUDED.{column}").format(column=sql.Identifier(column))
+                        for column in update_columns))
+                else:
+                    # Nothing to update, touch the key so the existing row is still returned
+                    conflict_action = sql.SQL("DO UPDATE SET {column} = EXCLUDED.{column}").format(
+                        column=sql.Identifier(primary_key_columns[0]))
+
+                # xmax is 0 only for a freshly inserted row version
+                return sql.SQL(
+                    "INSERT INTO public.{table} ({fields}) VALUES ({values}) ON CONFLICT ({keys}) {action} "
+                    "RETURNING *, (xmax = 0) AS {inserted_flag}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    fields=sql.SQL(', ').join(map(sql.Identifier, columns)),
+                    values=sql.SQL(', ').join(sql.Placeholder(column) for column in columns),
+                    keys=sql.SQL(', ').join(map(sql.Identifier, primary_key_columns)),
+                    action=conflict_action,
+                    inserted_flag=sql.Identifier(UPSERT_INSERTED_FLAG)
+                )
+
+            execute_statement(cursor, table_name, "upsert", tuple(columns), build_upsert_query, record_data)
+            saved_row = cursor.fetchone()
+
+            # Filter out columns ending with "password" and the inserted flag
+            column_names = [desc[0] for desc in cursor.description]
+            filtered_row = {col: value for col, value in zip(column_names, saved_row)
+                            if 'password' not in col.lower() and col != UPSERT_INSERTED_FLAG}
+            is_inserted = saved_row[column_names.index(UPSERT_INSERTED_FLAG)]
+
+            if is_json:
+                return filtered_row
+            else:
+                return ResponseCode.create_response("SAVE_SUCCESSFULLY" if is_inserted else "UPDATE_SUCCESSFULLY",
+                                                    extra_data={"result": filtered_row, "inserted": is_inserted})
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        debug_print("Failed to upsert record: {}".format(e))
+        raise e
 
 
 """
@@ -859,6 +1253,59 @@ def fetch_data_by_id(data, query, order_by=None,order_type='DESC'):
         raise e
 
 
+"""
+Function Name: get_stream_itersize
+Inputs: None
+Output: itersize (int): Rows fetched per round trip by the streaming (server-side) cursors.
+"""
+
+
+def get_stream_itersize():
+    config = open_read_file('resources', '', 'general') or {}
+    return int(config.get('stream_itersize', DEFAULT_STREAM_ITERSIZE))
+
+
+"""
+Function Name: iter_query_records
+Inputs:
+- query (str or sql.Composed): The SELECT query to run.
+- parameters (list/tuple/dict): Query parameters (optional).
+- itersize (int): Rows fetched from the server per round trip (optional, default from config).
+
+Output: generator of dicts, one per record, excluding password columns.
+
+Description:
+Runs the query on a named (server-side) cursor so only itersize rows are held in memory at a time.
+The connection is checked out when iteration starts and released when the generator is exhausted or closed.
+"""
+
+
+def iter_query_records(query, parameters=None, itersize=None):
+    if itersize is None:
+        itersize = get_stream_itersize()
+
+    try:
+        # The read transaction the named cursor lives in ends (rollback) when the generator is exhausted or closed
+        with db_session(readonly=True, name="stream_{}".format(uuid.uuid4().hex)) as cursor:
+            cursor.itersize = itersize
+            cursor.execute(query, parameters)
+
+            filtered_columns = None
+            for record in cursor:
+                if filtered_columns is None:
+                    # Filter out columns ending with "password"
+                    filtered_columns = [(i, desc[0]) for i, desc in enumerate(cursor.description)
+                                        if not desc[0].endswith("password")]
+                yield {col: record[i] for i, col in filtered_columns}
+
+            if filtered_columns is None:
+                logger.info("No record found")
+    except psycopg2.Error as e:
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        logger.error("Failed to stream records: {}".format(str(e)))
+        raise e
+
+
 """
 Function Name: fetch_record_with_query
 Inputs:
@@ -866,6 +1313,9 @@ Inputs:
 - criteria (dict): A dictionary containing the column-value pairs for the criteria (optional).
 - column_list(str): A string of comma seperated columns you want to select
 -query(string): A direct query
+- stream (bool): Stream the records through a server-side cursor instead of fetching them all (optional).
+- stream_format (str): "ndjson" or "json" when streaming.
+- itersize (int): Rows fetched per round trip when streaming (optional).
 Output: list or dict: The records fetched from the table.
 
 Description:
@@ -874,17 +1324,91 @@ fetches all records.
 """
 
 
-def fetch_record_with_query(table_name=None, column_list="*", criteria=None, query=None, module=None, card_column=None):
-    conn = None
-    cursor = None
-
+@log_db_call("select")
+def fetch_record_with_query(table_name=None, column_list="*", criteria=None, query=None, module=None, card_column=None,
+                            stream=False, stream_format="ndjson", itersize=None):
     check_table_query(table_name, query)
+
+    if stream and stream_format not in STREAM_FORMATS:
+        return ResponseCode.create_bad_request("Unsupported stream_format: {}".format(stream_format))
+
+    if query and stream:
+        records = stream_db_call(iter_query_records(query, None, itersize))
+        return ResponseCode.create_stream_response("SUCCESSFUL", records, stream_format,
+                                                   {"card_column": card_column})
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        if query:
-            cursor.execute(query)
+        with db_session(readonly=True) as cursor:
+            if query:
+                cursor.execute(query)
+                records = cursor.fetchall()
+                check_log_records(records)
+
+                # Fetch column names
+                column_names = [desc[0] for desc in cursor.description]
+
+                # Filter out columns ending with "password"
+                filtered_columns = [col for col in column_names if not col.endswith("password")]
+
+                # Convert the records to a list of dictionaries excluding password columns
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                ]
+
+                if records_list:
+                    return ResponseCode.create_response("SUCCESSFUL",
+                                                        {"result": records_list, "record_length": len(records_list),
+                                                         "card_column": card_column})
+                else:
+                    if module:
+                        extra_message = "Please add '{}' to move further.".format(module)
+                        return ResponseCode.create_response("NO_DATA_FOUND", extra_message=extra_message)
+                    else:
+                        return ResponseCode.create_response("NO_DATA_FOUND")
+                # return records_list
+
+            config = open_read_file('resources', '', 'general')
+            # Handle the column list
+            columns = handle_columns(column_list)
+            schema = config["schema"]
+            if criteria:
+                where_clauses = []
+                values = []
+
+                for key, value in criteria.items():
+                    if isinstance(value, list):
+                        placeholders = sql.SQL(', ').join(sql.Placeholder() * len(value))
+                        where_clauses.append(sql.SQL("{} IN ({})").format(sql.Identifier(key), placeholders))
+                        values.extend(value)
+                    else:
+                        where_clauses.append(sql.SQL("{} = {}").format(sql.Identifier(key), sql.Placeholder()))
+                        values.append(value)
+
+                where_clause = sql.SQL(" AND ").join(where_clauses)
+                query = sql.SQL("SELECT {} FROM {}.{} WHERE {}").format(
+                    columns,
+                    sql.Identifier(schema),
+                    sql.Identifier(table_name),
+                    where_clause
+                )
+            else:
+                values = None
+                query = sql.SQL("SELECT {} FROM {}.{}").format(
+                    columns,
+                    sql.Identifier(schema),
+                    sql.Identifier(table_name)
+                )
+
+            if stream:
+                records = stream_db_call(iter_query_records(query, values, itersize))
+                return ResponseCode.create_stream_response("SUCCESSFUL", records, stream_format,
+                                                           {"card_column": card_column})
+
+            # debug_print("fetch_record query:{}".format(query))
+            cursor.execute(query, values)
+
             records = cursor.fetchall()
+            # debug_print("fetch_record records:{}".format(records))
             check_log_records(records)
 
             # Fetch column names
@@ -909,86 +1433,16 @@ def fetch_record_with_query(table_name=None, column_list="*", criteria=None, que
                     return ResponseCode.create_response("NO_DATA_FOUND", extra_message=extra_message)
                 else:
                     return ResponseCode.create_response("NO_DATA_FOUND")
-            # return records_list
-
-        config = open_read_file('resources', '', 'general')
-        # Handle the column list
-        columns = handle_columns(column_list)
-        schema = config["schema"]
-        if criteria:
-            where_clauses = []
-            values = []
-
-            for key, value in criteria.items():
-                if isinstance(value, list):
-                    placeholders = sql.SQL(', ').join(sql.Placeholder() * len(value))
-                    where_clauses.append(sql.SQL("{} IN ({})").format(sql.Identifier(key), placeholders))
-                    values.extend(value)
-                else:
-                    where_clauses.append(sql.SQL("{} = {}").format(sql.Identifier(key), sql.Placeholder()))
-                    values.append(value)
-
-            where_clause = sql.SQL(" AND ").join(where_clauses)
-            query = sql.SQL("SELECT {} FROM {}.{} WHERE {}").format(
-                columns,
-                sql.Identifier(schema),
-                sql.Identifier(table_name),
-                where_clause
-            )
-            # debug_print("fetch_record if query:{}".format(query))
-            cursor.execute(query, values)
-        else:
-            query = sql.SQL("SELECT {} FROM {}.{}").format(
-                columns,
-                sql.Identifier(schema),
-                sql.Identifier(table_name)
-            )
-            # debug_print("fetch_record else query:{}".format(query))
-            cursor.execute(query)
-
-        records = cursor.fetchall()
-        # debug_print("fetch_record records:{}".format(records))
-        check_log_records(records)
-
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
-
-        # Filter out columns ending with "password"
-        filtered_columns = [col for col in column_names if not col.endswith("password")]
 
-        # Convert the records to a list of dictionaries excluding password columns
-        records_list = [
-            {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-            for record in records
-        ]
-
-        if records_list:
-            return ResponseCode.create_response("SUCCESSFUL",
-                                                {"result": records_list, "record_length": len(records_list),
-                                                 "card_column": card_column})
-        else:
-            if module:
-                extra_message = "Please add '{}' to move further.".format(module)
-                return ResponseCode.create_response("NO_DATA_FOUND", extra_message=extra_message)
-            else:
-                return ResponseCode.create_response("NO_DATA_FOUND")
-
-        # return records_list
+            # return records_list
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         logger.error(e)
         debug_print("Failed to fetch psycopg2 records: {}".format(e))
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to fetch Exception records: {}".format(e))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 def check_table_query(table, query):
@@ -1023,64 +1477,53 @@ fetches all records.
 """
 
 
+@log_db_call("select")
 def fetch_record(table_name, criteria=None):
-    conn = None
-    cursor = None
-
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        if criteria:
-            where_clauses = [sql.SQL("{key} = %s").format(key=sql.Identifier(k)) for k in criteria.keys()]
-            where_clause = sql.SQL(AND).join(where_clauses)
-            query = sql.SQL(
-                "SELECT * FROM public.{table} WHERE {where_clause}"
-            ).format(
-                table=sql.Identifier(table_name),
-                where_clause=where_clause
-            )
-            # debug_print("fetch_record : {}".format(cursor.mogrify(query, tuple(criteria.values())).decode('utf-8')))
-            cursor.execute(query, tuple(criteria.values()))
+        with db_session(readonly=True) as cursor:
+            if criteria:
+                where_clauses = [sql.SQL("{key} = %s").format(key=sql.Identifier(k)) for k in criteria.keys()]
+                where_clause = sql.SQL(AND).join(where_clauses)
+                query = sql.SQL(
+                    "SELECT * FROM public.{table} WHERE {where_clause}"
+                ).format(
+                    table=sql.Identifier(table_name),
+                    where_clause=where_clause
+                )
+                # debug_print("fetch_record : {}".format(cursor.mogrify(query, tuple(criteria.values())).decode('utf-8')))
+                cursor.execute(query, tuple(criteria.values()))
 
-        else:
-            query = sql.SQL("SELECT * FROM public.{table}").format(
-                table=sql.Identifier(table_name)
-            )
-            cursor.execute(query)
+            else:
+                query = sql.SQL("SELECT * FROM public.{table}").format(
+                    table=sql.Identifier(table_name)
+                )
+                cursor.execute(query)
 
-        records = cursor.fetchall()
-        if not records:
-            logger.info("No record found")
-            return ResponseCode.create_response("NO_DATA_FOUND")
+            records = cursor.fetchall()
+            if not records:
+                logger.info("No record found")
+                return ResponseCode.create_response("NO_DATA_FOUND")
 
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
+            # Fetch column names
+            column_names = [desc[0] for desc in cursor.description]
 
-        # Filter out columns ending with "password"
-        filtered_columns = [col for col in column_names if not col.endswith("password")]
+            # Filter out columns ending with "password"
+            filtered_columns = [col for col in column_names if not col.endswith("password")]
 
-        # Convert the records to a list of dictionaries excluding password columns
-        records_list = [
-            {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-            for record in records
-        ]
+            # Convert the records to a list of dictionaries excluding password columns
+            records_list = [
+                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                for record in records
+            ]
 
-        return records_list
+            return records_list
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
     except Exception as e:
-        if conn:
-            conn.rollback()
         traceback.print_exc()  # This will print the full traceback, including the line number
         debug_print("Failed to fetch records: {}".format(str(e)))
         raise e
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
 
 
 """
@@ -1097,10 +1540,9 @@ def fetch_record(table_name, criteria=None):
 """
 
 
+@log_db_call("search")
 def fetch_record_search_json(table_name, search_value=None, column_filters=None, operand=None, parent_call=None,
                              query=None):
-    conn = None
-    cursor = None
     operand_value = None
 
     # debug_print("fetch_record_search_json: query{}".format(query))
@@ -1112,16 +1554,88 @@ def fetch_record_search_json(table_name, search_value=None, column_filters=None,
 
     try:
 
-        conn = get_connection()
-        cursor = conn.cursor()
+        with db_session(readonly=True) as cursor:
+            if query:
+                # debug_print(cursor.mogrify(query).decode('utf-8'))
+                # formatted_query = sqlparse.format(query, reindent=True, keyword_case='upper')
+                # debug_print(query)
+                cursor.execute(query)
+                records = cursor.fetchall()
+                check_log_records(records)
+
+                # Fetch column names
+                column_names = [desc[0] for desc in cursor.description]
+
+                # Filter out columns ending with "password"
+                filtered_columns = [col for col in column_names if not col.endswith("password")]
+
+                # Convert the records to a list of dictionaries excluding password columns
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                ]
+                return records_list
+
+            if not search_value and not column_filters:
+                query = sql.SQL("SELECT * FROM {}").format(
+                    sql.Identifier(table_name)
+                )
+                cursor.execute(query)
+                records = cursor.fetchall()
+
+                # Fetch column names
+                column_names = [desc[0] for desc in cursor.description]
+
+                # Filter out columns ending with "password"
+                filtered_columns = [col for col in column_names if not col.endswith("password")]
+
+                # Convert the records to a list of dictionaries excluding password columns
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                ]
+
+                return records_list
+
+            # Get the columns of the table
+            columns = get_schema_columns(table_name, cursor)
+
+            # Prepare the query to search across all columns or specific column-value pairs
+            search_condition = None
+            filter_conditions = []
+            parameters = []
+
+            if search_value:
+                # Uses the table's search index when it has one, the ILIKE scan otherwise
+                search_condition, search_parameters = build_search_condition(table_name, columns, search_value,
+                                                                             " OR ", cursor)
+                parameters.extend(search_parameters)
+
+            if column_filters:
+                filter_conditions = [
+                    sql.SQL("{} = %s").format(sql.Identifier(col)) for col in column_filters.keys()
+                ]
+                parameters.extend(column_filters.values())
+
+            # Combine conditions
+            combined_conditions = []
+            if search_condition:
+                combined_conditions.append(search_condition)
+            if filter_conditions:
+                combined_conditions.extend(filter_conditions)
+
+            # Prepare the final query
+            query = sql.SQL("SELECT * FROM {} WHERE {}").format(
+                sql.Identifier(table_name),
+                sql.SQL(operand_value).join(combined_conditions)
+            )
 
-        if query:
-            # debug_print(cursor.mogrify(query).decode('utf-8'))
-            # formatted_query = sqlparse.format(query, reindent=True, keyword_case='upper')
-            # debug_print(query)
-            cursor.execute(query)
+            # debug_print(query.as_string(conn))  # Print the query for debugging
+            # debug_print(parameters)  # Print the parameters for debugging
+
+            # Execute the query
+            cursor.execute(query, parameters)
             records = cursor.fetchall()
-            check_log_records(records)
 
             # Fetch column names
             column_names = [desc[0] for desc in cursor.description]
@@ -1130,109 +1644,176 @@ def fetch_record_search_json(table_name, search_value=None, column_filters=None,
             filtered_columns = [col for col in column_names if not col.endswith("password")]
 
             # Convert the records to a list of dictionaries excluding password columns
-            records_list = [
-                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-                for record in records
-            ]
+            if parent_call:
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                    if parent_call and record[column_names.index(parent_call)] != False
+                    # if record[column_names.index("product_active_status")] != False
+                ]
+            else:
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                ]
+
             return records_list
+    except psycopg2.Error as e:
+        debug_print("An psycopg2 error occurred: {}".format(str(e)))
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        return handle_database_exception(e)
+    except Exception as e:
+        debug_print("An error occurred: {}".format(str(e)))
+        traceback.print_exc()  # This will print the full traceback, including the line number
+        raise e
 
-        if not search_value and not column_filters:
-            query = sql.SQL("SELECT * FROM {}").format(
-                sql.Identifier(table_name)
-            )
-            cursor.execute(query)
-            records = cursor.fetchall()
 
-            # Fetch column names
-            column_names = [desc[0] for desc in cursor.description]
+"""
+Function Name: get_continuation_token_secret
+Inputs: None
+Output: bytes: Key the continuation tokens are signed with, 'continuation_token_secret' of the general config.
 
-            # Filter out columns ending with "password"
-            filtered_columns = [col for col in column_names if not col.endswith("password")]
+Description:
+Without the setting a random key is made per process, so tokens only work on the worker that issued them.
+"""
 
-            # Convert the records to a list of dictionaries excluding password columns
-            records_list = [
-                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-                for record in records
-            ]
 
-            return records_list
+def get_continuation_token_secret():
+    global _continuation_token_secret
+    if _continuation_token_secret is None:
+        config = open_read_file('resources', '', 'general') or {}
+        secret = config.get('continuation_token_secret')
+        if secret:
+            _continuation_token_secret = secret.encode('utf-8')
+        else:
+            logger.warning("continuation_token_secret is not configured, continuation tokens are per process")
+            _continuation_token_secret = secrets.token_bytes(32)
+    return _continuation_token_secret
 
-        # Get the columns of the table
-        columns = get_schema_columns(table_name, cursor)
 
-        # Prepare the query to search across all columns or specific column-value pairs
-        ilike_conditions = []
-        filter_conditions = []
-        parameters = []
+"""
+Function Name: hash_search_filters
+Inputs: filter_key (str): Normalized filter set (normalize_count_filters).
+Output: str: Digest of the filters, stored in the continuation token.
+"""
 
-        if search_value:
-            ilike_conditions = [
-                sql.SQL("{}::text ILIKE %s").format(sql.Identifier(col)) for col in columns
-            ]
-            parameters.extend(["%" + search_value + "%"] * len(columns))
 
-        if column_filters:
-            filter_conditions = [
-                sql.SQL("{} = %s").format(sql.Identifier(col)) for col in column_filters.keys()
-            ]
-            parameters.extend(column_filters.values())
+def hash_search_filters(filter_key):
+    return hashlib.sha256(filter_key.encode('utf-8')).hexdigest()
 
-        # Combine conditions
-        combined_conditions = []
-        if ilike_conditions:
-            combined_conditions.append(sql.SQL("({})").format(sql.SQL(" OR ").join(ilike_conditions)))
-        if filter_conditions:
-            combined_conditions.extend(filter_conditions)
 
-        # Prepare the final query
-        query = sql.SQL("SELECT * FROM {} WHERE {}").format(
-            sql.Identifier(table_name),
-            sql.SQL(operand_value).join(combined_conditions)
-        )
+"""
+Function Name: encode_continuation_token
+Inputs:
+- state (dict): Keyset pagination state (table, filter digest, last seen row id, direction, row id bounds, total).
 
-        # debug_print(query.as_string(conn))  # Print the query for debugging
-        # debug_print(parameters)  # Print the parameters for debugging
+Output: str: Opaque, URL safe continuation token, <payload>.<HMAC-SHA256 signature>.
+"""
 
-        # Execute the query
-        cursor.execute(query, parameters)
-        records = cursor.fetchall()
 
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
+def encode_continuation_token(state):
+    payload = base64.urlsafe_b64encode(json.dumps(state, default=str).encode('utf-8'))
+    signature = base64.urlsafe_b64encode(
+        hmac.new(get_continuation_token_secret(), payload, hashlib.sha256).digest())
+    return (payload + b"." + signature).decode('ascii')
 
-        # Filter out columns ending with "password"
-        filtered_columns = [col for col in column_names if not col.endswith("password")]
 
-        # Convert the records to a list of dictionaries excluding password columns
-        if parent_call:
-            records_list = [
-                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-                for record in records
-                if parent_call and record[column_names.index(parent_call)] != False
-                # if record[column_names.index("product_active_status")] != False
-            ]
-        else:
-            records_list = [
-                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-                for record in records
-            ]
+"""
+Function Name: decode_continuation_token
+Inputs:
+- token (str): Token returned by a previous keyset page.
 
-        return records_list
+Output: dict: The keyset pagination state stored in the token.
+
+Description:
+Raises ValueError when the token cannot be decoded, its signature does not match or its state is not valid.
+"""
+
+
+def decode_continuation_token(token):
+    try:
+        payload, signature = token.encode('ascii').split(b".", 1)
+        expected = base64.urlsafe_b64encode(
+            hmac.new(get_continuation_token_secret(), payload, hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            raise ValueError("signature mismatch")
+        state = json.loads(base64.urlsafe_b64decode(payload).decode('utf-8'))
+    except Exception:
+        raise ValueError("Invalid continuation token.")
+
+    if not isinstance(state, dict) or "last" not in state or state.get("dir") not in ORDER_DIRECTIONS:
+        raise ValueError("Invalid continuation token.")
+    return state
+
+
+"""
+Function Name: get_approximate_count
+Inputs:
+- cursor: Open cursor to run the estimate on.
+- estimate_query (sql.Composed): The filtered query without the count(*), e.g. SELECT 1 FROM t WHERE ...
+- parameters (list): Parameters of the query.
+
+Output: int: Planner estimate of the rows the query returns.
+
+Description:
+Reads the row estimate of the top plan node of EXPLAIN. The count(*) query itself is not explained: its plan
+on a large table is Finalize Aggregate -> Gather -> Partial Aggregate, whose inner nodes estimate per worker.
+"""
 
-    except psycopg2.Error as e:
-        debug_print("An psycopg2 error occurred: {}".format(str(e)))
-        traceback.print_exc()  # This will print the full traceback, including the line number
-        return handle_database_exception(e)
-    except Exception as e:
-        debug_print("An error occurred: {}".format(str(e)))
-        traceback.print_exc()  # This will print the full traceback, including the line number
-        raise e
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
+def get_approximate_count(cursor, estimate_query, parameters=None):
+    with helper_statement():
+        cursor.execute(sql.SQL("EXPLAIN (FORMAT JSON) ") + estimate_query, parameters)
+    explain = cursor.fetchone()[0]
+    if isinstance(explain, str):
+        explain = json.loads(explain)
+    return int(explain[0]["Plan"]["Plan Rows"])
+
+
+"""
+Function Name: get_search_count
+Inputs:
+- cursor: Open cursor to run the count on.
+- table_name (str): The table being counted.
+- count_query (sql.Composed): The filtered count query.
+- parameters (list): Parameters of the count query.
+- count_strategy (str): "exact", "cached" or "approximate".
+- filter_key (str): Normalized filter set, used as the cache key in "cached" mode.
+- estimate_query (sql.Composed): count_query without the count(*), explained in "approximate" mode.
+- approximate_threshold (int): Estimates below this are replaced by an exact count.
+
+Output: (count, mode): The total and the mode that produced it ("exact", "cached" or "approximate").
+
+Description:
+"cached" reuses the count of the same filter set until the count cache TTL runs out, or a write to the table
+is committed.
+"approximate" trusts the planner for large results only, small counts are cheap and their estimates unreliable.
+"""
+
+
+def get_search_count(cursor, table_name, count_query, parameters, count_strategy="exact", filter_key=None,
+                     estimate_query=None, approximate_threshold=DEFAULT_APPROXIMATE_COUNT_THRESHOLD):
+    if count_strategy == "cached":
+        record_count = get_cached_count(table_name, filter_key)
+        if record_count is not None:
+            return record_count, "cached"
+
+    elif count_strategy == "approximate":
+        if estimate_query is not None:
+            estimate = get_approximate_count(cursor, estimate_query, parameters)
+            if estimate >= approximate_threshold:
+                return estimate, "approximate"
+
+    elif count_strategy != "exact":
+        raise ValueError("Unsupported count strategy: {}".format(count_strategy))
+
+    with helper_statement():
+        cursor.execute(count_query, parameters)
+    record_count = cursor.fetchone()[0]
+
+    if count_strategy == "cached":
+        set_cached_count(table_name, filter_key, record_count)
+    return record_count, "exact"
 
 
 """
@@ -1243,234 +1824,351 @@ def fetch_record_search_json(table_name, search_value=None, column_filters=None,
         table_name (str): The name of the table to search.
         search_value (str): The value to search for across all columns.
         column_filters (dict): A dictionary of column-value pairs to filter by.
+        stream (bool): Stream the matching records through a server-side cursor instead of fetching
+            them all. The count and rowid range queries are skipped in this mode.
+        stream_format (str): "ndjson" or "json" when streaming.
+        itersize (int): Rows fetched per round trip when streaming.
+        pagination_mode (str): "offset" (default) pages with LIMIT/OFFSET, "keyset" seeks on the
+            row id column (WHERE rowid > last_seen ORDER BY rowid LIMIT n). Not supported with stream.
+        continuation_token (str): Token returned by the previous keyset page. Implies keyset mode and
+            reuses the total and row id range of the first page instead of querying them again.
+        count_strategy (str): How total_length is produced, "exact", "cached" or "approximate"
+            (default from 'count_strategy' in the general config). The response reports the mode
+            used in total_length_mode.
 
     Returns:
         list: A list of records that match the search criteria.
 """
 
 
+@log_db_call("search")
 def fetch_record_search(table_name, search_value=None, column_filters=None, column_in_filters=None, operand=None,
                         parent_call=None, range_filter=None, order_filter=None, result_card=None,
-                        payload_data=None, module_id=None):
-    conn = None
-    cursor = None
+                        payload_data=None, module_id=None, stream=False, stream_format="ndjson", itersize=None,
+                        pagination_mode=None, continuation_token=None, count_strategy=None):
     limit = None
+    start = None
     order_by = None
     order_direction = None
     range_start = None
     range_end = None
+    total_length = None
+    token_state = None
     resource_list = open_read_file('resources', '', 'general')
     row_id_column = resource_list['row_id_column']
+    if not count_strategy:
+        count_strategy = resource_list.get('count_strategy', 'exact')
+    is_keyset = pagination_mode == "keyset" or continuation_token is not None
     if operand:
         operand_value = operand
     else:
         operand_value = AND
+    if stream and stream_format not in STREAM_FORMATS:
+        return ResponseCode.create_bad_request("Unsupported stream_format: {}".format(stream_format))
+    # A stream has no place for the token of the next page, streams return every matching record instead
+    if stream and is_keyset:
+        return ResponseCode.create_bad_request("Keyset pagination is not supported for streamed responses.")
+
+    filter_key = normalize_count_filters(search_value=search_value, column_filters=column_filters,
+                                         column_in_filters=column_in_filters, operand=operand_value,
+                                         parent_call=parent_call)
+    if continuation_token:
+        try:
+            token_state = decode_continuation_token(continuation_token)
+        except ValueError as e:
+            return ResponseCode.create_bad_request(str(e))
+        if token_state.get("table") != table_name:
+            return ResponseCode.create_bad_request(
+                "Continuation token does not belong to table {}.".format(table_name))
+        # The total and row id range in the token are only valid for the filters of the first page
+        if token_state.get("filters") != hash_search_filters(filter_key):
+            return ResponseCode.create_bad_request("Continuation token was issued for other filters.")
+
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        if not search_value and not column_filters and not column_in_filters:
-            query = sql.SQL("SELECT * FROM {}").format(
-                sql.Identifier(table_name)
-            )
-            cursor.execute(query)
-            records = cursor.fetchall()
+        with db_session(readonly=True) as cursor:
+            # Unfiltered streams go through the paged query below, so range / order / keyset still apply
+            if not search_value and not column_filters and not column_in_filters and not stream:
+                query = sql.SQL("SELECT * FROM {}").format(
+                    sql.Identifier(table_name)
+                )
+                cursor.execute(query)
+                records = cursor.fetchall()
 
-            # Fetch column names
-            column_names = [desc[0] for desc in cursor.description]
+                # Fetch column names
+                column_names = [desc[0] for desc in cursor.description]
 
-            # Filter out columns ending with "password"
-            filtered_columns = [col for col in column_names if not col.endswith("password")]
+                # Filter out columns ending with "password"
+                filtered_columns = [col for col in column_names if not col.endswith("password")]
 
-            # Convert the records to a list of dictionaries excluding password columns
-            records_list = [
-                {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-                for record in records
-            ]
+                # Convert the records to a list of dictionaries excluding password columns
+                records_list = [
+                    {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                    for record in records
+                ]
 
-            if records_list:
-                return ResponseCode.create_response("SUCCESSFUL",
-                                                    {"result": records_list, "record_length": len(records_list)})
-            else:
-                return ResponseCode.create_response("NO_DATA_FOUND")
+                if records_list:
+                    return ResponseCode.create_response("SUCCESSFUL",
+                                                        {"result": records_list, "record_length": len(records_list)})
+                else:
+                    return ResponseCode.create_response("NO_DATA_FOUND")
 
-        if range_filter and order_filter:
-            # Unpack range_filter for start and end
-            start = range_filter.get(resource_list['start_param'])
-            record_size = range_filter.get(resource_list['record_size_param'])
-            end = start + record_size
-            limit = record_size
-            # Unpack order_filter for ordering
-            range_start = range_filter.get(resource_list['range_start_param'])
-            range_end = range_filter.get(resource_list['range_end_param'])
-            total_length = range_filter.get(resource_list['total_length_param'])
-            order_by = order_filter.get(resource_list['order_by_param'], None)
-            order_direction = order_filter.get(resource_list['order_direction_param'], "ASC").upper()
-
-        # Get the columns of the table
-        columns = get_schema_columns(table_name, cursor)
-
-        # debug_print("columns:{}".format(columns))
-
-        # Prepare the query to search across all columns or specific column-value pairs
-        ilike_conditions = []
-        filter_conditions = []
-        parameters = []
-
-        if search_value:
-            # debug_print("search_value:{}".format(search_value))
-            ilike_conditions = [
-                sql.SQL("{}::text ILIKE %s").format(sql.Identifier(col)) for col in columns
-            ]
-            parameters.extend(["%" + search_value + "%"] * len(columns))
+            if range_filter and order_filter:
+                # Unpack range_filter for start and end
+                start = range_filter.get(resource_list['start_param'])
+                record_size = range_filter.get(resource_list['record_size_param'])
+                end = start + record_size
+                limit = record_size
+                # Unpack order_filter for ordering
+                range_start = range_filter.get(resource_list['range_start_param'])
+                range_end = range_filter.get(resource_list['range_end_param'])
+                total_length = range_filter.get(resource_list['total_length_param'])
+                order_by = order_filter.get(resource_list['order_by_param'], None)
+                order_direction = str(order_filter.get(resource_list['order_direction_param'], "ASC")).upper()
+                if order_direction not in ORDER_DIRECTIONS:
+                    return ResponseCode.create_bad_request("Unsupported order direction: {}".format(order_direction))
+
+            if is_keyset:
+                # Keyset pages always walk the row id column, in the direction of the first page
+                if token_state:
+                    order_direction = token_state["dir"]
+                elif order_direction != "DESC":
+                    order_direction = "ASC"
+                order_by = row_id_column
+                if limit is None:
+                    limit = int(resource_list.get('keyset_page_size', DEFAULT_KEYSET_PAGE_SIZE))
+
+            # Get the columns of the table
+            columns = get_schema_columns(table_name, cursor)
+
+            # debug_print("columns:{}".format(columns))
+
+            # Prepare the query to search across all columns or specific column-value pairs
+            search_condition = None
+            filter_conditions = []
+            parameters = []
+
+            if search_value:
+                # debug_print("search_value:{}".format(search_value))
+                # Uses the table's search index when it has one, the ILIKE scan otherwise
+                search_condition, search_parameters = build_search_condition(table_name, columns, search_value,
+                                                                             operand_value, cursor)
+                parameters.extend(search_parameters)
+
+            if column_filters:
+                # debug_print("column_filters:{}".format(column_filters))
+                filter_conditions = [
+                    sql.SQL("{} = %s").format(sql.Identifier(col)) for col in column_filters.keys()
+                ]
+                parameters.extend(column_filters.values())
+
+            if column_in_filters:
+                # debug_print("column_in_filters:{}".format(column_in_filters))
+                # if filter_conditions
+                # 13/01/25 Modified to get the names instead of query id when returning the result
+                if payload_data and not payload_data.get('create_search_cards'):
+                    filter_conditions.extend(
+                        [sql.SQL("{} in %s").format(
+                            sql.SQL("{0}.{1}").format(sql.Identifier('d'), sql.Identifier('product_id'))
+                            if col == 'product_id' else sql.Identifier(col)
+                        ) for col in column_in_filters.keys()]
+                    )
+                else:
+                    # if filter_conditions
+                    filter_conditions.extend(
+                        [sql.SQL("{} in %s").format(sql.Identifier(col)) for col in column_in_filters.keys()]
+                    )
+                # debug_print("asdasdasd after:{}".format(sql.SQL("{0}.{1}").format(
+                #     sql.Identifier('d'),
+                #     sql.Identifier('product_id')
+                # )))
+                # debug_print("column_in_filters after:{}".format(filter_conditions))
+                parameters.extend(column_in_filters.values())
+
+            # Combine conditions
+            combined_conditions = []
+            if search_condition:
+                combined_conditions.append(search_condition)
+            if filter_conditions:
+                combined_conditions.extend(filter_conditions)
+
+            debug_print("combined_conditions:{}".format(combined_conditions))
+
+            # Only an unfiltered stream gets here without a condition
+            where_conditions = combined_conditions or [sql.SQL("TRUE")]
+
+            # Prepare count query to get total records without limit/offset
+            count_query = sql.SQL("SELECT count(*) FROM {} d WHERE ({})").format(
+                sql.Identifier(table_name),
+                sql.SQL(operand_value).join(where_conditions)
+            )
 
-        if column_filters:
-            # debug_print("column_filters:{}".format(column_filters))
-            filter_conditions = [
-                sql.SQL("{} = %s").format(sql.Identifier(col)) for col in column_filters.keys()
-            ]
-            parameters.extend(column_filters.values())
+            # Same rows without the aggregate, explained by the "approximate" count strategy
+            estimate_query = sql.SQL("SELECT 1 FROM {} d WHERE ({})").format(
+                sql.Identifier(table_name),
+                sql.SQL(operand_value).join(where_conditions)
+            )
 
-        if column_in_filters:
-            # debug_print("column_in_filters:{}".format(column_in_filters))
-            # if filter_conditions
+            # Prepare min/max rowid query (before applying LIMIT)
+            rowid_range_query = sql.SQL("SELECT MIN(rowid), MAX(rowid) FROM {} d WHERE ({})").format(
+                sql.Identifier(table_name),
+                sql.SQL(operand_value).join(where_conditions)
+            )
+
+            # Prepare the final query
+            search_device_query = resource_list['search_device_query']
             # 13/01/25 Modified to get the names instead of query id when returning the result
             if payload_data and not payload_data.get('create_search_cards'):
-                filter_conditions.extend(
-                    [sql.SQL("{} in %s").format(
-                        sql.SQL("{0}.{1}").format(sql.Identifier('d'), sql.Identifier('product_id'))
-                        if col == 'product_id' else sql.Identifier(col)
-                    ) for col in column_in_filters.keys()]
+                search_device_query_select = search_device_query.get(module_id + "_select")
+                # debug_print("search_device_query: {}".format(search_device_query_select))
+                query = sql.SQL(search_device_query_select + " AND ({})").format(
+                    sql.SQL(operand_value).join(where_conditions)
                 )
             else:
-                # if filter_conditions
-                filter_conditions.extend(
-                    [sql.SQL("{} in %s").format(sql.Identifier(col)) for col in column_in_filters.keys()]
+                query = sql.SQL("SELECT * FROM {} WHERE ({})").format(
+                    sql.Identifier(table_name),
+                    sql.SQL(operand_value).join(where_conditions)
                 )
-            # debug_print("asdasdasd after:{}".format(sql.SQL("{0}.{1}").format(
-            #     sql.Identifier('d'),
-            #     sql.Identifier('product_id')
-            # )))
-            # debug_print("column_in_filters after:{}".format(filter_conditions))
-            parameters.extend(column_in_filters.values())
-
-        # Combine conditions
-        combined_conditions = []
-        if ilike_conditions:
-            combined_conditions.append(sql.SQL("({})").format(sql.SQL(operand_value).join(ilike_conditions)))
-        if filter_conditions:
-            combined_conditions.extend(filter_conditions)
-
-        debug_print("combined_conditions:{}".format(combined_conditions))
-
-        # Prepare count query to get total records without limit/offset
-        count_query = sql.SQL("SELECT count(*) FROM {} d WHERE ({})").format(
-            sql.Identifier(table_name),
-            sql.SQL(operand_value).join(combined_conditions)
-        )
-
-        # Prepare min/max rowid query (before applying LIMIT)
-        rowid_range_query = sql.SQL("SELECT MIN(rowid), MAX(rowid) FROM {} d WHERE ({})").format(
-            sql.Identifier(table_name),
-            sql.SQL(operand_value).join(combined_conditions)
-        )
-
-        # Prepare the final query
-        search_device_query = resource_list['search_device_query']
-        # 13/01/25 Modified to get the names instead of query id when returning the result
-        if payload_data and not payload_data.get('create_search_cards'):
-            search_device_query_select = search_device_query.get(module_id + "_select")
-            # debug_print("search_device_query: {}".format(search_device_query_select))
-            query = sql.SQL(search_device_query_select + " AND ({})").format(
-                sql.SQL(operand_value).join(combined_conditions)
-            )
-        else:
-            query = sql.SQL("SELECT * FROM {} WHERE ({})").format(
-                sql.Identifier(table_name),
-                sql.SQL(operand_value).join(combined_conditions)
-            )
-
-        if parent_call:
-            query += sql.SQL(" AND {} != False").format(sql.Identifier(parent_call))
-            count_query += sql.SQL(" AND {} != False").format(sql.Identifier(parent_call))
 
-        debug_print("rowid_range_query: {}".format(rowid_range_query))
-        debug_print(cursor.mogrify(rowid_range_query, parameters).decode('utf-8'))
-        cursor.execute(rowid_range_query, parameters)
-        rowid_range = cursor.fetchone()
-        min_rowid, max_rowid = rowid_range[0], rowid_range[1]
+            if parent_call:
+                query += sql.SQL(" AND {} != False").format(sql.Identifier(parent_call))
+                count_query += sql.SQL(" AND {} != False").format(sql.Identifier(parent_call))
+                estimate_query += sql.SQL(" AND {} != False").format(sql.Identifier(parent_call))
+
+            if token_state:
+                # Follow-up keyset page, the range was fixed by the first page
+                min_rowid, max_rowid = token_state.get("min"), token_state.get("max")
+            elif not stream:
+                debug_print("rowid_range_query: {}".format(rowid_range_query))
+                debug_print(cursor.mogrify(rowid_range_query, parameters).decode('utf-8'))
+                with helper_statement():
+                    cursor.execute(rowid_range_query, parameters)
+                rowid_range = cursor.fetchone()
+                min_rowid, max_rowid = rowid_range[0], rowid_range[1]
+
+            # debug_print(f"Min RowID: {min_rowid}, Max RowID: {max_rowid}")
+
+            # The count query only takes the filter parameters, not the range or seek ones added below
+            count_parameters = list(parameters)
+
+            if is_keyset:
+                # Keep the pages on the snapshot of the first page, rows inserted later are not returned
+                if max_rowid is not None:
+                    query += sql.SQL(" AND {} <= %s").format(sql.Identifier(row_id_column))
+                    parameters.append(max_rowid)
+                # Seek past the last row of the previous page
+                if token_state:
+                    seek_operator = "<" if order_direction == "DESC" else ">"
+                    query += sql.SQL(" AND {} {} %s").format(sql.Identifier(row_id_column), sql.SQL(seek_operator))
+                    parameters.append(token_state["last"])
+            elif range_start is not None and range_end is not None:
+                if order_direction == "ASC":
+                    query += sql.SQL(" AND rowid <= %s")
+                    #count_query += sql.SQL(" AND rowid <= %s")
+                    parameters.append(range_end)
+                else:
+                    query += sql.SQL(" AND rowid <= %s")
+                    #count_query += sql.SQL(" AND rowid <= %s")
+                    parameters.append(range_start)
 
-        # debug_print(f"Min RowID: {min_rowid}, Max RowID: {max_rowid}")
+                    # Execute rowid range query to get min(rowid) and max(rowid)
 
-        if range_start is not None and range_end is not None:
-            if order_direction == "ASC":
-                query += sql.SQL(" AND rowid <= %s")
-                #count_query += sql.SQL(" AND rowid <= %s")
-                parameters.append(range_end)
+            # 13/01/25 Modified to get the names instead of query id when returning the result
+            if payload_data and not payload_data.get('create_search_cards'):
+                search_device_query_group_by = search_device_query.get(module_id + "_group_by")
+                # debug_print("search_device_query_group_by : {}".format(search_device_query_group_by))
+                query = query + sql.SQL(search_device_query_group_by)
+                # debug_print("Final Query : {}".format(query))
+
+            # Apply ordering if provided
+            if order_by:
+                query += sql.SQL(" ORDER BY {} {}").format(sql.Identifier(order_by), sql.SQL(order_direction))
+
+            # Streaming returns every matching record (or the requested page) without counting them
+            if stream:
+                if limit is not None:
+                    query += sql.SQL(" LIMIT %s OFFSET %s")
+                    parameters.extend([limit, start])
+                records = stream_db_call(iter_query_records(query, parameters, itersize))
+                return ResponseCode.create_stream_response("SUCCESSFUL", records, stream_format,
+                                                           {"result_card": result_card})
+
+            # Execute count query
+            if token_state and token_state.get("total") is not None:
+                record_count = token_state["total"]
+                count_mode = token_state.get("count_mode", "exact")
+            elif total_length is not None:
+                record_count = total_length
+                count_mode = "client"
             else:
-                query += sql.SQL(" AND rowid <= %s")
-                #count_query += sql.SQL(" AND rowid <= %s")
-                parameters.append(range_start)
+                record_count, count_mode = get_search_count(
+                    cursor, table_name, count_query, count_parameters, count_strategy, filter_key,
+                    estimate_query=estimate_query,
+                    approximate_threshold=int(resource_list.get('approximate_count_threshold',
+                                                                DEFAULT_APPROXIMATE_COUNT_THRESHOLD))
+                )
 
-                # Execute rowid range query to get min(rowid) and max(rowid)
+            # Apply limit and offset if provided
+            if is_keyset:
+                query += sql.SQL(" LIMIT %s")
+                parameters.append(limit)
+            elif limit is not None:
+                query += sql.SQL(" LIMIT %s OFFSET %s")
+                parameters.extend([limit, start])
 
-        # 13/01/25 Modified to get the names instead of query id when returning the result
-        if payload_data and not payload_data.get('create_search_cards'):
-            search_device_query_group_by = search_device_query.get(module_id + "_group_by")
-            # debug_print("search_device_query_group_by : {}".format(search_device_query_group_by))
-            query = query + sql.SQL(search_device_query_group_by)
-            # debug_print("Final Query : {}".format(query))
+            # debug_print(query.as_string(conn))  # Print the query for debugging
+            # debug_print(parameters)  # Print the parameters for debugging
 
-        # Apply ordering if provided
-        if order_by:
-            query += sql.SQL(" ORDER BY {} {}").format(sql.Identifier(order_by), sql.SQL(order_direction))
+            cursor.execute(query, parameters)
 
-        # Execute count query
-        if total_length is not None:
-            record_count = total_length
-        else:
-            cursor.execute(count_query, parameters)
-            record_count = cursor.fetchone()[0]
-
-        # Apply limit and offset if provided
-        if limit is not None:
-            query += sql.SQL(" LIMIT %s OFFSET %s")
-            parameters.extend([limit, start])
-
-        # debug_print(query.as_string(conn))  # Print the query for debugging
-        # debug_print(parameters)  # Print the parameters for debugging
-
-        cursor.execute(query, parameters)
-
-        debug_print("in the else portion: {}".format(cursor.mogrify(query, parameters).decode('utf-8')))
-
-        records = cursor.fetchall()
-        # Fetch column names
-        column_names = [desc[0] for desc in cursor.description]
-        # Filter out columns ending with "password"
-        filtered_columns = [col for col in column_names if not col.endswith("password")]
-
-        # Convert records to a list of dictionaries excluding password columns
-        records_list = []
-
-        for idx, record in enumerate(records):
-            record_dict = {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
-            records_list.append(record_dict)
-
-        if order_direction == 'DESC':
-            start_range = max_rowid  # In DESC, start is the maximum rowId
-            end_range = min_rowid  # In DESC, end is the minimum rowId
-        else:  # For ASC or any other cases, default to ascending logic
-            start_range = min_rowid  # In ASC, start is the minimum rowId
-            end_range = max_rowid  # In ASC, end is the maximum rowId
-
-        if records_list:
-            return ResponseCode.create_response("SUCCESSFUL", {
-                "record_length": len(records_list), "total_length": record_count,
-                "range_start": start_range,
-                "range_end": end_range, "result": records_list, "result_card": result_card
-            })
-        else:
-            return ResponseCode.create_response("NO_DATA_FOUND")
+            debug_print("in the else portion: {}".format(cursor.mogrify(query, parameters).decode('utf-8')))
+
+            records = cursor.fetchall()
+            # Fetch column names
+            column_names = [desc[0] for desc in cursor.description]
+            # Filter out columns ending with "password"
+            filtered_columns = [col for col in column_names if not col.endswith("password")]
+
+            # Convert records to a list of dictionaries excluding password columns
+            records_list = []
+
+            for idx, record in enumerate(records):
+                record_dict = {col: record[i] for i, col in enumerate(column_names) if col in filtered_columns}
+                records_list.append(record_dict)
+
+            if order_direction == 'DESC':
+                start_range = max_rowid  # In DESC, start is the maximum rowId
+                end_range = min_rowid  # In DESC, end is the minimum rowId
+            else:  # For ASC or any other cases, default to ascending logic
+                start_range = min_rowid  # In ASC, start is the minimum rowId
+                end_range = max_rowid  # In ASC, end is the maximum rowId
+
+            # A full keyset page means there may be more, hand out the token for the next one
+            next_token = None
+            if is_keyset and records and len(records) >= limit:
+                if row_id_column not in column_names:
+                    raise ValueError("Keyset pagination needs '{}' in the selected columns.".format(row_id_column))
+                next_token = encode_continuation_token({
+                    "table": table_name,
+                    "filters": hash_search_filters(filter_key),
+                    "last": records[-1][column_names.index(row_id_column)],
+                    "dir": order_direction,
+                    "min": min_rowid,
+                    "max": max_rowid,
+                    "total": record_count,
+                    "count_mode": count_mode
+                })
+
+            if records_list:
+                response_data = {
+                    "record_length": len(records_list), "total_length": record_count,
+                    "total_length_mode": count_mode, "range_start": start_range,
+                    "range_end": end_range, "result": records_list, "result_card": result_card
+                }
+                if is_keyset:
+                    response_data["continuation_token"] = next_token
+                return ResponseCode.create_response("SUCCESSFUL", response_data)
+            else:
+                return ResponseCode.create_response("NO_DATA_FOUND")
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
@@ -1480,12 +2178,6 @@ def fetch_record_search(table_name, search_value=None, column_filters=None, colu
         traceback.print_exc()
         raise e
 
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
-
 
 def get_record_client(products: list):
     try:
@@ -1500,20 +2192,15 @@ def get_record_client(products: list):
 
 
 def validate_payload_with_schema(data, table_name, cur=None):
-    con = None
-    is_new_cur = False
     try:
-        if not cur:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
         # print("validate payload calling....")
         """
         Validates the payload against the database schema.
         If a column is missing in the payload, it sets that column to None or a default value.
         """
-        # Get all columns without default values from the table schema
-        columns = get_schema_columns(table_name, cur)
+        with db_session(readonly=True, cur=cur) as cur:
+            # Get all columns without default values from the table schema
+            columns = get_schema_columns(table_name, cur)
 
         # Iterate through the columns and check if they are in the payload
         for column in columns:
@@ -1530,13 +2217,6 @@ def validate_payload_with_schema(data, table_name, cur=None):
         traceback.print_exc()
         raise e
 
-    finally:
-        if cur and is_new_cur:
-            cur.close()
-        if con and is_new_cur:
-            release_connection(con)
-
-
 
 """
 Function Name: update_based_rowid
@@ -1548,43 +2228,33 @@ update_based_rowid
 """
 
 
+@log_db_call("update")
 def update_based_rowid(update_stmt, table_name, where_key_name, where_key_value, set_column_data_values):
-    conn = None
-    cursor = None
-
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-
-        # Dynamically build the SET part of the query
-        set_clauses = []
-        values = []
-
-        for col, val in set_column_data_values.items():
-            set_clauses.append("{0} = %s".format(col))
-            values.append(val)
-
-        set_clause = ", ".join(set_clauses)
+        with db_session() as cursor:
+            # The cached counts of the table are stale once this commits
+            on_commit(cursor, lambda: invalidate_count_cache(table_name))
+            # Dynamically build the SET part of the query
+            set_clauses = []
+            values = []
 
-        # Prepare dynamic SQL safely
-        query = update_stmt.format(TABLE_NAME=table_name, SET_CLAUSE=set_clause
-                                   , WHERE_KEY_NAME=where_key_name, WHERE_KEY_VALUE=where_key_value)
+            for col, val in set_column_data_values.items():
+                set_clauses.append("{0} = %s".format(col))
+                values.append(val)
 
-        # debug_print("update query :  {}".format(query))
-        # Execute
-        cursor.execute(query, values)
+            set_clause = ", ".join(set_clauses)
 
-        # debug_print(cursor.mogrify(query).decode('utf-8'))
+            # Prepare dynamic SQL safely
+            query = update_stmt.format(TABLE_NAME=table_name, SET_CLAUSE=set_clause
+                                       , WHERE_KEY_NAME=where_key_name, WHERE_KEY_VALUE=where_key_value)
 
-        conn.commit()
+            # debug_print("update query :  {}".format(query))
+            # Execute
+            cursor.execute(query, values)
 
+            # debug_print(cursor.mogrify(query).decode('utf-8'))
     except psycopg2.Error:
         traceback.print_exc()
     except Exception as e:
         traceback.print_exc()
         logger.warning(str(e))  # str() to avoid Unicode issues
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            release_connection(conn)
@@ -0,0 +1,111 @@
+"""
+lazyInit.py
+==============
+Author: Stanley Parmar
+Description: Thread-safe lazy initialization of the module level resources (log files, pools, engines),
+so importing a backend module reads no config and opens no connection.
+
+The resources are also fork-safe: a value created by the parent process is never used by a forked child
+(gunicorn pre-fork workers, commonUtility.multi_proc). The child creates its own on first use. The
+inherited value stays referenced and is never closed, because closing it would close the parent's sockets.
+"""
+
+# lazyInit.py
+
+# Import the default Libraries
+import os
+import threading
+import weakref
+
+# Every LazyInitializer, reset in the child after a fork
+_initializers = weakref.WeakSet()
+# Values inherited from the parent process, kept referenced so their connections are never closed by the child
+_inherited_values = []
+
+
+"""
+Function Name: keep_inherited
+Inputs: value: A pool / client / engine the parent process created.
+Output: None
+
+Description:
+Keeps the value referenced for the life of the child so garbage collection never closes the parent's sockets.
+"""
+
+
+def keep_inherited(value):
+    _inherited_values.append(value)
+
+
+"""
+    Class Name: LazyInitializer
+    Functions: get
+        Inputs: None
+        Output: The value of the factory, created by the first caller of this process while the others wait
+    Functions: is_initialized
+        Inputs: None
+        Output: True once this process created the value
+    Functions: reset
+        Inputs: None
+        Output: The previous value of this process (or None)-- The next get() calls the factory again
+    Functions: after_fork_in_child
+        Inputs: None
+        Output: None-- Drops the parent's value and lock in a forked child
+"""
+
+
+class LazyInitializer:
+    _unset = object()
+
+    def __init__(self, factory, name=None):
+        self.factory = factory
+        self.name = name or getattr(factory, '__name__', 'resource')
+        self._value = self._unset
+        self._pid = None
+        self._lock = threading.Lock()
+        _initializers.add(self)
+
+    def get(self):
+        value = self._value
+        if value is not self._unset and self._pid == os.getpid():
+            return value
+
+        with self._lock:
+            if self._value is not self._unset and self._pid != os.getpid():
+                # Created before a fork, PID check for forks register_at_fork does not see
+                self._drop_inherited()
+            if self._value is self._unset:
+                self._value = self.factory()
+                self._pid = os.getpid()
+            return self._value
+
+    def is_initialized(self):
+        return self._value is not self._unset and self._pid == os.getpid()
+
+    def reset(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._drop_inherited()
+                return None
+            value, self._value = self._value, self._unset
+        return None if value is self._unset else value
+
+    def after_fork_in_child(self):
+        # The lock may have been held by a thread that does not exist in the child
+        self._lock = threading.Lock()
+        self._drop_inherited()
+
+    def _drop_inherited(self):
+        if self._value is not self._unset:
+            keep_inherited(self._value)
+        self._value = self._unset
+        self._pid = None
+
+
+def _after_fork_in_child():
+    for initializer in list(_initializers):
+        initializer.after_fork_in_child()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,427 @@
+"""
+logHandlers.py
+==============
+Author: Stanley Parmar
+Description: Logging handlers used by commonUtility to write the per-level log files.
+"""
+
+# logHandlers.py
+
+# Import the default Libraries
+import atexit
+import contextvars
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+
+
+# Request ID of the work the current thread / task is doing, attached to every log record
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+
+"""
+Function Name: set_request_id
+Inputs: request_id (str, optional): Incoming correlation ID, a new one is generated when not given.
+Output: request_id (str)
+
+Description:
+Call it at the start of every request; records logged afterwards in the same context carry the ID.
+"""
+
+
+def set_request_id(request_id=None):
+    request_id = request_id or uuid.uuid4().hex
+    request_id_var.set(request_id)
+    return request_id
+
+
+def get_request_id():
+    return request_id_var.get()
+
+
+"""
+    Class Name: RequestIdFilter
+    Functions: filter
+        Inputs: record
+        Output: True-- Stamps the record with the current request ID in the logging thread, before a
+                queue hands it to another thread
+"""
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+"""
+    Class Name: JsonFormatter
+    Functions: format
+        Inputs: record
+        Output: One JSON line with time, level, logger, request ID, message, the db_call / encode fields and the
+                exception
+"""
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        payload = {
+            "timestamp": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", None),
+            "message": record.getMessage(),
+        }
+        db_call = getattr(record, "db_call", None)
+        if db_call:
+            payload["db_call"] = db_call
+        encode = getattr(record, "encode", None)
+        if encode:
+            payload["encode"] = encode
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+"""
+    Class Name: LevelRouterHandler
+    Functions: emit
+        Inputs: record
+        Output: None-- Hands the record to the handler of its level, records of other levels are ignored
+"""
+
+
+class LevelRouterHandler(logging.Handler):
+    def __init__(self, level_handlers):
+        super().__init__()
+        # levelno -> handler writing that level's file
+        self.level_handlers = dict(level_handlers)
+
+    def emit(self, record):
+        handler = self.level_handlers.get(record.levelno)
+        if handler is not None:
+            handler.handle(record)
+
+    def flush(self):
+        for handler in self.level_handlers.values():
+            handler.flush()
+
+    def close(self):
+        for handler in self.level_handlers.values():
+            handler.close()
+        super().close()
+
+
+"""
+    Class Name: DeferredHandler
+    Functions: handle
+        Inputs: record
+        Output: Hands the record to the handler built by the factory, which runs on the first record.
+                Records logged while the factory runs on this thread (e.g. by the config reader it calls), or
+                after it failed, go to logging.lastResort; a failed factory is not run again for each record.
+"""
+
+
+class DeferredHandler(logging.Handler):
+    def __init__(self, factory):
+        super().__init__()
+        self.factory = factory
+        self.failed = False
+        self._building = threading.local()
+
+    def get_target(self):
+        if self.failed or getattr(self._building, "active", False):
+            return None
+        self._building.active = True
+        try:
+            return self.factory()
+        except Exception:
+            self.failed = True
+            raise
+        finally:
+            self._building.active = False
+
+    def handle(self, record):
+        try:
+            target = self.get_target()
+        except Exception:
+            self.handleError(record)
+            return False
+        if target is None:
+            if logging.lastResort is not None and record.levelno >= logging.lastResort.level:
+                logging.lastResort.handle(record)
+            return False
+        return target.handle(record)
+
+    def emit(self, record):
+        self.handle(record)
+
+
+"""
+    Class Name: BoundedQueueHandler
+    Functions: enqueue
+        Inputs: record
+        Output: None-- Puts the record on the bounded queue, waiting at most block_timeout seconds,
+                and counts it as dropped when the queue stays full
+"""
+
+
+class BoundedQueueHandler(QueueHandler):
+    def __init__(self, log_queue, block_timeout=0.0):
+        super().__init__(log_queue)
+        self.block_timeout = block_timeout
+        self.enqueued = 0
+        self.dropped = 0
+        self._counter_lock = threading.Lock()
+
+    def enqueue(self, record):
+        try:
+            if self.block_timeout > 0:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._counter_lock:
+                self.dropped += 1
+            return
+
+        with self._counter_lock:
+            self.enqueued += 1
+
+
+"""
+    Class Name: DrainingQueueListener
+    Functions: enqueue_sentinel
+        Inputs: None
+        Output: None-- Waits for room in the queue so stop() works even when the queue is full
+    Functions: stop
+        Inputs: None
+        Output: None-- Writes the queued records and stops the thread, safe to call twice and in a forked child
+"""
+
+
+class DrainingQueueListener(QueueListener):
+    def start(self):
+        self._pid = os.getpid()
+        super().start()
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        # A forked child inherits the listener but not its thread, only the process that started it stops it
+        if self._thread is not None and getattr(self, '_pid', None) == os.getpid():
+            super().stop()
+
+
+"""
+Function Name: start_queue_logging
+Inputs:
+- target_logger: The logger to make non-blocking, None when the caller attaches the queue handler itself.
+- writer: Handler doing the actual writes (usually a LevelRouterHandler).
+- queue_size (int): Maximum number of records waiting to be written.
+- block_timeout (float): Seconds a logging call may wait for room in a full queue before the record is dropped.
+
+Output: (queue_handler, listener)
+
+Description:
+Request threads only put the record on the queue; a single listener thread formats and writes it.
+The listener is stopped at exit so the queued records are flushed.
+"""
+
+
+def start_queue_logging(target_logger, writer, queue_size=10000, block_timeout=0.0):
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = BoundedQueueHandler(log_queue, block_timeout)
+    listener = DrainingQueueListener(log_queue, writer, respect_handler_level=False)
+
+    if target_logger is not None:
+        target_logger.addHandler(queue_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return queue_handler, listener
+
+
+# Background thread doing the gzip and retention work of the rotated log files
+_maintenance_queue = queue.Queue()
+_maintenance_thread = None
+_maintenance_lock = threading.Lock()
+
+
+"""
+Function Name: run_log_maintenance
+Inputs: None
+Output: None
+
+Description:
+Body of the maintenance thread, runs the queued jobs one after the other.
+"""
+
+
+def run_log_maintenance():
+    while True:
+        job = _maintenance_queue.get()
+        try:
+            job()
+        except Exception:
+            # Never let a failing job stop the thread, and never log through the logger being maintained:
+            # the record goes straight to stderr through logging's last resort handler
+            if logging.lastResort is not None:
+                logging.lastResort.handle(logging.LogRecord(
+                    __name__, logging.ERROR, __file__, 0, "Log maintenance failed", None, sys.exc_info()))
+
+
+"""
+Function Name: submit_log_maintenance
+Inputs: job (callable)
+Output: None
+
+Description:
+Queues the job for the maintenance thread, starting the thread on first use.
+"""
+
+
+def submit_log_maintenance(job):
+    global _maintenance_thread
+    with _maintenance_lock:
+        if _maintenance_thread is None or not _maintenance_thread.is_alive():
+            _maintenance_thread = threading.Thread(target=run_log_maintenance, name="log-maintenance", daemon=True)
+            _maintenance_thread.start()
+    _maintenance_queue.put(job)
+
+
+"""
+Function Name: compress_log_file
+Inputs: file_path (str)
+Output: None
+
+Description:
+Gzips a rotated log file next to itself and removes the original.
+"""
+
+
+def compress_log_file(file_path):
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'rb') as source, gzip.open(file_path + '.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    os.remove(file_path)
+
+
+"""
+Function Name: enforce_log_retention
+Inputs: directory, prefix (e.g. 'debug_'), active_path, max_retained_bytes
+Output: None
+
+Description:
+Deletes the oldest rotated files of the level until they take at most max_retained_bytes.
+"""
+
+
+def enforce_log_retention(directory, prefix, active_path, max_retained_bytes):
+    rotated_files = []
+    for name in os.listdir(directory):
+        file_path = os.path.join(directory, name)
+        if name.startswith(prefix) and file_path != active_path and os.path.isfile(file_path):
+            rotated_files.append((os.path.getmtime(file_path), os.path.getsize(file_path), file_path))
+
+    rotated_files.sort()
+    retained_bytes = sum(size for _, size, _ in rotated_files)
+    for _, size, file_path in rotated_files:
+        if retained_bytes <= max_retained_bytes:
+            break
+        os.remove(file_path)
+        retained_bytes -= size
+
+
+"""
+    Class Name: DatedRotatingFileHandler
+    Functions: shouldRollover
+        Inputs: record
+        Output: True when the day changed or the file reached max_bytes
+    Functions: doRollover
+        Inputs: None
+        Output: None-- Switches to the file of the new day (level_YYYY-MM-DD.log), or moves a full file to
+                level_YYYY-MM-DD.log.N, then gzips / prunes the rotated files in the background
+"""
+
+
+class DatedRotatingFileHandler(BaseRotatingHandler):
+    def __init__(self, directory, level_name, max_bytes=0, compress=False, max_retained_bytes=0,
+                 encoding=None, delay=False):
+        self.directory = directory
+        self.level_name = level_name
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.max_retained_bytes = max_retained_bytes
+        self.current_date = datetime.now().strftime('%Y-%m-%d')
+        self.rollover_at = self.compute_rollover_at()
+        super().__init__(self.build_path(self.current_date), 'a', encoding=encoding, delay=delay)
+
+    def build_path(self, date_text):
+        return os.path.join(self.directory, '%s_%s.log' % (self.level_name, date_text))
+
+    @staticmethod
+    def compute_rollover_at():
+        tomorrow = datetime.now().date() + timedelta(days=1)
+        return time.mktime(tomorrow.timetuple())
+
+    def shouldRollover(self, record):
+        if time.time() >= self.rollover_at:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            message = "%s\n" % self.format(record)
+            if self.stream.tell() + len(message) >= self.max_bytes:
+                return True
+        return False
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        today = datetime.now().strftime('%Y-%m-%d')
+        if today != self.current_date:
+            # Yesterday's file is complete, move on to today's
+            rotated_path = self.baseFilename
+            self.current_date = today
+            self.baseFilename = os.path.abspath(self.build_path(today))
+            self.rollover_at = self.compute_rollover_at()
+        else:
+            # Size limit reached, keep the dated name for the active file
+            index = 1
+            while os.path.exists("%s.%d" % (self.baseFilename, index)) or \
+                    os.path.exists("%s.%d.gz" % (self.baseFilename, index)):
+                index += 1
+            rotated_path = "%s.%d" % (self.baseFilename, index)
+            os.rename(self.baseFilename, rotated_path)
+
+        self.schedule_maintenance(rotated_path)
+
+        if not self.delay:
+            self.stream = self._open()
+
+    def schedule_maintenance(self, rotated_path):
+        if not self.compress and self.max_retained_bytes <= 0:
+            return
+
+        active_path = self.baseFilename
+
+        def job():
+            if self.compress:
+                compress_log_file(rotated_path)
+            if self.max_retained_bytes > 0:
+                enforce_log_retention(self.directory, self.level_name + '_', active_path, self.max_retained_bytes)
+
+        submit_log_maintenance(job)
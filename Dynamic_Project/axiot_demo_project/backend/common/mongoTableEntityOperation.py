@@ -7,25 +7,51 @@ Description: Module to handle database operations including creating, updating,
 
 # tableEntityOperation.py
 
+import base64
+import threading
+import time
+from itertools import islice
+
+from bson import json_util
+from pymongo import IndexModel, InsertOne, ReplaceOne, UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, PyMongoError
 from dbMongoConnection import MongoDBConnection
+from backend.common.commonUtility import logger
+
+# Defaults of the streaming and bulk operations
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_BULK_CHUNK_SIZE = 1000
+DEFAULT_PAGE_SIZE = 100
+# Seconds the index list of a collection is reused by check_sort_index
+INDEX_CACHE_TTL = 300
+
+# collection name -> (loaded at, list of index key lists)
+_index_cache = {}
+_index_cache_lock = threading.Lock()
+
+
+def parse_sort_fields(sort_fields):
+    sort_list = []
+
+    # loop over field name and order(default order Desc), "field:asc" / "field:desc" or ("field", 1 or -1)
+    for field in sort_fields or []:
+        if isinstance(field, (tuple, list)):
+            sort_list.append((field[0], field[1]))
+            continue
+        if ":" in field:
+            field_name, direction = field.split(":", 1)
+            sort_order = 1 if direction.lower() == "asc" else -1
+        else:
+            field_name = field
+            sort_order = -1
+        sort_list.append((field_name.strip(), sort_order))
+    return sort_list
 
 
 def pagination_and_sort_field(cursor, sort_fields, limit, offset):
     # Apply sorting if provided
     if sort_fields:
-        sort_list = []
-
-        # loop over field name and order(default order Desc)
-        for field in sort_fields:
-            if ":" in field:
-                field_name, direction = field.split(":", 1)
-                sort_order = 1 if direction.lower() == "asc" else -1
-            else:
-                field_name = field
-                sort_order = -1
-            sort_list.append((field_name.strip(), sort_order))
-        
-        cursor = cursor.sort(sort_list)
+        cursor = cursor.sort(parse_sort_fields(sort_fields))
 
     # Apply offset (skip)
     if offset:
@@ -39,9 +65,8 @@ def pagination_and_sort_field(cursor, sort_fields, limit, offset):
 
 
 def create_record(collection_name, data):
-    mongo = None
     try:
-        # Connect to MongoDB
+        # Handle over the shared MongoDB client
         mongo = MongoDBConnection()
 
         # Get collection
@@ -57,9 +82,29 @@ def create_record(collection_name, data):
 
     except Exception as e:
         raise e
-    finally:
-        if mongo:
-            mongo.close()
+
+
+def build_query_filter(criteria):
+    query_filter = {}
+
+    # Fetch Data Based On criteria
+    if criteria:
+
+        # Dynamic Filter method.
+        for key, value in criteria.items():
+            if isinstance(value, list):
+                query_filter[key] = {"$in": value}
+            else:
+                query_filter[key] = value
+    return query_filter
+
+
+def build_projection(selected_fields):
+    # selected Field From Collection
+    return (
+        {field: 1 for field in selected_fields if not field.endswith("password")}
+        if selected_fields else None
+    )
 
 
 """
@@ -70,64 +115,727 @@ cursor is chainable, so methods can be applied in any order
 """
 
 def fetch_record(collection, selected_fields=None, criteria=None, sort_fields=None, limit=None, offset=None):
-    mongo = None
     try:
-        # mongo db connection
+        # Handle over the shared MongoDB client
         mongo = MongoDBConnection()
 
         # get mongo collection
         collection = mongo.get_mongo_collection(collection)
-        query_filter = {}
-
-        # Fetch Data Based On criteria
-        if criteria:
-
-            # Dynamic Filter method.
-            for key, value in criteria.items():
-                if isinstance(value, list):
-                    query_filter[key] = {"$in": value}
-                else:
-                    query_filter[key] = value
-
-        # selected Field From Collection
-        projection = (
-            {field: 1 for field in selected_fields if not field.endswith("password")}
-            if selected_fields else None
-        )
 
         # Fetch Data From collection
-        cursor = collection.find(query_filter, projection)
+        cursor = collection.find(build_query_filter(criteria), build_projection(selected_fields))
 
         # pagination and sort field
         cursor = pagination_and_sort_field(cursor, sort_fields, limit, offset)
 
-        # Convert to list here before closing connection
         return list(cursor)
 
     except Exception as e:
         pass
         # debug_print("Failed to fetch records: {}".format(e))
         raise e
+
+
+"""
+Function Name: get_collection_indexes
+Inputs: collection: pymongo collection
+Output: list of index keys, e.g. [[("created_at", -1), ("_id", -1)], [("_id", 1)]]
+"""
+
+
+def get_collection_indexes(collection):
+    now = time.monotonic()
+    with _index_cache_lock:
+        cached = _index_cache.get(collection.name)
+        if cached and now - cached[0] < INDEX_CACHE_TTL:
+            return cached[1]
+
+    index_keys = [list(index["key"]) for index in collection.index_information().values()]
+    with _index_cache_lock:
+        _index_cache[collection.name] = (now, index_keys)
+    return index_keys
+
+
+def invalidate_index_cache(collection_name=None):
+    with _index_cache_lock:
+        if collection_name is None:
+            _index_cache.clear()
+        else:
+            _index_cache.pop(collection_name, None)
+
+
+"""
+Function Name: is_sort_covered
+Inputs:
+- index_keys (list): Keys of one index.
+- sort_list (list): [("field", 1 or -1)]
+- equality_fields (set): Fields the query matches by equality, they may come first in the index.
+Output: True when the index returns the documents in sort order (walked forwards or backwards).
+"""
+
+
+def is_sort_covered(index_keys, sort_list, equality_fields=()):
+    sort_names = [name for name, _ in sort_list]
+    keys = list(index_keys)
+    while keys and keys[0][0] in equality_fields and keys[0][0] not in sort_names:
+        keys.pop(0)
+
+    prefix = keys[:len(sort_list)]
+    if [name for name, _ in prefix] != sort_names:
+        return False
+    return (all(direction == order for (_, direction), (_, order) in zip(prefix, sort_list)) or
+            all(direction == -order for (_, direction), (_, order) in zip(prefix, sort_list)))
+
+
+"""
+Function Name: check_sort_index
+Inputs:
+- collection: pymongo collection
+- sort_fields (list): Same format as fetch_record.
+- criteria (dict): Filter of the query (optional).
+- on_missing (str): "warn" logs a warning, "raise" raises ValueError, "ignore" only returns the result.
+Output: True when an index covers the sort.
+
+Description:
+Without such an index MongoDB sorts in memory and fails the query past the 100MB sort limit.
+"""
+
+
+def check_sort_index(collection, sort_fields, criteria=None, on_missing="warn"):
+    sort_list = parse_sort_fields(sort_fields)
+    if not sort_list:
+        return True
+
+    equality_fields = {key for key, value in (criteria or {}).items() if not isinstance(value, list)}
+    if any(is_sort_covered(index_keys, sort_list, equality_fields)
+           for index_keys in get_collection_indexes(collection)):
+        return True
+
+    message = "No index of {} covers the sort {}".format(collection.name, sort_list)
+    if on_missing == "raise":
+        raise ValueError(message)
+    if on_missing == "warn":
+        logger.warning(message)
+    return False
+
+
+def remove_field(document, field_name):
+    # Dotted names remove nested fields, emptied parents are left in place
+    parts = field_name.split(".")
+    for part in parts[:-1]:
+        document = document.get(part) if isinstance(document, dict) else None
+    if isinstance(document, dict):
+        document.pop(parts[-1], None)
+
+
+def get_field_value(document, field_name):
+    # Dotted names read nested fields
+    value = document
+    for part in field_name.split("."):
+        value = value.get(part) if isinstance(value, dict) else None
+    return value
+
+
+"""
+Function Name: build_keyset_filter
+Inputs:
+- sort_list (list): [("field", 1 or -1)], ending with the _id tie-breaker.
+- after (list): Sort-key values of the last document of the previous page.
+Output: filter matching only the documents after it in sort order.
+
+Description:
+MongoDB sorts a missing or null field before every other value, but {"$gt": None} and {"$lt": value} never match
+null. Null bounds are therefore handled explicitly: ascending after null continues with the non-null values,
+descending after a value also takes the null ones, and nothing follows null in a descending sort.
+"""
+
+
+def build_keyset_filter(sort_list, after):
+    if len(after) != len(sort_list):
+        raise ValueError("after needs one value per sort field {}".format([name for name, _ in sort_list]))
+
+    conditions = []
+    for position, (field_name, order) in enumerate(sort_list):
+        value = after[position]
+        if value is None and order != 1:
+            # Null is the last value of a descending sort
+            continue
+
+        # {field: None} also matches a missing field, like the sort does
+        condition = {name: after[index] for index, (name, _) in enumerate(sort_list[:position])}
+        if value is None:
+            condition[field_name] = {"$ne": None}
+        elif order == 1 or field_name == "_id":
+            # Every document has an _id
+            condition[field_name] = {"$gt" if order == 1 else "$lt": value}
+        else:
+            condition["$or"] = [{field_name: {"$lt": value}}, {field_name: None}]
+        conditions.append(condition)
+
+    if not conditions:
+        # Only reachable without the _id tie-breaker: the previous page ended on the last document
+        return {"_id": {"$in": []}}
+    return conditions[0] if len(conditions) == 1 else {"$or": conditions}
+
+
+"""
+Function Name: encode_page_token
+Inputs: sort_list (list of (field, order)), values (list): Sort-key values of the last document of the page.
+Output: token (str): URL-safe base64 of the canonical extended JSON of the sort and the values.
+"""
+
+
+def encode_page_token(sort_list, values):
+    state = {"sort": [[name, order] for name, order in sort_list], "after": values}
+    payload = json_util.dumps(state, json_options=json_util.CANONICAL_JSON_OPTIONS)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+"""
+Function Name: decode_page_token
+Inputs: token (str): next_after of the previous page, sort_list: The sort of the requested page.
+Output: values (list): The sort-key values, with their BSON types.
+
+Description:
+Raises ValueError for a malformed token or one issued for a different sort.
+"""
+
+
+def decode_page_token(token, sort_list):
+    try:
+        state = json_util.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('utf-8'))
+        token_sort, values = state["sort"], state["after"]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        raise ValueError("Invalid page token")
+    if [tuple(item) for item in token_sort] != [tuple(item) for item in sort_list] or not isinstance(values, list):
+        raise ValueError("Page token does not match the sort of the request")
+    return values
+
+
+"""
+Function Name: fetch_record_page
+Inputs:
+- collection, selected_fields, criteria, sort_fields: Same as fetch_record.
+- limit (int): Page size.
+- after (str): next_after of the previous page; None for page one.
+- index_check (str): See check_sort_index.
+Output: {"records": [...], "next_after": opaque token to pass as after for the next page, None on the last page}
+
+Description:
+Keyset pagination: each page continues from the sort key of the previous one instead of skipping documents,
+so deep pages cost the same as the first. _id is added to the sort as a tie-breaker. The token keeps the BSON
+types of the sort-key values (ObjectId, datetime, ...) through the JSON response, see encode_page_token.
+Password fields cannot be sort keys, their values would end up in the token. Raises ValueError for them.
+"""
+
+
+def fetch_record_page(collection, selected_fields=None, criteria=None, sort_fields=None, limit=DEFAULT_PAGE_SIZE,
+                      after=None, index_check="warn"):
+    # Handle over the shared MongoDB client
+    mongo = MongoDBConnection()
+    collection = mongo.get_mongo_collection(collection)
+
+    sort_list = parse_sort_fields(sort_fields)
+    if any(name.endswith("password") for name, _ in sort_list):
+        raise ValueError("Sorting on password fields is not allowed")
+    if not any(name == "_id" for name, _ in sort_list):
+        sort_list.append(("_id", sort_list[-1][1] if sort_list else 1))
+    check_sort_index(collection, sort_list, criteria, index_check)
+
+    query_filter = build_query_filter(criteria)
+    if after is not None:
+        keyset_filter = build_keyset_filter(sort_list, decode_page_token(after, sort_list))
+        query_filter = {"$and": [query_filter, keyset_filter]} if query_filter else keyset_filter
+
+    projection = build_projection(selected_fields)
+    # The sort keys are needed to build next_after, the ones the caller did not select are removed again
+    added_fields = []
+    if projection:
+        # _id is returned by default, fields inside a selected one are already returned
+        added_fields = [name for name, _ in sort_list
+                        if name != "_id" and not any(name == field or name.startswith(field + ".")
+                                                     for field in projection)]
+        projection.update({name: 1 for name in added_fields})
+
+    records = list(collection.find(query_filter, projection).sort(sort_list).limit(limit))
+
+    next_after = None
+    if records and len(records) == limit:
+        next_after = encode_page_token(sort_list, [get_field_value(records[-1], name) for name, _ in sort_list])
+    for record in records:
+        for name in added_fields:
+            remove_field(record, name)
+    return {"records": records, "next_after": next_after}
+
+
+"""
+Function Name: iter_records
+Inputs: Same as fetch_record, plus batch_size (documents per round trip, default DEFAULT_BATCH_SIZE).
+Output: generator of documents
+
+Description:
+Streams the matching documents instead of building the full list, so exports run in constant memory.
+"""
+
+
+def iter_records(collection, selected_fields=None, criteria=None, sort_fields=None, limit=None, offset=None,
+                 batch_size=DEFAULT_BATCH_SIZE):
+    # Handle over the shared MongoDB client
+    mongo = MongoDBConnection()
+    collection = mongo.get_mongo_collection(collection)
+
+    cursor = collection.find(build_query_filter(criteria), build_projection(selected_fields),
+                             batch_size=batch_size)
+    cursor = pagination_and_sort_field(cursor, sort_fields, limit, offset)
+    try:
+        for document in cursor:
+            yield document
     finally:
-        if mongo:
-            mongo.close()
+        # Kill the server-side cursor when the caller stops early
+        cursor.close()
+
+
+"""
+Function Name: build_write_operation
+Inputs:
+- document (dict): The document to write.
+- mode (str): "insert", "upsert" ($set on the key fields, inserted when missing) or "replace" (whole document).
+- key_fields (tuple): Fields identifying the document for "upsert" / "replace".
+Output: The pymongo write operation.
+"""
+
+
+def build_write_operation(document, mode, key_fields):
+    if mode == "insert":
+        return InsertOne(document)
+
+    missing_keys = [field for field in key_fields if field not in document]
+    if missing_keys:
+        raise ValueError("Key field(s) {} missing from the document.".format(", ".join(missing_keys)))
+    key_filter = {field: document[field] for field in key_fields}
+
+    if mode == "upsert":
+        return UpdateOne(key_filter, {"$set": document}, upsert=True)
+    if mode == "replace":
+        return ReplaceOne(key_filter, document, upsert=True)
+    raise ValueError("Unsupported bulk write mode: {}".format(mode))
+
+
+"""
+Function Name: bulk_write_records
+Inputs:
+- collection_name (str)
+- records (iterable of dict): Any iterable, consumed chunk by chunk.
+- mode (str): "insert", "upsert" or "replace", see build_write_operation.
+- key_fields (tuple): Fields identifying a document for "upsert" / "replace" (default _id).
+- chunk_size (int): Operations per bulk_write round trip.
+- ordered (bool): Unordered by default, the server applies a chunk in parallel and keeps going after an error.
+
+Output: list with one result per chunk: counts of inserted / matched / modified / upserted documents and
+the write errors of the chunk.
+"""
+
+
+def bulk_write_records(collection_name, records, mode="insert", key_fields=("_id",),
+                       chunk_size=DEFAULT_BULK_CHUNK_SIZE, ordered=False):
+    # Handle over the shared MongoDB client
+    mongo = MongoDBConnection()
+    collection = mongo.get_mongo_collection(collection_name)
+
+    chunk_results = []
+    records = iter(records)
+    chunk_index = 0
+    while True:
+        chunk = list(islice(records, chunk_size))
+        if not chunk:
+            break
 
+        operations = [build_write_operation(document, mode, key_fields) for document in chunk]
+        try:
+            result = collection.bulk_write(operations, ordered=ordered)
+            details = result.bulk_api_result
+        except BulkWriteError as e:
+            # The successful writes of the chunk are kept, only the failed ones are reported
+            details = e.details
 
-# def create_mongo_collection(collection_name):
-#     mongo = None
-#     try:
-#         # mongo db connection
-#         mongo = MongoDBConnection()
+        chunk_results.append({
+            "chunk": chunk_index,
+            "operations": len(operations),
+            "inserted": details.get("nInserted", 0),
+            "matched": details.get("nMatched", 0),
+            "modified": details.get("nModified", 0),
+            "upserted": details.get("nUpserted", 0),
+            "errors": [{"index": chunk_index * chunk_size + error["index"], "code": error.get("code"),
+                        "message": error.get("errmsg")} for error in details.get("writeErrors", [])],
+        })
+        chunk_index += 1
 
-#         # create Mongo collection
-#         mongo.db.createCollection(collection_name)
+    return chunk_results
 
-#         # create Collection Successfully
 
-#     except Exception as e:
-#         pass
-#         # debug_print("Failed to fetch records: {}".format(e))
-#         raise e
-#     finally:
-#         if mongo:
-#             mongo.close()
\ No newline at end of file
+# Accumulators of the aggregations argument, "count" counts the documents of the group
+AGGREGATION_OPERATORS = ("sum", "avg", "min", "max", "count", "first", "last", "push", "addToSet")
+
+
+"""
+Function Name: build_password_exclusion
+Inputs: selected_fields (list, optional)
+Output: The projection stage, never letting a field ending with "password" leave the server.
+
+Description:
+With selected_fields it is a $project of those fields. Without, the fields of the document are filtered by name
+($replaceWith over $objectToArray), as an exclusion $project would need the password field names up front.
+"""
+
+
+def build_password_exclusion(selected_fields=None):
+    if selected_fields:
+        return {"$project": build_projection(selected_fields)}
+    return {"$replaceWith": {"$arrayToObject": {"$filter": {
+        "input": {"$objectToArray": "$$ROOT"},
+        "as": "field",
+        "cond": {"$not": [{"$regexMatch": {"input": "$$field.k", "regex": "password$"}}]},
+    }}}}
+
+
+"""
+Function Name: build_group_stages
+Inputs:
+- group_by (str or list): Field(s) to group on, None for one group over every document.
+- aggregations (dict): output name -> (operator, field), e.g. {"total": ("sum", "amount"), "rows": ("count", None)}.
+Output: [$group, $project] stages; the $project puts the group fields back at the top level.
+"""
+
+
+def build_group_stages(group_by=None, aggregations=None):
+    if isinstance(group_by, str):
+        group_by = [group_by]
+    group_by = group_by or []
+
+    group = {"_id": {field.replace(".", "_"): "$" + field for field in group_by} if group_by else None}
+    for output_name, (operator, field_name) in (aggregations or {}).items():
+        if operator not in AGGREGATION_OPERATORS:
+            raise ValueError("Unsupported aggregation operator: {}".format(operator))
+        if operator == "count":
+            group[output_name] = {"$sum": 1}
+        else:
+            group[output_name] = {"$" + operator: "$" + field_name}
+
+    project = {"_id": 0}
+    project.update({field.replace(".", "_"): "$_id." + field.replace(".", "_") for field in group_by})
+    project.update({output_name: 1 for output_name in (aggregations or {})})
+    return [{"$group": group}, {"$project": project}]
+
+
+"""
+Function Name: build_stage_list
+Inputs: group_by, aggregations, sort_fields, limit: See build_aggregation_pipeline.
+Output: The $group / $project / $sort / $limit stages, the part a facet repeats.
+"""
+
+
+def build_stage_list(group_by=None, aggregations=None, sort_fields=None, limit=None):
+    stages = []
+    if group_by or aggregations:
+        stages.extend(build_group_stages(group_by, aggregations))
+    sort_list = parse_sort_fields(sort_fields)
+    if sort_list:
+        stages.append({"$sort": dict(sort_list)})
+    if limit:
+        stages.append({"$limit": int(limit)})
+    return stages
+
+
+"""
+Function Name: build_aggregation_pipeline
+Inputs:
+- criteria (dict): Same style as fetch_record, becomes the $match.
+- selected_fields (list): Fields kept before grouping (optional).
+- group_by, aggregations: See build_group_stages.
+- sort_fields (list): Same format as fetch_record, applied after grouping.
+- limit (int): Maximum number of result documents.
+- facets (dict): name -> dict of group_by / aggregations / sort_fields / limit, each run as a $facet branch
+  over the same matched documents.
+Output: pipeline (list)
+
+Description:
+$match first so indexes are used, then the password exclusion, so no later stage can read a password field.
+"""
+
+
+def build_aggregation_pipeline(criteria=None, selected_fields=None, group_by=None, aggregations=None,
+                               sort_fields=None, limit=None, facets=None):
+    pipeline = []
+    query_filter = build_query_filter(criteria)
+    if query_filter:
+        pipeline.append({"$match": query_filter})
+    pipeline.append(build_password_exclusion(selected_fields))
+
+    if facets:
+        pipeline.append({"$facet": {name: build_stage_list(**facet) or [{"$match": {}}]
+                                    for name, facet in facets.items()}})
+    else:
+        pipeline.extend(build_stage_list(group_by, aggregations, sort_fields, limit))
+    return pipeline
+
+
+"""
+Function Name: aggregate_records
+Inputs: collection, allow_disk_use, batch_size and the arguments of build_aggregation_pipeline.
+Output: list of result documents (one document with a list per facet when facets are given)
+"""
+
+
+def aggregate_records(collection, criteria=None, selected_fields=None, group_by=None, aggregations=None,
+                      sort_fields=None, limit=None, facets=None, allow_disk_use=False,
+                      batch_size=DEFAULT_BATCH_SIZE):
+    # Handle over the shared MongoDB client
+    mongo = MongoDBConnection()
+    collection = mongo.get_mongo_collection(collection)
+
+    pipeline = build_aggregation_pipeline(criteria, selected_fields, group_by, aggregations, sort_fields, limit,
+                                          facets)
+    return list(collection.aggregate(pipeline, allowDiskUse=allow_disk_use, batchSize=batch_size))
+
+
+# Index key types besides ascending / descending, "field:text"
+SPECIAL_INDEX_TYPES = ("text", "hashed", "2d", "2dsphere")
+# Index options of the spec -> (index_information name, default)
+INDEX_OPTIONS = {
+    "unique": ("unique", False),
+    "sparse": ("sparse", False),
+    "expire_after_seconds": ("expireAfterSeconds", None),
+    "partial_filter": ("partialFilterExpression", None),
+}
+
+
+"""
+Function Name: parse_index_keys
+Inputs: keys (list): "field" (ascending), "field:asc", "field:desc", "field:text" / "hashed" / "2dsphere" / "2d",
+        or ["field", 1 or -1]
+Output: list of (field, direction)
+
+Description:
+Unlike parse_sort_fields, a plain field name is ascending, the default of MongoDB indexes.
+"""
+
+
+def parse_index_keys(keys):
+    if isinstance(keys, str):
+        keys = [keys]
+
+    index_keys = []
+    for key in keys:
+        if isinstance(key, (tuple, list)):
+            index_keys.append((key[0], key[1]))
+            continue
+        field_name, _, direction = key.partition(":")
+        direction = direction.strip().lower()
+        if direction in SPECIAL_INDEX_TYPES:
+            index_keys.append((field_name.strip(), direction))
+        else:
+            index_keys.append((field_name.strip(), -1 if direction == "desc" else 1))
+    return index_keys
+
+
+"""
+Function Name: normalize_index_spec
+Inputs: spec (dict): One entry of the "indexes" config, e.g.
+        {"keys": ["customer_id", "created_at:desc"]}
+        {"keys": ["created_at"], "expire_after_seconds": 86400}                         (TTL)
+        {"keys": ["email"], "unique": true, "partial_filter": {"email": {"$exists": true}}}  (partial)
+        "name" is optional, MongoDB's default name (customer_id_1_created_at_-1) is used without it.
+Output: spec (dict) with keys, name and every option of INDEX_OPTIONS
+"""
+
+
+def normalize_index_spec(spec):
+    if isinstance(spec, (str, list, tuple)):
+        spec = {"keys": spec}
+    keys = parse_index_keys(spec["keys"])
+    if not keys:
+        raise ValueError("Index spec without keys: {}".format(spec))
+
+    normalized = {
+        "keys": keys,
+        "name": spec.get("name") or "_".join("{}_{}".format(field, direction) for field, direction in keys),
+    }
+    for option, (_, default) in INDEX_OPTIONS.items():
+        normalized[option] = spec.get(option, default)
+    return normalized
+
+
+"""
+Function Name: build_index_model
+Inputs: spec (dict): Normalized index spec
+Output: pymongo IndexModel
+"""
+
+
+def build_index_model(spec):
+    kwargs = {"name": spec["name"]}
+    for option, (index_option, default) in INDEX_OPTIONS.items():
+        if spec[option] != default:
+            kwargs[index_option] = spec[option]
+    return IndexModel(spec["keys"], **kwargs)
+
+
+"""
+Function Name: get_index_specs
+Inputs: collection_name (str, optional): Only this collection.
+Output: dict: collection name -> list of normalized index specs, from "indexes" of the _mongodb config
+"""
+
+
+def get_index_specs(collection_name=None):
+    mongo = MongoDBConnection()
+    index_config = mongo.get_index_specs()
+    if collection_name is not None:
+        index_config = {collection_name: index_config.get(collection_name, [])}
+    return {name: [normalize_index_spec(spec) for spec in specs] for name, specs in index_config.items()}
+
+
+"""
+Function Name: compare_index
+Inputs:
+- spec (dict): Normalized index spec.
+- index_information (dict): index_information() of the collection.
+Output: ("existing" | "missing" | "conflicting", name of the matching index or None)
+
+Description:
+An index with the same keys, or with the same name, but other options is conflicting; MongoDB would refuse
+to create the spec, and ensure_indexes never drops an index by itself. Text keys are compared the way MongoDB
+stores them, see get_stored_index_keys.
+"""
+
+
+def compare_index(spec, index_information):
+    stored_keys = get_stored_index_keys(spec["keys"])
+    text_weights = {field: 1 for field, direction in spec["keys"] if direction == "text"}
+    for name, info in index_information.items():
+        same_keys = list(info["key"]) == stored_keys and (
+            not text_weights or dict(info.get("weights", {})) == text_weights)
+        if not same_keys and name != spec["name"]:
+            continue
+        same_options = all(info.get(index_option, default) == spec[option]
+                           for option, (index_option, default) in INDEX_OPTIONS.items())
+        if same_keys and same_options:
+            return "existing", name
+        return "conflicting", name
+    return "missing", None
+
+
+"""
+Function Name: get_stored_index_keys
+Inputs: keys (list of (field, direction)): Keys of a normalized spec.
+Output: The keys as index_information() reports them.
+
+Description:
+MongoDB stores the text fields of an index as ("_fts", "text"), ("_ftsx", 1) in place of the fields, which are
+listed in the index "weights" instead.
+"""
+
+
+def get_stored_index_keys(keys):
+    stored_keys = []
+    for field, direction in keys:
+        if direction != "text":
+            stored_keys.append((field, direction))
+        elif ("_fts", "text") not in stored_keys:
+            stored_keys.extend([("_fts", "text"), ("_ftsx", 1)])
+    return stored_keys
+
+
+"""
+Function Name: get_index_report
+Inputs: collection_name (str, optional): Only this collection, all configured collections when not given.
+Output: dict: collection name -> {"existing", "missing", "conflicting", "undeclared"} lists of index names
+"""
+
+
+def get_index_report(collection_name=None):
+    mongo = MongoDBConnection()
+    report = {}
+    for name, specs in get_index_specs(collection_name).items():
+        collection = mongo.get_mongo_collection(name)
+        index_information = collection.index_information()
+
+        collection_report = {"existing": [], "missing": [], "conflicting": [], "undeclared": []}
+        matched = set()
+        for spec in specs:
+            status, index_name = compare_index(spec, index_information)
+            collection_report[status].append(spec["name"])
+            if index_name:
+                matched.add(index_name)
+        collection_report["undeclared"] = sorted(set(index_information) - matched - {"_id_"})
+        report[name] = collection_report
+    return report
+
+
+"""
+Function Name: ensure_indexes
+Inputs: collection_name (str, optional): Only this collection, all configured collections when not given.
+Output: dict: collection name -> {"created", "existing", "conflicting"} lists of index names, or {"error": ...}
+
+Description:
+Creates the missing indexes of the "indexes" config and leaves the others alone, so it is safe to run at every
+start (appInit.init_app). A collection that fails is logged and the others are still processed.
+"""
+
+
+def ensure_indexes(collection_name=None):
+    mongo = MongoDBConnection()
+    result = {}
+    for name, specs in get_index_specs(collection_name).items():
+        try:
+            collection = mongo.get_mongo_collection(name)
+            index_information = collection.index_information()
+
+            created, existing, conflicting, missing = [], [], [], []
+            for spec in specs:
+                status, _ = compare_index(spec, index_information)
+                if status == "existing":
+                    existing.append(spec["name"])
+                elif status == "conflicting":
+                    conflicting.append(spec["name"])
+                    logger.warning("Index {} of {} conflicts with an existing index".format(spec["name"], name))
+                else:
+                    missing.append(spec)
+
+            if missing:
+                created = collection.create_indexes([build_index_model(spec) for spec in missing])
+                logger.info("Created indexes {} on {}".format(created, name))
+            result[name] = {"created": created, "existing": existing, "conflicting": conflicting}
+        except PyMongoError as e:
+            logger.error("Failed to ensure the indexes of {}: {}".format(name, e))
+            result[name] = {"error": str(e)}
+        finally:
+            invalidate_index_cache(name)
+    return result
+
+
+"""
+Function Name: create_mongo_collection
+Inputs: collection_name (str)
+Output: collection: pymongo collection, created when it does not exist, with its configured indexes
+"""
+
+
+def create_mongo_collection(collection_name):
+    try:
+        # Handle over the shared MongoDB client
+        mongo = MongoDBConnection()
+
+        # create Mongo collection, another process may create it at the same time
+        if collection_name not in mongo.get_mongo_collection_list():
+            try:
+                mongo.db.create_collection(collection_name)
+            except CollectionInvalid:
+                pass
+
+        ensure_indexes(collection_name)
+        return mongo.get_mongo_collection(collection_name)
+
+    except Exception as e:
+        logger.error("Failed to create collection {}: {}".format(collection_name, e))
+        raise e
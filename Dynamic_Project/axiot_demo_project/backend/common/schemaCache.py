@@ -0,0 +1,207 @@
+"""
+schemaCache.py
+==============
+Author: Stanley Parmar
+Description: Process-wide TTL cache for the table schema metadata read from information_schema.
+"""
+
+# schemaCache.py
+
+# Import the default Libraries
+import threading
+import time
+
+# Import the custom Libraries
+from backend.common.commonUtility import open_read_file
+
+# Default time to live (seconds) when the general config does not define 'schema_cache_ttl'
+DEFAULT_SCHEMA_CACHE_TTL = 300
+
+# (schema_name, table_name, with_default) -> (expires_at, columns)
+# (schema_name, table_name, "search_index") -> (expires_at, search_index)
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+_schema_cache_ttl = None
+# Bumped on every invalidation, lets other caches (statementCache.py) notice DDL on a table
+_schema_generation = {}
+_schema_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "expired": 0,
+    "invalidations": 0,
+}
+
+
+"""
+Function Name: get_schema_cache_ttl
+Inputs: None
+Output: ttl (float): Number of seconds a cached schema entry stays valid.
+
+Description:
+Reads 'schema_cache_ttl' from the general config once and keeps it for the process lifetime.
+A value of 0 disables the cache.
+"""
+
+
+def get_schema_cache_ttl():
+    global _schema_cache_ttl
+    if _schema_cache_ttl is None:
+        config = open_read_file('resources', '', 'general') or {}
+        _schema_cache_ttl = float(config.get('schema_cache_ttl', DEFAULT_SCHEMA_CACHE_TTL))
+    return _schema_cache_ttl
+
+
+"""
+Function Name: get_cached_entry
+Inputs: key (tuple starting with schema_name, table_name)
+Output: (found, value): found is False when the entry is missing or expired.
+
+Description:
+Looks up a cached entry and updates the hit/miss counters.
+"""
+
+
+def get_cached_entry(key):
+    now = time.monotonic()
+    with _schema_cache_lock:
+        entry = _schema_cache.get(key)
+        if entry is None:
+            _schema_cache_stats["misses"] += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at <= now:
+            del _schema_cache[key]
+            _schema_cache_stats["expired"] += 1
+            _schema_cache_stats["misses"] += 1
+            return False, None
+
+        _schema_cache_stats["hits"] += 1
+        return True, value
+
+
+"""
+Function Name: set_cached_entry
+Inputs: key (tuple starting with schema_name, table_name), value
+Output: None
+
+Description:
+Stores the value until the TTL runs out.
+"""
+
+
+def set_cached_entry(key, value):
+    ttl = get_schema_cache_ttl()
+    if ttl <= 0:
+        return
+
+    with _schema_cache_lock:
+        _schema_cache[key] = (time.monotonic() + ttl, value)
+
+
+"""
+Function Name: get_cached_schema_columns
+Inputs: schema_name, table_name, with_default
+Output: columns (list) or None when the entry is missing or expired.
+"""
+
+
+def get_cached_schema_columns(schema_name, table_name, with_default=False):
+    found, columns = get_cached_entry((schema_name, table_name, bool(with_default)))
+    if not found:
+        return None
+
+    # Hand out a copy so callers can never modify the cached entry
+    return list(columns)
+
+
+"""
+Function Name: set_cached_schema_columns
+Inputs: schema_name, table_name, with_default, columns (list)
+Output: None
+"""
+
+
+def set_cached_schema_columns(schema_name, table_name, with_default, columns):
+    set_cached_entry((schema_name, table_name, bool(with_default)), tuple(columns))
+
+
+"""
+Function Name: get_cached_search_index
+Inputs: schema_name, table_name
+Output: (found, search_index): search_index is the (backend name, index expression) tuple or None when
+the table has no search index.
+"""
+
+
+def get_cached_search_index(schema_name, table_name):
+    return get_cached_entry((schema_name, table_name, "search_index"))
+
+
+"""
+Function Name: set_cached_search_index
+Inputs: schema_name, table_name, search_index (tuple or None)
+Output: None
+"""
+
+
+def set_cached_search_index(schema_name, table_name, search_index):
+    set_cached_entry((schema_name, table_name, "search_index"), search_index)
+
+
+"""
+Function Name: invalidate_schema_cache
+Inputs: table_name (optional), schema_name (optional, default 'public')
+Output: removed (int): Number of entries dropped.
+
+Description:
+Drops the cached entries of one table (both with_default variants and its search index), or every entry
+when no table is given.
+Called by tableEntityOperation after any DDL that changes a table's columns.
+"""
+
+
+def invalidate_schema_cache(table_name=None, schema_name='public'):
+    with _schema_cache_lock:
+        if table_name is None:
+            keys = list(_schema_cache.keys())
+        else:
+            keys = [key for key in _schema_cache if key[0] == schema_name and key[1] == table_name]
+
+        for key in keys:
+            del _schema_cache[key]
+
+        generation_key = None if table_name is None else (schema_name, table_name)
+        _schema_generation[generation_key] = _schema_generation.get(generation_key, 0) + 1
+        _schema_cache_stats["invalidations"] += 1
+    return len(keys)
+
+
+"""
+Function Name: get_schema_generation
+Inputs: table_name, schema_name (optional, default 'public')
+Output: (int, int): Invalidation counters of the whole cache and of the table.
+
+Description:
+Changes whenever the table's schema metadata is invalidated, so derived caches can key on it.
+"""
+
+
+def get_schema_generation(table_name, schema_name='public'):
+    with _schema_cache_lock:
+        return _schema_generation.get(None, 0), _schema_generation.get((schema_name, table_name), 0)
+
+
+"""
+Function Name: get_schema_cache_stats
+Inputs: None
+Output: stats (dict): hits, misses, expired, invalidations, size and ttl of the cache.
+"""
+
+
+def get_schema_cache_stats():
+    with _schema_cache_lock:
+        stats = dict(_schema_cache_stats)
+        stats["size"] = len(_schema_cache)
+    stats["ttl"] = get_schema_cache_ttl()
+    return stats
@@ -0,0 +1,271 @@
+"""
+searchBackend.py
+==============
+Author: Stanley Parmar
+Description: Pluggable backends for the all-columns search of the record search functions.
+
+The default backend is the ILIKE scan over every column. A table can get a pg_trgm GIN index or a full-text
+GIN index over its searchable columns through tableEntityOperation.create_search_index; the query builder
+then searches the indexed expression instead of scanning every column.
+
+The trigram index only prefilters the rows, each column is still matched on its own, so the results are the
+ones of the ILIKE scan. The full-text index changes the search to whole-word matching, its backend is named
+"fulltext_word_match" for that reason.
+"""
+
+# searchBackend.py
+
+# Import the default Libraries
+import json
+
+from psycopg2 import sql
+
+# Import the custom Libraries
+from backend.common.schemaCache import get_cached_search_index, set_cached_search_index
+from backend.common.dbCallLog import helper_statement
+
+# Column types whose cast to text is immutable, so they can be part of an index expression
+SEARCHABLE_DATA_TYPES = (
+    'text', 'character varying', 'character', 'smallint', 'integer', 'bigint', 'numeric',
+    'real', 'double precision', 'boolean', 'uuid', 'json', 'jsonb',
+)
+
+# PostgreSQL truncates identifiers to 63 bytes
+MAX_IDENTIFIER_LENGTH = 63
+
+
+"""
+    Class Name: IlikeSearchBackend
+    Functions: build_condition
+        Inputs: columns, search_value, joiner, index_expression
+        Output: (condition, parameters)-- One ILIKE per column joined with the operand
+    Functions: build_index_statements
+        Inputs: table_name, columns, concurrently
+        Output: statements-- Nothing to create, the ILIKE scan needs no index
+"""
+
+
+class IlikeSearchBackend:
+    name = "ilike"
+    index_suffix = None
+
+    def build_condition(self, columns, search_value, joiner=" OR ", index_expression=None):
+        conditions = [sql.SQL("{}::text ILIKE %s").format(sql.Identifier(col)) for col in columns]
+        parameters = ["%" + search_value + "%"] * len(columns)
+        return sql.SQL("({})").format(sql.SQL(joiner).join(conditions)), parameters
+
+    def build_index_statements(self, table_name, columns, concurrently=False):
+        return []
+
+
+"""
+    Class Name: TrigramSearchBackend
+    Functions: build_document
+        Inputs: columns
+        Output: document-- All columns cast to text and concatenated
+    Functions: build_condition
+        Inputs: columns, search_value, joiner, index_expression
+        Output: (condition, parameters)-- ILIKE on the indexed document, rechecked per column
+    Functions: build_index_statements
+        Inputs: table_name, columns, concurrently
+        Output: statements-- pg_trgm extension, the GIN index on the document and the comment listing its columns
+"""
+
+
+class TrigramSearchBackend:
+    name = "trigram"
+    index_suffix = "_search_trgm_idx"
+
+    @staticmethod
+    def build_document(columns):
+        return sql.SQL(" || ' ' || ").join(
+            sql.SQL("coalesce({}::text, '')").format(sql.Identifier(col)) for col in columns
+        )
+
+    def build_condition(self, columns, search_value, joiner=" OR ", index_expression=None):
+        # The document joins the columns with spaces, so it can match across two columns; the index only
+        # narrows the rows down and the per-column ILIKE decides
+        column_condition, parameters = search_backends["ilike"].build_condition(columns, search_value, joiner)
+        return (sql.SQL("(({}) ILIKE %s AND {})").format(sql.SQL(index_expression), column_condition),
+                ["%" + search_value + "%"] + parameters)
+
+    def build_index_statements(self, table_name, columns, concurrently=False):
+        return [
+            sql.SQL("CREATE EXTENSION IF NOT EXISTS pg_trgm"),
+            sql.SQL("CREATE INDEX {}IF NOT EXISTS {} ON {} USING gin (({}) gin_trgm_ops)").format(
+                sql.SQL("CONCURRENTLY " if concurrently else ""),
+                sql.Identifier(get_search_index_name(table_name, self)),
+                sql.Identifier(table_name),
+                self.build_document(columns)
+            ),
+            build_index_comment(table_name, self, columns),
+        ]
+
+
+"""
+    Class Name: FullTextSearchBackend
+    Functions: build_condition
+        Inputs: columns, search_value, joiner, index_expression
+        Output: (condition, parameters)-- tsvector match of the indexed document. Matches whole words of the
+                value, not substrings like the ILIKE scan: "data" does not find "database".
+    Functions: build_index_statements
+        Inputs: table_name, columns, concurrently
+        Output: statements-- GIN index on the tsvector of the document and the comment listing its columns
+"""
+
+
+class FullTextSearchBackend:
+    name = "fulltext_word_match"
+    index_suffix = "_search_tsv_idx"
+    text_search_config = "simple"
+
+    def build_condition(self, columns, search_value, joiner=" OR ", index_expression=None):
+        return (sql.SQL("{} @@ plainto_tsquery({}::regconfig, %s)").format(
+            sql.SQL(index_expression), sql.Literal(self.text_search_config)), [search_value])
+
+    def build_index_statements(self, table_name, columns, concurrently=False):
+        return [
+            sql.SQL("CREATE INDEX {}IF NOT EXISTS {} ON {} USING gin (to_tsvector({}::regconfig, {}))").format(
+                sql.SQL("CONCURRENTLY " if concurrently else ""),
+                sql.Identifier(get_search_index_name(table_name, self)),
+                sql.Identifier(table_name),
+                sql.Literal(self.text_search_config),
+                TrigramSearchBackend.build_document(columns)
+            ),
+            build_index_comment(table_name, self, columns),
+        ]
+
+
+# Registered backends, looked up by name
+search_backends = {}
+
+
+"""
+Function Name: register_search_backend
+Inputs: backend: Object with name, index_suffix, build_condition and build_index_statements.
+Output: None
+"""
+
+
+def register_search_backend(backend):
+    search_backends[backend.name] = backend
+
+
+for _backend in (IlikeSearchBackend(), TrigramSearchBackend(), FullTextSearchBackend()):
+    register_search_backend(_backend)
+
+
+"""
+Function Name: get_search_index_name
+Inputs: table_name, backend
+Output: str: Name of the backend's search index on the table.
+"""
+
+
+def get_search_index_name(table_name, backend):
+    return (table_name + backend.index_suffix)[:MAX_IDENTIFIER_LENGTH]
+
+
+"""
+Function Name: build_index_comment
+Inputs: table_name, backend, columns
+Output: COMMENT ON INDEX statement recording the indexed columns, read back by get_search_index.
+"""
+
+
+def build_index_comment(table_name, backend, columns):
+    return sql.SQL("COMMENT ON INDEX {} IS {}").format(
+        sql.Identifier(get_search_index_name(table_name, backend)),
+        sql.Literal(json.dumps(list(columns)))
+    )
+
+
+"""
+Function Name: get_searchable_columns
+Inputs: table_name, cur
+Output: list: Columns of the table that can be part of a search index.
+"""
+
+
+def get_searchable_columns(table_name, cur):
+    with helper_statement():
+        cur.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s AND data_type IN %s
+            ORDER BY ordinal_position;
+        """, (table_name, SEARCHABLE_DATA_TYPES))
+    return [row[0] for row in cur.fetchall()]
+
+
+"""
+Function Name: get_search_index
+Inputs: table_name, cur
+Output: (backend name, index expression, indexed columns) of the table's search index, or None when it has none.
+        The columns are None for an index created without the column comment.
+
+Description:
+Looks the search index up in pg_index and keeps the answer in the schema cache, so it is dropped together
+with the table's columns when tableEntityOperation changes the table.
+"""
+
+
+def get_search_index(table_name, cur):
+    found, search_index = get_cached_search_index('public', table_name)
+    if found:
+        return search_index
+
+    index_backends = {get_search_index_name(table_name, backend): backend.name
+                      for backend in search_backends.values() if backend.index_suffix}
+
+    with helper_statement():
+        cur.execute("""
+            SELECT ic.relname, pg_get_expr(i.indexprs, i.indrelid), obj_description(i.indexrelid, 'pg_class')
+            FROM pg_index i
+            JOIN pg_class ic ON ic.oid = i.indexrelid
+            JOIN pg_class tc ON tc.oid = i.indrelid
+            JOIN pg_namespace n ON n.oid = tc.relnamespace
+            WHERE n.nspname = 'public' AND tc.relname = %s AND ic.relname = ANY(%s) AND i.indisvalid;
+        """, (table_name, list(index_backends.keys())))
+    row = cur.fetchone()
+
+    search_index = None
+    if row and row[1]:
+        try:
+            index_columns = json.loads(row[2]) if row[2] else None
+        except ValueError:
+            index_columns = None
+        search_index = (index_backends[row[0]], row[1], index_columns)
+    set_cached_search_index('public', table_name, search_index)
+    return search_index
+
+
+"""
+Function Name: build_search_condition
+Inputs:
+- table_name (str): The table being searched.
+- columns (list): Columns searched by the ILIKE fallback.
+- search_value (str): The value to search for.
+- joiner (str): Operand joining the per-column conditions of the ILIKE fallback.
+- cur: Open cursor, used to look up the search index.
+
+Output: (condition, parameters) for the WHERE clause.
+
+Description:
+Uses the table's search index when it has one, otherwise the ILIKE scan over every column.
+The indexes match when any column contains the value, so they are only used when the columns are OR-ed, and
+only when they cover exactly the columns the ILIKE scan would search. The trigram index then returns the rows
+of the ILIKE scan; the full-text index returns the rows containing the words of the value.
+"""
+
+
+def build_search_condition(table_name, columns, search_value, joiner, cur):
+    if joiner.strip().upper() == "OR":
+        search_index = get_search_index(table_name, cur)
+        if search_index:
+            backend_name, index_expression, index_columns = search_index
+            if index_columns is not None and set(index_columns) == set(columns):
+                return search_backends[backend_name].build_condition(columns, search_value, joiner,
+                                                                     index_expression)
+
+    return search_backends["ilike"].build_condition(columns, search_value, joiner)
@@ -0,0 +1,272 @@
+"""
+statementCache.py
+==============
+Author: Stanley Parmar
+Description: Cache of the rendered CRUD statements per (table, operation, column-set), with optional
+server-side PREPARE per pooled connection.
+
+Entries are keyed on the schema generation of the table (see schemaCache.py), so the DDL hooks of
+tableEntityOperation retire the statements of a changed table together with its cached columns. The
+generation is also part of the PREPAREd statement name, so a connection never EXECUTEs a plan made before
+the table changed; a failing EXECUTE (statement gone, or "cached plan must not change result type" after DDL
+made elsewhere) is PREPAREd again and retried once when the failed transaction held nothing else. Inside a
+caller's transaction the error is raised (the transaction is aborted anyway) and the statement is PREPAREd
+again on its next use.
+"""
+
+# statementCache.py
+
+# Import the default Libraries
+import hashlib
+import re
+import threading
+import weakref
+from collections import OrderedDict
+
+import psycopg2
+import psycopg2.extensions
+
+# Import the custom Libraries
+from backend.common.commonUtility import open_read_file
+from backend.common.schemaCache import get_schema_generation
+
+# Defaults when the general config does not define 'statement_cache_size' / 'prepare_statements'
+DEFAULT_STATEMENT_CACHE_SIZE = 512
+DEFAULT_PREPARE_STATEMENTS = False
+
+# psycopg2 placeholders: %% (literal percent), %(name)s and %s
+PLACEHOLDER_PATTERN = re.compile(r"%%|%\((\w+)\)s|%s")
+# EXECUTE errors fixed by PREPAREing again: statement does not exist, cached plan must not change result type
+RETRY_EXECUTE_PGCODES = ('26000', '0A000')
+
+# (table_name, operation, columns, schema generation) -> rendered SQL, least recently used first
+_statement_cache = OrderedDict()
+_statement_cache_lock = threading.Lock()
+_statement_config = None
+# connection -> names of the statements PREPAREd on it
+_prepared_statements = weakref.WeakKeyDictionary()
+# connection -> names of PREPAREd statements whose plan went stale, DEALLOCATEd before they are PREPAREd again
+_stale_statements = weakref.WeakKeyDictionary()
+_statement_cache_stats = {
+    "hits": 0,
+    "misses": 0,
+    "evictions": 0,
+    "prepares": 0,
+    "prepared_executions": 0,
+    "retries": 0,
+}
+
+
+"""
+Function Name: get_statement_config
+Inputs: None
+Output: config (dict): cache size and whether statements are PREPAREd, read once from the general config.
+"""
+
+
+def get_statement_config():
+    global _statement_config
+    if _statement_config is None:
+        config = open_read_file('resources', '', 'general') or {}
+        _statement_config = {
+            "size": int(config.get('statement_cache_size', DEFAULT_STATEMENT_CACHE_SIZE)),
+            "prepare": bool(config.get('prepare_statements', DEFAULT_PREPARE_STATEMENTS)),
+        }
+    return _statement_config
+
+
+"""
+Function Name: get_statement
+Inputs:
+- cursor: Open cursor, used to render the statement the first time.
+- table_name (str): The table the statement works on.
+- operation (str): Name of the operation, e.g. "insert", "update", "delete".
+- columns (tuple): Hashable description of the columns the statement uses.
+- build_query (callable): Returns the sql.Composed statement, only called on a cache miss.
+
+Output: str: The rendered SQL.
+"""
+
+
+def get_statement(cursor, table_name, operation, columns, build_query):
+    key = (table_name, operation, columns, get_schema_generation(table_name))
+    with _statement_cache_lock:
+        sql_text = _statement_cache.get(key)
+        if sql_text is not None:
+            _statement_cache.move_to_end(key)
+            _statement_cache_stats["hits"] += 1
+            return sql_text
+        _statement_cache_stats["misses"] += 1
+
+    sql_text = build_query().as_string(cursor)
+
+    with _statement_cache_lock:
+        _statement_cache[key] = sql_text
+        while len(_statement_cache) > get_statement_config()["size"]:
+            _statement_cache.popitem(last=False)
+            _statement_cache_stats["evictions"] += 1
+    return sql_text
+
+
+"""
+Function Name: to_prepared_sql
+Inputs: sql_text (str): Rendered SQL with psycopg2 placeholders.
+Output: (prepared_text, parameter_keys): SQL with $n placeholders and the key (name or position) of each $n.
+"""
+
+
+def to_prepared_sql(sql_text):
+    parameter_keys = []
+
+    def replace(match):
+        if match.group(0) == "%%":
+            return "%"
+        name = match.group(1)
+        if name is None:
+            # Positional placeholder, the key is its index in the parameter list
+            parameter_keys.append(len(parameter_keys))
+            return "${}".format(len(parameter_keys))
+        if name not in parameter_keys:
+            parameter_keys.append(name)
+        return "${}".format(parameter_keys.index(name) + 1)
+
+    return PLACEHOLDER_PATTERN.sub(replace, sql_text), parameter_keys
+
+
+"""
+Function Name: execute_statement
+Inputs:
+- cursor: Open cursor to execute on.
+- table_name, operation, columns, build_query: See get_statement.
+- parameters (list/tuple/dict): Parameters of the statement.
+
+Output: None, results are read from the cursor as usual.
+
+Description:
+Executes the cached statement. When 'prepare_statements' is enabled the statement is PREPAREd once per
+pooled connection and run with EXECUTE, so the server skips parsing and planning on later calls.
+"""
+
+
+def execute_statement(cursor, table_name, operation, columns, build_query, parameters=None):
+    sql_text = get_statement(cursor, table_name, operation, columns, build_query)
+
+    if not get_statement_config()["prepare"]:
+        cursor.execute(sql_text, parameters)
+        return
+
+    prepared_text, parameter_keys = to_prepared_sql(sql_text)
+    statement_name = "stmt_{}_{}".format(hashlib.md5(prepared_text.encode('utf-8')).hexdigest()[:24],
+                                         get_schema_generation(table_name))
+
+    connection = cursor.connection
+    # A failed EXECUTE aborts the transaction, it is only retried when the transaction held nothing else
+    can_retry = connection.autocommit or (
+        connection.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE)
+    with _statement_cache_lock:
+        prepared = _prepared_statements.setdefault(connection, set())
+        is_prepared = statement_name in prepared
+
+    if not is_prepared:
+        prepare_statement(cursor, statement_name, prepared_text)
+
+    values = [parameters[key] for key in parameter_keys]
+    if values:
+        execute_sql = "EXECUTE {} ({})".format(statement_name, ", ".join(["%s"] * len(values)))
+    else:
+        execute_sql = "EXECUTE {}".format(statement_name)
+
+    try:
+        cursor.execute(execute_sql, values or None)
+    except psycopg2.Error as e:
+        if e.pgcode not in RETRY_EXECUTE_PGCODES:
+            raise
+        with _statement_cache_lock:
+            prepared.discard(statement_name)
+            if e.pgcode != '26000':
+                _stale_statements.setdefault(connection, set()).add(statement_name)
+        if not can_retry:
+            raise
+        if not connection.autocommit:
+            # Only the PREPARE and this EXECUTE ran in the aborted transaction
+            connection.rollback()
+        prepare_statement(cursor, statement_name, prepared_text)
+        cursor.execute(execute_sql, values or None)
+        with _statement_cache_lock:
+            _statement_cache_stats["retries"] += 1
+
+    with _statement_cache_lock:
+        _statement_cache_stats["prepared_executions"] += 1
+
+
+"""
+Function Name: prepare_statement
+Inputs: cursor, statement_name, prepared_text
+Output: None
+
+Description:
+PREPAREs the statement on the cursor's connection and remembers it for that connection. A stale plan of the
+same name is DEALLOCATEd first.
+"""
+
+
+def prepare_statement(cursor, statement_name, prepared_text):
+    with _statement_cache_lock:
+        stale = _stale_statements.get(cursor.connection, set())
+        is_stale = statement_name in stale
+        stale.discard(statement_name)
+    if is_stale:
+        cursor.execute("DEALLOCATE {}".format(statement_name))
+    cursor.execute("PREPARE {} AS {}".format(statement_name, prepared_text))
+    with _statement_cache_lock:
+        _prepared_statements.setdefault(cursor.connection, set()).add(statement_name)
+        _statement_cache_stats["prepares"] += 1
+
+
+"""
+Function Name: forget_prepared_statements
+Inputs: connection
+Output: None
+
+Description:
+Forgets what was PREPAREd on the connection, call it when the connection's session is reset or replaced.
+"""
+
+
+def forget_prepared_statements(connection):
+    with _statement_cache_lock:
+        _prepared_statements.pop(connection, None)
+        _stale_statements.pop(connection, None)
+
+
+"""
+Function Name: deallocate_prepared_statements
+Inputs: cursor: Cursor of the connection that ran DDL.
+Output: None
+
+Description:
+Drops the statements PREPAREd on the cursor's connection (DEALLOCATE ALL is not undone by a rollback) and
+forgets them, called by the DDL helpers of tableEntityOperation.
+"""
+
+
+def deallocate_prepared_statements(cursor):
+    if not get_statement_config()["prepare"]:
+        return
+    cursor.execute("DEALLOCATE ALL")
+    forget_prepared_statements(cursor.connection)
+
+
+"""
+Function Name: get_statement_cache_stats
+Inputs: None
+Output: stats (dict): hits, misses, evictions, prepares, prepared executions and size of the cache.
+"""
+
+
+def get_statement_cache_stats():
+    with _statement_cache_lock:
+        stats = dict(_statement_cache_stats)
+        stats["size"] = len(_statement_cache)
+    stats["prepare"] = get_statement_config()["prepare"]
+    return stats
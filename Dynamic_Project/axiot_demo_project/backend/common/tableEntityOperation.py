@@ -14,7 +14,12 @@ import psycopg2
 from psycopg2 import sql
 
 from backend.common.entityOperation import get_schema_columns
-from backend.dbConnectionPool import get_connection, release_connection
+from backend.common.schemaCache import invalidate_schema_cache
+from backend.common.countCache import invalidate_count_cache
+from backend.common.dbCallLog import log_db_call
+from backend.common.searchBackend import search_backends, get_search_index_name, get_searchable_columns
+from backend.common.dbSession import db_session, on_commit
+from backend.common.statementCache import deallocate_prepared_statements
 from backend.common.commonUtility import (debug_print, logger)
 from backend.jsonResponse import ResponseCode
 
@@ -27,13 +32,6 @@ query_config = {
     'add_column': "ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type};"
 }
 
-def close_conn_cursor(con, cur, is_new_cur = True):
-    if cur and is_new_cur:
-        cur.close()
-    if con and is_new_cur:
-        release_connection(con)
-
-
 def handle_database_exception(e):
     if isinstance(e, psycopg2.Error):
         # Log the error details
@@ -55,29 +53,20 @@ def handle_database_exception(e):
 # get the primary column From postgres
 def get_next_sequence_value(table_name, id_column, cur=None):
 
-    con = None
-    is_new_cur = False
-
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Build default sequence name (PostgreSQL default: {table}_{column}_seq)
-        sequence_name = "{}_{}_seq".format(table_name, id_column)
-
-        # insert query
-        query = sql.SQL("SELECT NEXTVAL(%s)")
+        with db_session(cur=cur) as cur:
+            # Build default sequence name (PostgreSQL default: {table}_{column}_seq)
+            sequence_name = "{}_{}_seq".format(table_name, id_column)
 
-        # Execute the query
-        cur.execute(query, (sequence_name,))
+            # insert query
+            query = sql.SQL("SELECT NEXTVAL(%s)")
 
-        # Fetch once and reuse
-        result = cur.fetchone()[0]
-        print(result)
-        return result
+            # Execute the query
+            cur.execute(query, (sequence_name,))
 
+            # Fetch once and reuse
+            result = cur.fetchone()[0]
+            return result
     except psycopg2.Error as e:
         traceback.print_exc()
         return handle_database_exception(e)
@@ -87,35 +76,24 @@ def get_next_sequence_value(table_name, id_column, cur=None):
         logger.warning(f"Error in get_next_sequence_value: {str(e)}")
         traceback.print_exc()
 
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
-
 
 def is_table_exist(table_name, cur=None):
-    con = None
-    is_new_cur = False
-
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Query Built For Check table is exist
-        query = sql.SQL("""
-            SELECT EXISTS (
-                SELECT 1
-                FROM information_schema.tables
-                WHERE table_schema = 'public'
-                AND table_name = {}
-            ) """).format(sql.Literal(table_name))
-
-        # Execute the query
-        cur.execute(query)
-
-        # return the value boolean
-        return cur.fetchone()[0]
+        with db_session(readonly=True, cur=cur) as cur:
+            # Query Built For Check table is exist
+            query = sql.SQL("""
+                SELECT EXISTS (
+                    SELECT 1
+                    FROM information_schema.tables
+                    WHERE table_schema = 'public'
+                    AND table_name = {}
+                ) """).format(sql.Literal(table_name))
 
+            # Execute the query
+            cur.execute(query)
+
+            # return the value boolean
+            return cur.fetchone()[0]
     except psycopg2.Error as e:
         traceback.print_exc()
         return handle_database_exception(e)
@@ -125,216 +103,263 @@ def is_table_exist(table_name, cur=None):
         logger.warning(f"Error in is_table_exist: {str(e)}")
         traceback.print_exc()
 
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
-
 
 def create_primary_key(table_name, column_name_list, cur=None):
-    con = None
-    is_new_cur = False
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        cur = con.cursor()
-        # Create the CREATE TABLE query
-        query = sql.SQL("ALTER TABLE  {} ADD CONSTRAINT {} PRIMARY KEY  ({});").format(
-            sql.Identifier(table_name),
-            sql.Identifier(table_name + "_pkey"),
-            sql.SQL(', ').join(map(sql.Identifier, column_name_list))
-        )
-        debug_print("Query check: {}".format(cur.mogrify(query).decode('utf-8')))
-
-        # Execute the query
-        cur.execute(query)
-
-        con.commit()
+        with db_session(cur=cur) as cur:
+            # Create the CREATE TABLE query
+            query = sql.SQL("ALTER TABLE  {} ADD CONSTRAINT {} PRIMARY KEY  ({});").format(
+                sql.Identifier(table_name),
+                sql.Identifier(table_name + "_pkey"),
+                sql.SQL(', ').join(map(sql.Identifier, column_name_list))
+            )
+            debug_print("Query check: {}".format(cur.mogrify(query).decode('utf-8')))
 
-        debug_print("Table created.")
+            # Execute the query
+            cur.execute(query)
 
+            debug_print("Table created.")
     except Exception as e:
-        if con:
-            con.rollback()
         traceback.print_exc()
         debug_print("Failed to fetch create_table Exception records: {}".format(e))
         raise e
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
 
 def create_trigger(table_name, cur=None):
-    con = None
-    is_new_cur = False
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        cur = con.cursor()
-        # Create the CREATE TABLE query
-        query = sql.SQL("CREATE OR REPLACE FUNCTION fn_{}_table_changes() RETURNS TRIGGER "
-                        " AS $$ BEGIN IF TG_OP = 'INSERT' THEN RAISE NOTICE "
-                        " 'Old : %, New : %', OLD.tenant_id, NEW.tenant_id; "
-                        " NEW.created_at := CURRENT_TIMESTAMP; NEW.created_by := CURRENT_USER; "
-                        " NEW.updated_at := CURRENT_TIMESTAMP; NEW.updated_by := CURRENT_USER;RETURN NEW;"
-                        " ELSIF TG_OP = 'UPDATE' THEN RAISE NOTICE 'Old : %, New : %', OLD.tenant_id, "
-                        " NEW.tenant_id; NEW.updated_at := CURRENT_TIMESTAMP; NEW.updated_by := CURRENT_USER;"
-                        " RETURN NEW;ELSIF TG_OP = 'DELETE' THEN RAISE NOTICE 'Old : %, New : %', OLD.tenant_id, "
-                        " NEW.tenant_id;RETURN OLD;END IF;END;$$ LANGUAGE 'plpgsql';"
-                        " CREATE OR REPLACE TRIGGER trg_{}_insert "
-                        " AFTER INSERT ON {} FOR EACH ROW EXECUTE FUNCTION  "
-                        " fn_{}_table_changes() ; "
-                        " CREATE OR REPLACE TRIGGER trg_{}_update "
-                        " BEFORE UPDATE ON {} FOR EACH ROW EXECUTE FUNCTION  "
-                        " fn_{}_table_changes() ;"
-                        " CREATE OR REPLACE TRIGGER trg_{}_delete "
-                        " BEFORE DELETE ON {} FOR EACH ROW EXECUTE FUNCTION  "
-                        " fn_{}_table_changes() ; ").format(
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower()),
-            sql.SQL(str(table_name).lower())
-        )
-        # debug_print("Query check: {}".format(cursor.mogrify(query).decode('utf-8')))
-
-        # Execute the query
-        cur.execute(query)
-
-        con.commit()
-
-        debug_print("Trigger created.")
+        with db_session(cur=cur) as cur:
+            # Create the CREATE TABLE query
+            query = sql.SQL("CREATE OR REPLACE FUNCTION fn_{}_table_changes() RETURNS TRIGGER "
+                            " AS $$ BEGIN IF TG_OP = 'INSERT' THEN RAISE NOTICE "
+                            " 'Old : %, New : %', OLD.tenant_id, NEW.tenant_id; "
+                            " NEW.created_at := CURRENT_TIMESTAMP; NEW.created_by := CURRENT_USER; "
+                            " NEW.updated_at := CURRENT_TIMESTAMP; NEW.updated_by := CURRENT_USER;RETURN NEW;"
+                            " ELSIF TG_OP = 'UPDATE' THEN RAISE NOTICE 'Old : %, New : %', OLD.tenant_id, "
+                            " NEW.tenant_id; NEW.updated_at := CURRENT_TIMESTAMP; NEW.updated_by := CURRENT_USER;"
+                            " RETURN NEW;ELSIF TG_OP = 'DELETE' THEN RAISE NOTICE 'Old : %, New : %', OLD.tenant_id, "
+                            " NEW.tenant_id;RETURN OLD;END IF;END;$$ LANGUAGE 'plpgsql';"
+                            " CREATE OR REPLACE TRIGGER trg_{}_insert "
+                            " AFTER INSERT ON {} FOR EACH ROW EXECUTE FUNCTION  "
+                            " fn_{}_table_changes() ; "
+                            " CREATE OR REPLACE TRIGGER trg_{}_update "
+                            " BEFORE UPDATE ON {} FOR EACH ROW EXECUTE FUNCTION  "
+                            " fn_{}_table_changes() ;"
+                            " CREATE OR REPLACE TRIGGER trg_{}_delete "
+                            " BEFORE DELETE ON {} FOR EACH ROW EXECUTE FUNCTION  "
+                            " fn_{}_table_changes() ; ").format(
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower()),
+                sql.SQL(str(table_name).lower())
+            )
+            # debug_print("Query check: {}".format(cursor.mogrify(query).decode('utf-8')))
 
+            # Execute the query
+            cur.execute(query)
+
+            debug_print("Trigger created.")
     except Exception as e:
-        if con:
-            con.rollback()
         traceback.print_exc()
         debug_print("Failed to fetch create_table Exception records: {}".format(e))
         raise e
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
 
+@log_db_call("create_table")
 def create_table(table_name, columns_list, cur=None):
-    con = None
-    is_new_cur = False
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Create the CREATE TABLE query
-        query = sql.SQL("DROP TABLE IF EXISTS {} CASCADE;CREATE TABLE IF NOT EXISTS {} ({});"
-                        " ALTER TABLE IF EXISTS {} OWNER to postgres; "
-                        " ALTER TABLE IF EXISTS {} OWNER to powerbiusr; ").format(
-            sql.Identifier(table_name),
-            sql.Identifier(table_name),
-            sql.SQL(', ').join(columns_list),
-            sql.Identifier(table_name),
-            sql.Identifier(table_name),
-        )
-
-        # Execute the query
-        cur.execute(query)
-
-        # Commit the changes
-        con.commit()
-
-        print("Table created.")
+        with db_session(cur=cur) as cur:
+            # Create the CREATE TABLE query
+            query = sql.SQL("DROP TABLE IF EXISTS {} CASCADE;CREATE TABLE IF NOT EXISTS {} ({});"
+                            " ALTER TABLE IF EXISTS {} OWNER to postgres; "
+                            " ALTER TABLE IF EXISTS {} OWNER to powerbiusr; ").format(
+                sql.Identifier(table_name),
+                sql.Identifier(table_name),
+                sql.SQL(', ').join(columns_list),
+                sql.Identifier(table_name),
+                sql.Identifier(table_name),
+            )
+
+            # Execute the query
+            cur.execute(query)
+            # Plans PREPAREd on this connection may predate the change
+            deallocate_prepared_statements(cur)
 
+            # The table was dropped and recreated, forget its cached columns and counts once that is committed
+            on_commit(cur, lambda: invalidate_schema_cache(table_name))
+            on_commit(cur, lambda: invalidate_count_cache(table_name))
+
+        debug_print("Table created.")
     except psycopg2.Error as e:
         traceback.print_exc()  # This will print the full traceback, including the line number
         return handle_database_exception(e)
 
     except Exception as e:
-        if con:
-            con.rollback()
         debug_print(f"Error in create_table: {str(e)}")
         logger.warning(f"Error in create_table: {str(e)}")
         traceback.print_exc()
 
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
-
 
+@log_db_call("add_column")
 def add_column(table_name, column_name, column_type, cur=None):
-    con = None
-    is_new_cur = False
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Get the existing columns in the table
-        existing_columns = get_schema_columns(table_name)
-
-        if column_name not in existing_columns:
-
-            query = sql.SQL("ALTER TABLE {} ADD COLUMN {} {}").format(
-                sql.Identifier(table_name),
-                sql.Identifier(column_name),
-                sql.SQL(column_type)
-            )
-
-            # Execute the query
-            cur.execute(query)
-
+        with db_session(cur=cur) as cur:
+            # Get the existing columns in the table
+            existing_columns = get_schema_columns(table_name, cur)
+
+            if column_name not in existing_columns:
+
+                query = sql.SQL("ALTER TABLE {} ADD COLUMN {} {}").format(
+                    sql.Identifier(table_name),
+                    sql.Identifier(column_name),
+                    sql.SQL(column_type)
+                )
+
+                # Execute the query
+                cur.execute(query)
+                # Plans PREPAREd on this connection may predate the change
+                deallocate_prepared_statements(cur)
+
+                # New column added, forget the cached columns and counts of the table once that is committed
+                on_commit(cur, lambda: invalidate_schema_cache(table_name))
+                on_commit(cur, lambda: invalidate_count_cache(table_name))
     except Exception as e:
         debug_print(f"Error in add_column: {str(e)}")
         logger.warning(f"Error in add_column: {str(e)}")
         traceback.print_exc()
 
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
-
 
+@log_db_call("add_column")
 def add_bulk_column(table_name, columns_list, cur=None):
 
-    con = None
-    is_new_cur = False
     try:
-        if cur is None:
-            con = get_connection()
-            cur = con.cursor()
-            is_new_cur = True
-
-        # Get the existing columns in the table
-        existing_columns = get_schema_columns(table_name)
-
-        # Add Column List if Not in existing clm list
-        columns_to_add = [
-            sql.SQL("ADD COLUMN {} {}").format(sql.Identifier(clm_name), sql.SQL(clm_type))
-            for clm_name, clm_type in columns_list
-            if clm_name not in existing_columns
-        ]
-
-        # process only if add column
-        if columns_to_add:
+        with db_session(cur=cur) as cur:
+            # Get the existing columns in the table
+            existing_columns = get_schema_columns(table_name, cur)
+
+            # Add Column List if Not in existing clm list
+            columns_to_add = [
+                sql.SQL("ADD COLUMN {} {}").format(sql.Identifier(clm_name), sql.SQL(clm_type))
+                for clm_name, clm_type in columns_list
+                if clm_name not in existing_columns
+            ]
+
+            # process only if add column
+            if columns_to_add:
             
-            # build Add column clause Query
-            query = sql.SQL("ALTER TABLE {} {}").format(
-                sql.Identifier(table_name),
-                sql.SQL(', ').join(columns_to_add)
-            )
+                # build Add column clause Query
+                query = sql.SQL("ALTER TABLE {} {}").format(
+                    sql.Identifier(table_name),
+                    sql.SQL(', ').join(columns_to_add)
+                )
+
+                # Execute the query
+                cur.execute(query)
+                # Plans PREPAREd on this connection may predate the change
+                deallocate_prepared_statements(cur)
+
+                # New columns added, forget the cached columns and counts of the table once that is committed
+                on_commit(cur, lambda: invalidate_schema_cache(table_name))
+                on_commit(cur, lambda: invalidate_count_cache(table_name))
+    except Exception as e:
+        debug_print(f"Error in add_bulk_column: {str(e)}")
+        logger.warning(f"Error in add_bulk_column: {str(e)}")
+        traceback.print_exc()
 
-            # Execute the query
-            cur.execute(query)
 
-            # Commit the changes
-            con.commit()
+"""
+Function Name: drop_search_index
+Inputs: table_name, cur (optional)
+Output: None
+
+Description:
+Drops every search index (trigram and full-text) of the table, the record search falls back to the ILIKE scan.
+On its own connection the indexes are dropped CONCURRENTLY, so writes to the table are not blocked. In the
+caller's transaction a failed drop is rolled back to a savepoint, so the transaction stays usable.
+"""
+
 
+@log_db_call("drop_index")
+def drop_search_index(table_name, cur=None):
+    try:
+        with db_session(cur=cur, autocommit=cur is None) as cur:
+            # CONCURRENTLY cannot run inside a transaction block
+            concurrently = cur.connection.autocommit
+            if not concurrently:
+                cur.execute("SAVEPOINT drop_search_index")
+            try:
+                for backend in search_backends.values():
+                    if backend.index_suffix:
+                        cur.execute(sql.SQL("DROP INDEX {}IF EXISTS {}").format(
+                            sql.SQL("CONCURRENTLY " if concurrently else ""),
+                            sql.Identifier(get_search_index_name(table_name, backend))))
+            except psycopg2.Error:
+                if not concurrently:
+                    cur.execute("ROLLBACK TO SAVEPOINT drop_search_index")
+                raise
+            if not concurrently:
+                cur.execute("RELEASE SAVEPOINT drop_search_index")
+
+            # Forget the cached search index of the table once the drop is committed
+            on_commit(cur, lambda: invalidate_schema_cache(table_name))
     except Exception as e:
-        debug_print(f"Error in add_bulk_column: {str(e)}")
-        logger.warning(f"Error in add_bulk_column: {str(e)}")
+        debug_print(f"Error in drop_search_index: {str(e)}")
+        logger.warning(f"Error in drop_search_index: {str(e)}")
         traceback.print_exc()
 
-    finally:
-        close_conn_cursor(con, cur, is_new_cur)
\ No newline at end of file
+
+"""
+Function Name: create_search_index
+Inputs:
+- table_name (str): The table to index.
+- backend_name (str): "trigram" (pg_trgm GIN index, same results as the ILIKE scan) or "fulltext_word_match"
+  (tsvector GIN index, the search then matches whole words instead of substrings).
+- columns_list (list): Columns to index (optional, default the columns the ILIKE scan searches: the ones without
+  a default value).
+- cur (optional)
+Output: None
+
+Description:
+Replaces the search index of the table. fetch_record_search and fetch_record_search_json use it automatically
+for OR-ed all-columns searches, as long as it covers exactly the columns the ILIKE scan would search.
+On its own connection the index is built CONCURRENTLY, so writes to the table are not blocked; in the caller's
+transaction (cur given) it is a plain CREATE INDEX.
+"""
+
+
+@log_db_call("create_index")
+def create_search_index(table_name, backend_name="trigram", columns_list=None, cur=None):
+    try:
+        with db_session(cur=cur, autocommit=cur is None) as cur:
+            backend = search_backends[backend_name]
+            if not backend.index_suffix:
+                raise ValueError("Search backend {} does not use an index.".format(backend_name))
+
+            if not columns_list:
+                columns_list = get_schema_columns(table_name, cur)
+                searchable_columns = get_searchable_columns(table_name, cur)
+                not_indexable = [column for column in columns_list if column not in searchable_columns]
+                if not_indexable:
+                    raise ValueError("Columns {} of {} cannot be part of a search index.".format(
+                        not_indexable, table_name))
+            if not columns_list:
+                raise ValueError("Table {} has no searchable columns.".format(table_name))
+
+            # Only one search index per table, drop the current one first
+            drop_search_index(table_name, cur)
+
+            for query in backend.build_index_statements(table_name, columns_list,
+                                                        concurrently=cur.connection.autocommit):
+                cur.execute(query)
+
+            # Forget the cached search index of the table once the index is committed
+            on_commit(cur, lambda: invalidate_schema_cache(table_name))
+
+        debug_print("Search index created.")
+    except Exception as e:
+        debug_print(f"Error in create_search_index: {str(e)}")
+        logger.warning(f"Error in create_search_index: {str(e)}")
+        traceback.print_exc()
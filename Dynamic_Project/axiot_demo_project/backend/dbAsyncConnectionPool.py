@@ -0,0 +1,99 @@
+"""
+dbAsyncConnectionPool
+==============
+
+Author: Stanley Parmar
+
+Description: Async connection pool (asyncpg) for Postgres, the asyncio counterpart of dbConnectionPool.
+             Each event loop gets its own pool, created on first use inside that loop (e.g. one per
+             asyncio.run call or per worker thread running a loop); close_pool closes the pool of the running loop.
+
+             The async pools share the 'async_max_conn' connections of the postgres config, which dbPoolManager
+             takes out of max_conn, so both layers together stay within max_conn. A pool gets what the pools of
+             the other loops leave, a loop finding the budget used up gets an AsyncPoolBudgetError.
+
+See the examples directory to learn about the usage.
+
+"""
+import asyncio
+import threading
+
+import asyncpg
+from backend.common.commonUtility import open_read_file_box, get_sys_args, logger
+from backend.dbPoolManager import get_connection_budget
+
+# Running event loop -> its pool / creation lock, an asyncpg pool only works on the loop it was created in
+_pools = {}
+_pool_locks = {}
+# Running event loop -> max_size of its pool, their sum stays within async_max_conn
+_pool_sizes = {}
+_pool_sizes_lock = threading.Lock()
+
+
+class AsyncPoolBudgetError(RuntimeError):
+    """The async_max_conn connections are all taken by the pools of other event loops, or none are configured."""
+
+
+def reserve_pool_size(loop, async_max_conn):
+    """Reserve what is left of async_max_conn for the pool of the loop."""
+    with _pool_sizes_lock:
+        max_size = async_max_conn - sum(_pool_sizes.values())
+        if max_size <= 0:
+            raise AsyncPoolBudgetError("no connections left for an async pool (async_max_conn={})".format(
+                async_max_conn))
+        _pool_sizes[loop] = max_size
+    return max_size
+
+
+async def get_pool():
+    """Get the pool of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is not None:
+        return pool
+
+    async with _pool_locks.setdefault(loop, asyncio.Lock()):
+        pool = _pools.get(loop)
+        if pool is None:
+            filename = get_sys_args()
+            db_config = open_read_file_box(filename + '_postgres')
+            _, async_max_conn = get_connection_budget(db_config)
+            max_size = reserve_pool_size(loop, async_max_conn)
+            try:
+                pool = await asyncpg.create_pool(
+                    min_size=min(int(db_config['min_conn']), max_size),
+                    max_size=max_size,
+                    user=db_config["db_user"],
+                    password=db_config["db_password"],
+                    host=db_config["db_host"],
+                    port=db_config["db_port"],
+                    database=db_config["db_name"]
+                )
+            except Exception:
+                with _pool_sizes_lock:
+                    _pool_sizes.pop(loop, None)
+                raise
+            _pools[loop] = pool
+            logger.info("made async connection pool")
+    return pool
+
+
+async def get_connection():
+    """Get a connection from the pool."""
+    return await (await get_pool()).acquire()
+
+
+async def release_connection(conn):
+    """Release a connection back to the pool."""
+    await (await get_pool()).release(conn)
+
+
+async def close_pool():
+    """Close all connections in the pool of the running event loop, call it before the loop ends."""
+    loop = asyncio.get_running_loop()
+    _pool_locks.pop(loop, None)
+    pool = _pools.pop(loop, None)
+    if pool is not None:
+        await pool.close()
+        with _pool_sizes_lock:
+            _pool_sizes.pop(loop, None)
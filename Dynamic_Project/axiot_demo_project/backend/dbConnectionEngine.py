@@ -8,63 +8,64 @@ Description: Db connection is a Library for connecting to Postgres in
              various ways and also registering ,querying and deleting the
              users.
 
+             The engine is created on first use (or by init_app), importing the module connects to nothing.
+             It checks its connections out of the shared pool of dbPoolManager.
+
 See the examples directory to learn about the usage.
 
 """
-import psycopg2.pool
 from backend.common.commonUtility import open_read_file_box, get_sys_args, logger
-from sqlalchemy import create_engine
-from sqlalchemy.pool import QueuePool
-from urllib.parse import quote_plus
-
-# get the database configurations
-logger.info("in engine")
-
-try:
-    filename = get_sys_args()
-except Exception as e:
-    logger.error("to get system arguments, {}".format(str(e)))
-
-try:
-    db_config = open_read_file_box(filename + '_postgres')
-except Exception as e:
-    logger.error("to get open read file, {}".format(str(e)))
-
-# pool = None
-
-try:
-    encoded_username = quote_plus(db_config["db_user"])
-    encoded_password = quote_plus(db_config["db_password"])
-    # Initialize the PostgreSQL db
-    db_url = "postgresql+psycopg2://{user}:{password}@{host}:{port}/{database}".format(
-        user=encoded_username,
-        password=encoded_password,
-        host=db_config["db_host"],
-        port=db_config["db_port"],
-        database=db_config["db_name"]
-    )
-except Exception as e:
-    logger.info("entered in exception for postgress db")
-    logger.error(e)
-
-try:
-    # Initialize the engine
-    engine = create_engine(
-        db_url,
-        poolclass=QueuePool,
-        pool_size=5,
-        max_overflow=10,
-        pool_timeout=30,
-        pool_recycle=1800
-    )
-except Exception as e:
-    logger.info("entered in exception for engine")
-    logger.error(e)
+from backend.common.lazyInit import LazyInitializer
+from backend.dbPoolManager import get_pool_manager
+
+
+def load_db_config():
+    """Read the Postgres config of the running app."""
+    # get the database configurations
+    try:
+        filename = get_sys_args()
+    except Exception as e:
+        logger.error("to get system arguments, {}".format(str(e)))
+        raise
+
+    try:
+        db_config = open_read_file_box(filename + '_postgres')
+    except Exception as e:
+        logger.error("to get open read file, {}".format(str(e)))
+        raise
+    return filename, db_config
+
+
+def create_db_engine():
+    """Initialize the SQLAlchemy engine, its connections come from the shared pool of dbPoolManager."""
+    logger.info("in engine")
+    try:
+        return get_pool_manager().create_engine("engine")
+    except Exception as e:
+        logger.info("entered in exception for engine")
+        logger.error(e)
+        raise
+
+
+_db_config = LazyInitializer(load_db_config)
+_engine = LazyInitializer(create_db_engine)
+
+
+def get_engine():
+    """Get the engine, creating it on first use."""
+    return _engine.get()
+
+
+def __getattr__(name):
+    # Keeps 'dbConnectionEngine.engine' working without creating the engine at import
+    if name == "engine":
+        return get_engine()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def get_connection():
     """Get a connection from the pool."""
-    return engine.connect()
+    return get_engine().connect()
 
 
 def release_connection(conn):
@@ -72,5 +73,13 @@ def release_connection(conn):
     conn.close()
 
 
+def dispose_engine():
+    """Close the pooled connections of the engine."""
+    engine = _engine.reset()
+    if engine is not None:
+        engine.dispose()
+
+
 def get_db_host():
+    filename, db_config = _db_config.get()
     return filename, db_config["db_host"]
@@ -8,60 +8,64 @@ Description: Dbconnection is a Library for connecting to Postgress in
              various ways and also registering ,querying and deleteing the
              users.
 
+             The pool is created on first use (or by init_app), importing the module connects to nothing.
+             It is the pool of dbPoolManager, shared with the SQLAlchemy engines.
+
 See the examples directory to learn about the usage.
 
 """
-import psycopg2.pool
 from backend.common.commonUtility import open_read_file_box, get_sys_args, logger
+from backend.common.lazyInit import LazyInitializer
+from backend.dbPoolManager import get_pool_manager, close_pool_manager
+
+
+def load_db_config():
+    """Read the Postgres config of the running app."""
+    # get the database configurations
+    try:
+        filename = get_sys_args()
+    except Exception as e:
+        logger.error("to get system arguments, {}".format(str(e)))
+        raise
+
+    try:
+        db_config = open_read_file_box(filename + '_postgres')
+    except Exception as e:
+        logger.error("to get openreadfile, {}".format(str(e)))
+        raise
+    return filename, db_config
 
-# get the database configurations
-logger.info("in connection pool")
 
-try:
-    filename = get_sys_args()
-except Exception as e:
-    logger.error("to get system arguments, {}".format(str(e)))
+_db_config = LazyInitializer(load_db_config)
 
-try:
-    db_config = open_read_file_box(filename + '_postgres')
-except Exception as e:
-    logger.error("to get openreadfile, {}".format(str(e)))
 
-# pool = None
+def get_pool():
+    """Get the pool (shared with the SQLAlchemy engines, see dbPoolManager), creating it on first use."""
+    return get_pool_manager().pool
 
-try:
-    # Initialize the PostgreSQL connection pool
-    pool = psycopg2.pool.ThreadedConnectionPool(
-        minconn=db_config['min_conn'],
-        maxconn=db_config['max_conn'],
-        user=db_config["db_user"],
-        password=db_config["db_password"],
-        host=db_config["db_host"],
-        port=db_config["db_port"],
-        database=db_config["db_name"]
-    )
-except Exception as e:
-    logger.info("entered in exception")
-    logger.error(e)
 
-if pool:
-    logger.info("made connection pool")
+def __getattr__(name):
+    # Keeps 'dbConnectionPool.pool' working without creating the pool at import
+    if name == "pool":
+        return get_pool()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
 
 
 def get_connection():
     """Get a connection from the pool."""
-    return pool.getconn()
+    return get_pool_manager().get_connection("pool")
 
 
 def release_connection(conn):
     """Release a connection back to the pool."""
-    pool.putconn(conn)
+    get_pool_manager().release_connection(conn)
 
 
 def close_pool():
     """Close all connections in the pool."""
-    pool.closeall()
+    close_pool_manager()
 
 
 def get_db_host():
+    filename, db_config = _db_config.get()
     return filename, db_config["db_host"]
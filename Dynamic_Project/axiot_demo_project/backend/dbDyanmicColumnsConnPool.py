@@ -8,23 +8,22 @@ Description: Dbconnection is a Library for connecting to Postgress in
              various ways and also registering ,querying and deleteing the
              users.
 
+             The global Database is created on first use (get_db), importing the module connects to nothing.
+
 See the examples directory to learn about the usage.
 
 """
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.orm import sessionmaker
 from backend.common.commonUtility import open_read_file_box, get_sys_args
+from backend.common.lazyInit import LazyInitializer
+from backend.dbPoolManager import get_pool_manager
 
 
 class Database:
     def __init__(self):
-        config = self.load_config()
-        self.engine = create_engine(
-            "postgresql+psycopg2://{}:{}@{}/{}".format(
-                config['db_user'], config['db_password'], config['db_host'], config['db_name']),
-            pool_size=int(config['max_conn']),
-            max_overflow=int(config['min_conn'])
-        )
+        # Connections come from the shared pool of dbPoolManager, limited by its max_conn
+        self.engine = get_pool_manager().create_engine("dynamic")
         self.session = sessionmaker(bind=self.engine)
 
     @staticmethod
@@ -51,5 +50,18 @@ class Database:
         self.engine.dispose()
 
 
-# Create a global Database instance
-db = Database()
+# The global Database instance, created on first use
+_db = LazyInitializer(Database)
+
+
+def get_db():
+    """Get the global Database instance, creating it on first use."""
+    return _db.get()
+
+
+def __getattr__(name):
+    # Keeps 'dbDyanmicColumnsConnPool.db' working without connecting at import
+    if name == "db":
+        return get_db()
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
@@ -3,51 +3,135 @@ dbMongoConnection.py
 ==============
 Author: Stanley Parmar
 Description: DB Connection pool for Mongo Connection.
+
+One MongoClient per config name is shared by the whole process; MongoClient is thread-safe and keeps its own
+connection pool ('max_pool_size' / 'min_pool_size' in the _mongodb config). A MongoDBConnection is only a cheap
+handle over it. The clients are fork-aware (see lazyInit.py): a forked child opens its own.
 See the examples directory to learn about the usage.
 """
 
 # dbMongoConnection.py
 
+# Import the default Libraries
+import threading
 
 # Import the custom defined Libraries and functions
 from pymongo import MongoClient
-from backend.common.commonUtility import open_read_file_box, get_sys_args
+from backend.common.commonUtility import open_read_file_box, get_sys_args, logger
+from backend.common.lazyInit import LazyInitializer
+
+# Defaults when the _mongodb config does not define them
+DEFAULT_MAX_POOL_SIZE = 100
+DEFAULT_MIN_POOL_SIZE = 0
+
+# config name -> LazyInitializer of its (client, db_config)
+_mongo_clients = {}
+_mongo_clients_lock = threading.Lock()
+
+
+"""
+Function Name: create_mongo_client
+Inputs: config_name (str): Name of the box config, <config_name>_mongodb is read.
+Output: (client, db_config)
+"""
+
+
+def create_mongo_client(config_name):
+    # Reading the config file and getting the needed variables to open the connection pool
+    db_config = open_read_file_box(config_name + '_mongodb')
+    client = MongoClient(
+        db_config['mongo_uri'],
+        maxPoolSize=int(db_config.get('max_pool_size', DEFAULT_MAX_POOL_SIZE)),
+        minPoolSize=int(db_config.get('min_pool_size', DEFAULT_MIN_POOL_SIZE))
+    )
+    logger.info("made mongo client for {}".format(config_name))
+    return client, db_config
+
+
+"""
+Function Name: get_mongo_client
+Inputs: config_name (str, optional): Defaults to the config name of the running app.
+Output: (client, db_config): The shared client of the config, created on first use.
+"""
+
+
+def get_mongo_client(config_name=None):
+    config_name = config_name or get_sys_args()
+    initializer = _mongo_clients.get(config_name)
+    if initializer is None:
+        with _mongo_clients_lock:
+            initializer = _mongo_clients.get(config_name)
+            if initializer is None:
+                initializer = LazyInitializer(lambda: create_mongo_client(config_name),
+                                              name="mongo_client_" + config_name)
+                _mongo_clients[config_name] = initializer
+    return initializer.get()
+
+
+"""
+Function Name: close_mongo_clients
+Inputs: None
+Output: None
+
+Description:
+Closes the shared clients of this process, call it at shutdown. The next use opens new ones.
+"""
+
+
+def close_mongo_clients():
+    with _mongo_clients_lock:
+        initializers = list(_mongo_clients.values())
+    for initializer in initializers:
+        value = initializer.reset()
+        if value is not None:
+            value[0].close()
+
 
 """
     Class Name: MongoDBConnection
     Functions: __init__
-        Inputs: None
+        Inputs: config_name (optional)
         Output: None
     Functions: get_database
         Inputs: self
-        Output: db-- Getting the Mongo Database connection
+        Output: db-- Getting the Mongo Database of the shared client
     Functions: get_mongo_collection
         Inputs: self
         Output: collection-- Getting the Mongo Database collection
+    Functions: get_index_specs
+        Inputs: self
+        Output: dict-- collection name -> index specs, the "indexes" of the _mongodb config
     Functions: close
         Inputs: self
-        Output: close-- Closing the Mongo Database connection             
+        Output: None-- The shared client stays open, see close_mongo_clients
 """
 
 
 class MongoDBConnection:
     # Self initializing for the whole session
-    def __init__(self):
+    def __init__(self, config_name=None):
         # Get the system arguments to fetch project related Mongo connections only
-        filename = get_sys_args()
-        # Reading the config file and getting the needed variables to open the connection pool
-        db_config = open_read_file_box(filename + '_mongodb')
+        self.config_name = config_name or get_sys_args()
         # Set the self which will be used for the whole session
         self.collection = None
-        # Set the Mongo client URI
-        self.client = MongoClient(db_config['mongo_uri'])
-        # Set the Mongo Database Name
-        self.db = self.client[db_config['database_name']]
+
+    @property
+    def client(self):
+        return get_mongo_client(self.config_name)[0]
+
+    @property
+    def db_config(self):
+        return get_mongo_client(self.config_name)[1]
+
+    @property
+    def db(self):
+        return self.get_database()
 
     # Getting the Mongo Database connection
     def get_database(self):
+        client, db_config = get_mongo_client(self.config_name)
         # Return the DB info in here
-        return self.db
+        return client[db_config['database_name']]
 
     # Getting the Mongo Database collection
     def get_mongo_collection(self, collection_name):
@@ -64,7 +148,11 @@ class MongoDBConnection:
         self.collection = db.list_collection_names()
         return self.collection
 
+    # Declared indexes per collection, created by mongoTableEntityOperation.ensure_indexes
+    def get_index_specs(self):
+        return self.db_config.get('indexes', {})
+
     # Closing the Mongo Database connection
     def close(self):
-        # Close the Client
-        self.client.close()
+        # The client is shared by the process, nothing to close per handle
+        self.collection = None
@@ -0,0 +1,302 @@
+"""
+dbPoolManager
+==============
+
+Author: Stanley Parmar
+
+Description: The one Postgres connection pool of the process. dbConnectionPool (psycopg2), dbConnectionEngine
+             (SQLAlchemy) and dbDyanmicColumnsConnPool (SQLAlchemy sessions) all check their connections out
+             of it, so the process never holds more than max_conn backends. 'async_max_conn' of those are
+             reserved for the asyncpg pools of dbAsyncConnectionPool and taken out of this pool's size
+             (see get_connection_budget).
+
+             The SQLAlchemy engines use NullPool with a creator taking a connection from this pool; closing
+             the SQLAlchemy connection hands it back here instead of disconnecting.
+
+             A checkout waits (first come, first served) for a free connection up to 'pool_checkout_timeout'
+             seconds instead of failing at max_conn, and every connection is checked before it is handed out.
+
+See the examples directory to learn about the usage.
+
+"""
+import threading
+import time
+from collections import deque
+
+import psycopg2.extensions
+import psycopg2.pool
+from backend.common.commonUtility import open_read_file_box, get_sys_args, logger
+from backend.common.dbCallLog import TimedCursor, record_pool_wait, helper_statement
+from backend.common.lazyInit import LazyInitializer
+from backend.common.statementCache import forget_prepared_statements
+
+# Defaults when the postgres config does not define them
+DEFAULT_CHECKOUT_TIMEOUT = 30.0
+# Connections idle for longer are pinged before they are handed out
+DEFAULT_PING_AFTER_SECONDS = 30.0
+
+
+class PoolTimeoutError(psycopg2.pool.PoolError):
+    """No connection became free within the checkout timeout."""
+
+
+class FairSemaphore:
+    """Counting semaphore whose waiters get the permits in arrival order."""
+
+    def __init__(self, value):
+        self._lock = threading.Lock()
+        self._value = value
+        self._waiters = deque()
+
+    def acquire(self, timeout=None):
+        with self._lock:
+            if self._value > 0 and not self._waiters:
+                self._value -= 1
+                return True
+            waiter = threading.Lock()
+            waiter.acquire()
+            self._waiters.append(waiter)
+
+        if waiter.acquire(timeout=-1 if timeout is None else timeout):
+            return True
+
+        with self._lock:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                # release() handed the permit over right as the wait timed out
+                return True
+        return False
+
+    def release(self):
+        with self._lock:
+            if self._waiters:
+                # Hand the permit straight to the oldest waiter
+                self._waiters.popleft().release()
+            else:
+                self._value += 1
+
+    def waiting(self):
+        with self._lock:
+            return len(self._waiters)
+
+
+class ManagedConnection(psycopg2.extensions.connection):
+    """psycopg2 connection that goes back to the pool on close() while a SQLAlchemy engine holds it."""
+    release_on_close = None
+    # time.monotonic() of the last return to the pool, None while checked out
+    returned_at = None
+
+    def close(self):
+        release = self.release_on_close
+        if release is not None:
+            self.release_on_close = None
+            release(self)
+        else:
+            super().close()
+
+
+class PostgresPoolManager:
+    """
+    Owns the ThreadedConnectionPool and the checkout metrics of the process.
+    source names the access path of a checkout: "pool", "engine" or "dynamic".
+    """
+
+    def __init__(self, config_name, db_config):
+        self.config_name = config_name
+        self.db_config = db_config
+        self.max_conn, self.async_max_conn = get_connection_budget(db_config)
+        self.min_conn = min(int(db_config['min_conn']), self.max_conn)
+        self.pool = psycopg2.pool.ThreadedConnectionPool(
+            minconn=self.min_conn,
+            maxconn=self.max_conn,
+            user=db_config["db_user"],
+            password=db_config["db_password"],
+            host=db_config["db_host"],
+            port=db_config["db_port"],
+            database=db_config["db_name"],
+            cursor_factory=TimedCursor,
+            connection_factory=ManagedConnection
+        )
+        self.checkout_timeout = float(db_config.get('pool_checkout_timeout', DEFAULT_CHECKOUT_TIMEOUT))
+        self.ping_after_seconds = float(db_config.get('pool_ping_after_seconds', DEFAULT_PING_AFTER_SECONDS))
+        # One permit per connection the pool may open
+        self._permits = FairSemaphore(self.max_conn)
+        self._stats_lock = threading.Lock()
+        self._checkouts = {}
+        self._exhausted = 0
+        self._rejected = 0
+        self._rollbacks = 0
+        self._reconnects = 0
+        self._returned_dirty = 0
+        self._wait_count = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+
+    def get_connection(self, source="pool"):
+        """Check a connection out of the pool, waiting up to checkout_timeout seconds for a free one."""
+        start = time.perf_counter()
+        if not self._permits.acquire(timeout=self.checkout_timeout):
+            with self._stats_lock:
+                self._rejected += 1
+            raise PoolTimeoutError("no connection free after {} seconds".format(self.checkout_timeout))
+
+        try:
+            conn = self.check_connection(self.pool.getconn())
+        except psycopg2.pool.PoolError:
+            self._permits.release()
+            with self._stats_lock:
+                self._exhausted += 1
+            raise
+        except Exception:
+            self._permits.release()
+            raise
+        wait_ms = (time.perf_counter() - start) * 1000
+
+        with self._stats_lock:
+            self._checkouts[source] = self._checkouts.get(source, 0) + 1
+            self._wait_count += 1
+            self._wait_total_ms += wait_ms
+            self._wait_max_ms = max(self._wait_max_ms, wait_ms)
+        record_pool_wait(wait_ms)
+        return conn
+
+    def check_connection(self, conn):
+        """
+        Roll back a transaction left open or aborted by the previous user, and replace a connection
+        whose socket is dead. Connections idle for longer than ping_after_seconds are pinged first.
+        """
+        returned_at, conn.returned_at = conn.returned_at, None
+        try:
+            if not conn.closed:
+                status = conn.info.transaction_status
+                if status in (psycopg2.extensions.TRANSACTION_STATUS_INTRANS,
+                              psycopg2.extensions.TRANSACTION_STATUS_INERROR):
+                    conn.rollback()
+                    with self._stats_lock:
+                        self._rollbacks += 1
+                    status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    if returned_at is None or time.monotonic() - returned_at < self.ping_after_seconds:
+                        return conn
+                    with conn.cursor() as cur, helper_statement():
+                        cur.execute("SELECT 1")
+                    conn.rollback()
+                    return conn
+        except psycopg2.Error:
+            pass
+
+        # Dead or unusable, close it and open a new one in its place (the permit stays held)
+        self.pool.putconn(conn, close=True)
+        forget_prepared_statements(conn)
+        with self._stats_lock:
+            self._reconnects += 1
+        return self.pool.getconn()
+
+    def release_connection(self, conn):
+        """Return a connection to the pool."""
+        if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            # Returned in the middle of a transaction: a code path that neither committed nor rolled back
+            with self._stats_lock:
+                self._returned_dirty += 1
+        conn.returned_at = time.monotonic()
+        self.pool.putconn(conn)
+        self._permits.release()
+
+    def create_engine(self, source="engine"):
+        """SQLAlchemy engine whose connections come from this pool."""
+        from sqlalchemy import create_engine
+        from sqlalchemy.pool import NullPool
+
+        def creator():
+            conn = self.get_connection(source)
+            conn.release_on_close = self.release_connection
+            return conn
+
+        return create_engine("postgresql+psycopg2://", creator=creator, poolclass=NullPool)
+
+    def close_all(self):
+        """Close every connection, also those held by SQLAlchemy engines."""
+        with self.pool._lock:
+            for conn in self.pool._used.values():
+                conn.release_on_close = None
+        self.pool.closeall()
+
+    def get_stats(self):
+        """Gauges and counters of the pool."""
+        with self.pool._lock:
+            in_use = len(self.pool._used)
+            idle = len(self.pool._pool)
+        with self._stats_lock:
+            return {
+                "min_conn": self.min_conn,
+                "max_conn": self.max_conn,
+                "async_max_conn": self.async_max_conn,
+                "in_use": in_use,
+                "idle": idle,
+                # Connections above min_conn, closed again when they come back
+                "overflow": max(0, in_use + idle - self.min_conn),
+                "checkouts": dict(self._checkouts),
+                "exhausted": self._exhausted,
+                "rejected": self._rejected,
+                "waiting": self._permits.waiting(),
+                "rollbacks_on_checkout": self._rollbacks,
+                "reconnects": self._reconnects,
+                "returned_dirty": self._returned_dirty,
+                "checkout_wait_ms": {
+                    "count": self._wait_count,
+                    "total": round(self._wait_total_ms, 3),
+                    "max": round(self._wait_max_ms, 3),
+                    "avg": round(self._wait_total_ms / self._wait_count, 3) if self._wait_count else 0.0,
+                },
+            }
+
+
+def get_connection_budget(db_config):
+    """
+    Split the config's max_conn into (connections of the psycopg2 pool, connections reserved for the asyncpg
+    pools). 'async_max_conn' defaults to 0, it must leave at least one connection to the psycopg2 pool.
+    """
+    max_conn = int(db_config['max_conn'])
+    async_max_conn = int(db_config.get('async_max_conn', 0))
+    if not 0 <= async_max_conn < max_conn:
+        raise ValueError("async_max_conn must be between 0 and max_conn - 1, got {}".format(async_max_conn))
+    return max_conn - async_max_conn, async_max_conn
+
+
+def create_pool_manager():
+    """Read the Postgres config and open the pool."""
+    logger.info("in connection pool")
+    try:
+        filename = get_sys_args()
+        db_config = open_read_file_box(filename + '_postgres')
+        manager = PostgresPoolManager(filename, db_config)
+    except Exception as e:
+        logger.info("entered in exception")
+        logger.error(e)
+        raise
+
+    logger.info("made connection pool")
+    return manager
+
+
+_pool_manager = LazyInitializer(create_pool_manager)
+
+
+def get_pool_manager():
+    """Get the pool manager, opening the pool on first use."""
+    return _pool_manager.get()
+
+
+def get_pool_stats():
+    """Stats of the pool, None while it is not open."""
+    if not _pool_manager.is_initialized():
+        return None
+    return _pool_manager.get().get_stats()
+
+
+def close_pool_manager():
+    """Close all connections of the pool."""
+    manager = _pool_manager.reset()
+    if manager is not None:
+        manager.close_all()
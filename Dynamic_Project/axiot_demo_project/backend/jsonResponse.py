@@ -1,23 +1,217 @@
-from flask import jsonify
-from backend.common.commonUtility import get_sys_args, open_read_file_box
+import json
+import math
+import threading
+import time
+import uuid
+from datetime import date, datetime
+from datetime import time as datetime_time
+from decimal import Decimal
+from flask import Response
+from werkzeug.http import http_date
+from backend.common.commonUtility import get_sys_args, open_read_file, open_read_file_box, logger
+from backend.common.dbCallLog import is_db_call_logging_enabled
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Keys of the response envelope; extra_data overriding one of them is encoded without the cached envelope
+ENVELOPE_KEYS = ("code", "message", "hasError")
+ENVELOPE_LAST_KEY = max(ENVELOPE_KEYS)
+# Wire format, by default the one of Flask's jsonify: general config 'json_datetime_format' "http" (RFC 822
+# dates, default) or "iso" (ISO 8601), and 'json_sort_keys' (default true). Both serializers write NaN and
+# Infinity as null. Changing either setting changes the responses every API consumer parses.
+JSON_DATETIME_FORMATS = ("http", "iso")
+DEFAULT_JSON_DATETIME_FORMAT = "http"
+# Formats of create_stream_response, and the marker ending a stream that failed part way
+STREAM_FORMATS = ("ndjson", "json")
+STREAM_ERROR_MESSAGE = "Failed to stream records"
+UNKNOWN_ERROR = {
+    "code": 9999,
+    "message": "Unknown error",
+    "hasError": True
+}
+
+
+_json_options = None
+
+
+def get_json_options():
+    """Wire format settings of the general config, read once."""
+    global _json_options
+    if _json_options is None:
+        config = open_read_file('resources', '', 'general') or {}
+        datetime_format = config.get('json_datetime_format', DEFAULT_JSON_DATETIME_FORMAT)
+        if datetime_format not in JSON_DATETIME_FORMATS:
+            raise ValueError("Unsupported json_datetime_format: {}".format(datetime_format))
+        sort_keys = bool(config.get('json_sort_keys', True))
+
+        orjson_option = 0
+        if orjson is not None:
+            orjson_option = orjson.OPT_NON_STR_KEYS
+            if sort_keys:
+                orjson_option |= orjson.OPT_SORT_KEYS
+            if datetime_format == "http":
+                # Hand datetime and date to json_default instead of writing ISO 8601
+                orjson_option |= orjson.OPT_PASSTHROUGH_DATETIME
+        _json_options = {"datetime_format": datetime_format, "sort_keys": sort_keys, "orjson_option": orjson_option}
+    return _json_options
+
+
+def json_default(value):
+    """Values the JSON encoders do not know: HTTP or ISO dates, exact Decimals, and str() for the rest."""
+    if isinstance(value, (datetime, date)):
+        if get_json_options()["datetime_format"] == "http":
+            return http_date(value)
+        return value.isoformat()
+    if isinstance(value, datetime_time):
+        return value.isoformat()
+    if isinstance(value, (Decimal, uuid.UUID)):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    return str(value)
+
+
+def replace_non_finite(value):
+    """The value with NaN and Infinity floats replaced by None, as orjson writes them."""
+    if isinstance(value, float):
+        return value if math.isfinite(value) else None
+    if isinstance(value, dict):
+        return {key: replace_non_finite(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return [replace_non_finite(item) for item in value]
+    return value
+
+
+def stdlib_dumps(obj):
+    sort_keys = get_json_options()["sort_keys"]
+    try:
+        return json.dumps(obj, default=json_default, separators=(",", ":"), ensure_ascii=False, sort_keys=sort_keys,
+                          allow_nan=False).encode("utf-8")
+    except ValueError as e:
+        if not str(e).startswith("Out of range float"):
+            raise
+    # Only documents holding NaN or Infinity pay for the copy
+    return json.dumps(replace_non_finite(obj), default=json_default, separators=(",", ":"), ensure_ascii=False,
+                      sort_keys=sort_keys, allow_nan=False).encode("utf-8")
+
+
+def orjson_dumps(obj):
+    # time and UUID are encoded natively, in the same format as json_default; see get_json_options for datetime
+    return orjson.dumps(obj, default=json_default, option=get_json_options()["orjson_option"])
+
+
+# Serializer of the responses: obj -> UTF-8 bytes
+_json_dumps = orjson_dumps if orjson is not None else stdlib_dumps
+
+
+def set_json_serializer(dumps=None):
+    """
+    Plug in the serializer of the responses, a function returning UTF-8 bytes.
+    None restores the default: orjson when installed, the stdlib json module otherwise.
+    """
+    global _json_dumps
+    if dumps is None:
+        dumps = orjson_dumps if orjson is not None else stdlib_dumps
+    _json_dumps = dumps
+
+
+def json_dumps(obj):
+    return _json_dumps(obj)
+
+
+# Time spent encoding responses, kept apart from the query time of the db_call log lines
+_encode_lock = threading.Lock()
+_encode_stats = {
+    "count": 0,
+    "bytes": 0,
+    "total_ms": 0.0,
+    "max_ms": 0.0,
+}
+
+
+def record_encode(response_code_name, encode_ms, size):
+    """Count one encoded response, and log it next to the db_call lines when those are enabled."""
+    with _encode_lock:
+        _encode_stats["count"] += 1
+        _encode_stats["bytes"] += size
+        _encode_stats["total_ms"] += encode_ms
+        _encode_stats["max_ms"] = max(_encode_stats["max_ms"], encode_ms)
+
+    if is_db_call_logging_enabled():
+        encode = {"response_code": response_code_name, "bytes": size, "encode_ms": round(encode_ms, 3)}
+        logger.info("encode_response code=%s bytes=%s encode_ms=%s", encode["response_code"], encode["bytes"],
+                    encode["encode_ms"], extra={"encode": encode})
+
+
+def get_encode_stats():
+    """Encoded responses, their total size and encode time, and the serializer in use."""
+    with _encode_lock:
+        stats = dict(_encode_stats)
+    stats["total_ms"] = round(stats["total_ms"], 3)
+    stats["max_ms"] = round(stats["max_ms"], 3)
+    stats["avg_ms"] = round(stats["total_ms"] / stats["count"], 3) if stats["count"] else 0.0
+    stats["serializer"] = getattr(_json_dumps, "__name__", repr(_json_dumps))
+    return stats
+
+
+def can_splice(extra_data):
+    """
+    Whether extra_data can follow the cached envelope: it overrides no envelope key and, with sorted keys,
+    all its keys sort after the envelope's.
+    """
+    if any(key in extra_data for key in ENVELOPE_KEYS):
+        return False
+    if get_json_options()["sort_keys"]:
+        return all(isinstance(key, str) and key > ENVELOPE_LAST_KEY for key in extra_data)
+    return True
+
+
+def json_response(body):
+    return Response(body, mimetype="application/json")
+
+
+def close_with_response(response, records):
+    """
+    Close the streamed records when the server closes the response. WSGI servers close it also when the client
+    disconnects or the body was never iterated, where the finally of a generator would not run.
+    """
+    close = getattr(records, "close", None)
+    if close is not None:
+        response.call_on_close(close)
+    return response
 
 
 class ResponseCode:
     _cache = {}
+    _load_lock = threading.Lock()
 
     @classmethod
     def _load_codes(cls):
-        if not cls._cache:
-            filename = get_sys_args()
-            file = open_read_file_box(filename + '_response')
-            cls._cache = file
-            for key, value in cls._cache.items():
-                setattr(cls, key, cls(key, value['code'], value['message']))
+        if cls._cache:
+            return
+        with cls._load_lock:
+            if not cls._cache:
+                filename = get_sys_args()
+                file = open_read_file_box(filename + '_response')
+                for key, value in file.items():
+                    setattr(cls, key, cls(key, value['code'], value['message']))
+                cls._cache = file
+
+    @classmethod
+    def get_code(cls, response_code_name):
+        """The ResponseCode of the name, loading the codes on first use."""
+        cls._load_codes()
+        return getattr(cls, response_code_name, None)
 
     def __init__(self, name, code, message):
         self._name = name
         self._code = code
         self._message = message
+        # (serializer, encoded envelope), the envelope never changes for a code
+        self._encoded = None
 
     @property
     def code(self):
@@ -27,30 +221,108 @@ class ResponseCode:
     def message(self):
         return self._message
 
+    def envelope(self, message=None):
+        return {
+            "code": self._code,
+            "message": message or self._message,
+            "hasError": self._code >= 2000
+        }
+
+    def encoded_envelope(self):
+        """The envelope of the code encoded once per serializer."""
+        encoded = self._encoded
+        if encoded is None or encoded[0] is not _json_dumps:
+            encoded = (_json_dumps, _json_dumps(self.envelope()))
+            self._encoded = encoded
+        return encoded[1]
+
+    def encode(self, extra_data=None, extra_message=None):
+        """The response body: the cached envelope with the encoded extra_data spliced in."""
+        if extra_message or (extra_data and not can_splice(extra_data)):
+            response = self.envelope(extra_message)
+            if extra_data:
+                response.update(extra_data)
+            return json_dumps(response)
+
+        body = self.encoded_envelope()
+        if extra_data:
+            # '{"code":...,"hasError":false' + ',' + '"result":[...]}'
+            body = body[:-1] + b"," + json_dumps(extra_data)[1:]
+        return body
+
     @classmethod
     def create_response(cls, response_code_name, extra_data=None, extra_message=None):
-        response_code = getattr(cls, response_code_name, None)
+        response_code = cls.get_code(response_code_name)
         if response_code is None:
-            return jsonify({
-                "code": 9999,
-                "message": "Unknown error",
-                "hasError": True
-            }), 400
-
-        # If extra_message is provided, use it to customize the message
-        message = response_code.message
-        if extra_message:
-            message = extra_message
-
-        response = {
-            "code": response_code.code,
-            "message": message,
-            "hasError": response_code.code >= 2000
-        }
-        if extra_data:
-            response.update(extra_data)
-        return jsonify(response), 200
+            return json_response(json_dumps(UNKNOWN_ERROR)), 400
+
+        start = time.perf_counter()
+        body = response_code.encode(extra_data, extra_message)
+        record_encode(response_code_name, (time.perf_counter() - start) * 1000, len(body))
+        return json_response(body), 200
+
+    @classmethod
+    def create_bad_request(cls, message):
+        """400 response for a request the backend cannot serve, e.g. an unsupported stream format."""
+        return json_response(json_dumps({"code": UNKNOWN_ERROR["code"], "message": message, "hasError": True})), 400
+
+    @classmethod
+    def create_stream_response(cls, response_code_name, records, stream_format="ndjson", extra_data=None):
+        """
+        Streams records (any iterable, usually a server-side cursor generator) as a chunked response
+        so the worker never holds the full result set.
+        "ndjson" writes one JSON document per line, "json" writes the usual response envelope with
+        the records streamed into its "result" array.
+        The status is already sent when a record fails, so the body ends with a "stream_error" marker
+        instead (an extra line in ndjson, a key after "result" in json) and stays valid JSON.
+        Only the encoding is timed, not the time spent fetching the records.
+        The records are closed with the response, also when the client goes away or the body is never read.
+        """
+        if stream_format not in STREAM_FORMATS:
+            return cls.create_bad_request("Unsupported stream_format: {}".format(stream_format))
+
+        if stream_format == "ndjson":
+            def generate():
+                encode_ms, size = 0.0, 0
+                try:
+                    for record in records:
+                        start = time.perf_counter()
+                        line = json_dumps(record) + b"\n"
+                        encode_ms += (time.perf_counter() - start) * 1000
+                        size += len(line)
+                        yield line
+                except Exception:
+                    logger.exception("Failed to stream records")
+                    yield json_dumps({"stream_error": STREAM_ERROR_MESSAGE}) + b"\n"
+                record_encode(response_code_name, encode_ms, size)
+
+            return close_with_response(Response(generate(), mimetype="application/x-ndjson"), records), 200
+
+        response_code = cls.get_code(response_code_name)
+        if response_code is None:
+            return json_response(json_dumps(UNKNOWN_ERROR)), 400
+
+        extra_data = {key: value for key, value in (extra_data or {}).items() if key != "result"}
+        envelope = response_code.encode(extra_data)
 
+        def generate():
+            # Open the envelope and the result array, then stream the records into it
+            encode_ms, size = 0.0, len(envelope) + 12
+            yield envelope[:-1] + b',"result":['
+            separator = b""
+            try:
+                for record in records:
+                    start = time.perf_counter()
+                    chunk = separator + json_dumps(record)
+                    encode_ms += (time.perf_counter() - start) * 1000
+                    size += len(chunk)
+                    yield chunk
+                    separator = b","
+            except Exception:
+                logger.exception("Failed to stream records")
+                yield b'],"stream_error":' + json_dumps(STREAM_ERROR_MESSAGE) + b"}"
+            else:
+                yield b"]}"
+            record_encode(response_code_name, encode_ms, size)
 
-# Load response codes at class definition time
-ResponseCode._load_codes()
\ No newline at end of file
+        return close_with_response(Response(generate(), mimetype="application/json"), records), 200
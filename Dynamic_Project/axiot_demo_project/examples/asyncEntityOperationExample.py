@@ -0,0 +1,50 @@
+"""
+asyncEntityOperationExample
+==============
+
+Author: Stanley Parmar
+
+Description: Usage of the asyncio data access layer (asyncEntityOperation on the asyncpg pool of
+             dbAsyncConnectionPool). Creates a record, then runs several searches at once on the same loop.
+
+Run from the project root: python examples/asyncEntityOperationExample.py <config_name> <table_name>
+The table needs a text column "name", its other columns must have defaults.
+The postgres config must reserve connections for the async pool with "async_max_conn" (see dbPoolManager).
+
+"""
+import asyncio
+import json
+import sys
+
+from backend.appInit import init_app
+from backend.common import asyncEntityOperation
+from backend.dbAsyncConnectionPool import close_pool
+
+
+async def run_example(table_name):
+    try:
+        # Insert one record, the payload is a JSON string like for entityOperation.create_record
+        created = await asyncEntityOperation.create_record(json.dumps({"name": "async example"}), table_name,
+                                                           is_json=True)
+        print("created:", created)
+
+        # The searches wait on the database concurrently, each on its own pooled connection
+        results = await asyncio.gather(
+            asyncEntityOperation.fetch_record(table_name, {"name": "async example"}),
+            asyncEntityOperation.fetch_record_search(table_name, search_value="async"),
+            asyncEntityOperation.fetch_record_search(table_name, column_filters={"name": "async example"}),
+        )
+        for result in results:
+            print("fetched:", result)
+    finally:
+        # The pool belongs to this event loop, close it before asyncio.run ends the loop
+        await close_pool()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python examples/asyncEntityOperationExample.py <config_name> <table_name>")
+        sys.exit(1)
+
+    init_app(sys.argv[1])
+    asyncio.run(run_example(sys.argv[2]))
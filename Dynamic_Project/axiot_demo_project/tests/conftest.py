@@ -0,0 +1,15 @@
+"""
+conftest.py
+==============
+Description: Puts the project root and the backend directory on sys.path, the modules import each other
+             both as backend.common.x and as top-level modules (dbMongoConnection, dbPoolManager, ...).
+             Run from the project root: python -m pytest tests
+"""
+import os
+import sys
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (PROJECT_ROOT, os.path.join(PROJECT_ROOT, "backend")):
+    if path not in sys.path:
+        sys.path.insert(0, path)
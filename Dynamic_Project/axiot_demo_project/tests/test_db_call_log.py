@@ -0,0 +1,55 @@
+"""
+test_db_call_log.py
+==============
+Description: A streamed db call is logged exactly once, whether its stream is read to the end, abandoned part way,
+             closed before the first record or dropped without ever being read.
+"""
+import gc
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from backend.common import dbCallLog
+
+
+@pytest.fixture
+def logged_calls(monkeypatch):
+    calls = []
+    monkeypatch.setattr(dbCallLog, "_db_call_logging", True)
+    monkeypatch.setattr(dbCallLog, "write_db_call_log", calls.append)
+    return calls
+
+
+@dbCallLog.log_db_call("search")
+def stream_records(table_name):
+    return dbCallLog.stream_db_call(iter([{"id": 1}, {"id": 2}, {"id": 3}]))
+
+
+def test_stream_read_to_the_end_is_logged_once(logged_calls):
+    assert len(list(stream_records("device"))) == 3
+
+    assert [(call["table"], call["rows"]) for call in logged_calls] == [("device", 3)]
+
+
+def test_abandoned_stream_is_logged_on_close(logged_calls):
+    records = stream_records("device")
+    next(records)
+    records.close()
+    records.close()
+
+    assert [call["rows"] for call in logged_calls] == [1]
+
+
+def test_stream_closed_before_the_first_record_is_logged(logged_calls):
+    stream_records("device").close()
+
+    assert [call["rows"] for call in logged_calls] == [0]
+
+
+def test_stream_dropped_without_being_read_is_logged(logged_calls):
+    records = stream_records("device")
+    del records
+    gc.collect()
+
+    assert [call["rows"] for call in logged_calls] == [0]
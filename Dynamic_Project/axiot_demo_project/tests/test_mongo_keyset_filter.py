@@ -0,0 +1,64 @@
+"""
+test_mongo_keyset_filter.py
+==============
+Description: Keyset filters of mongoTableEntityOperation.fetch_record_page when the last document of a page
+             has a missing or null sort field. MongoDB sorts null first, {"$gt": None} and {"$lt": value}
+             never match null, so these bounds need their own conditions.
+"""
+import pytest
+
+pytest.importorskip("pymongo")
+
+from backend.common.mongoTableEntityOperation import build_keyset_filter, get_field_value
+
+
+def test_ascending_after_null_continues_with_non_null_values():
+    sort_list = [("name", 1), ("_id", 1)]
+
+    assert build_keyset_filter(sort_list, [None, 7]) == {"$or": [
+        {"name": {"$ne": None}},
+        {"name": None, "_id": {"$gt": 7}},
+    ]}
+
+
+def test_descending_after_null_only_continues_on_the_tie_breaker():
+    sort_list = [("name", -1), ("_id", -1)]
+
+    assert build_keyset_filter(sort_list, [None, 7]) == {"name": None, "_id": {"$lt": 7}}
+
+
+def test_descending_after_value_includes_null_values():
+    sort_list = [("name", -1), ("_id", -1)]
+
+    assert build_keyset_filter(sort_list, ["b", 7]) == {"$or": [
+        {"$or": [{"name": {"$lt": "b"}}, {"name": None}]},
+        {"name": "b", "_id": {"$lt": 7}},
+    ]}
+
+
+def test_ascending_after_value_is_unchanged():
+    sort_list = [("name", 1), ("_id", 1)]
+
+    assert build_keyset_filter(sort_list, ["b", 7]) == {"$or": [
+        {"name": {"$gt": "b"}},
+        {"name": "b", "_id": {"$gt": 7}},
+    ]}
+
+
+def test_descending_after_null_without_tie_breaker_matches_nothing():
+    assert build_keyset_filter([("name", -1)], [None]) == {"_id": {"$in": []}}
+
+
+def test_missing_sort_field_reads_as_null():
+    sort_list = [("profile.name", 1), ("_id", 1)]
+    document = {"_id": 7, "profile": {}}
+
+    after = [get_field_value(document, name) for name, _ in sort_list]
+
+    assert after == [None, 7]
+    assert build_keyset_filter(sort_list, after)["$or"][0] == {"profile.name": {"$ne": None}}
+
+
+def test_after_needs_one_value_per_sort_field():
+    with pytest.raises(ValueError):
+        build_keyset_filter([("name", 1), ("_id", 1)], [None])